@@ -0,0 +1,258 @@
+import json
+import math
+import statistics
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from gpusitter.events import read_events
+
+
+@dataclass
+class JobTimeline:
+    """What happened to one job, the times are seconds since the first event of the log."""
+
+    job_id: int
+    cmd: str = ""
+    submitted: float | None = None
+    # The seconds spent queued, including the backoff before retries, and spent placed on GPUs, over all attempts
+    wait: float = 0.0
+    run: float = 0.0
+    attempts: int = 0
+    assigned: list[int] = field(default_factory=list)
+    # blocked, queued, running, succeeded, failed, cancelled, discarded or skipped
+    state: str = "queued"
+    ended: float | None = None
+
+    # When the current wait or run began, and when the backoff before the current retry ends
+    _since: float | None = field(default=None, repr=False)
+    _ready_at: float = field(default=0.0, repr=False)
+
+
+@dataclass
+class GPUTimeline:
+    """How one GPU was used, the times are seconds since the first event of the log."""
+
+    index: int
+    # The seconds the GPU ran jobs of ours
+    busy: float = 0.0
+    # The seconds the GPU was free while jobs were queued, and these spells as (start, end)
+    idle: float = 0.0
+    spells: list[tuple[float, float]] = field(default_factory=list)
+
+    _jobs: int = field(default=0, repr=False)
+    _busy_since: float | None = field(default=None, repr=False)
+    _idle_since: float | None = field(default=None, repr=False)
+
+
+@dataclass
+class Analysis:
+    """The timelines of the jobs and the GPUs of an event log."""
+
+    start: float
+    span: float
+    jobs: list[JobTimeline]
+    gpus: list[GPUTimeline]
+
+    @property
+    def waits(self) -> list[float]:
+        """The total waits of the jobs which were placed at least once."""
+        return [job.wait for job in self.jobs if job.attempts]
+
+    @property
+    def idle_fraction(self) -> float:
+        """The fraction of the GPU time in which GPUs were free while jobs were queued."""
+        total = self.span * len(self.gpus)
+        return sum(gpu.idle for gpu in self.gpus) / total if total else 0.0
+
+
+def analyze(events: Iterable[dict[str, Any]]) -> Analysis:
+    """Rebuild the timelines of the jobs and the GPUs from the events of an `EventLog`.
+
+    A GPU is idle from a poll which reports it free while jobs are queued until a job is placed on it, a later poll
+    reports it busy or nothing is queued anymore, failed jobs backing off before their retry do not count as queued.
+    Jobs and spells which are still open are cut off at the last event.
+    """
+    jobs: dict[int, JobTimeline] = {}
+    gpus: dict[int, GPUTimeline] = {}
+    start = last = None
+
+    def job_of(event: dict[str, Any]) -> JobTimeline:
+        return jobs.setdefault(event["id"], JobTimeline(event["id"]))
+
+    def gpu_of(index: int) -> GPUTimeline:
+        return gpus.setdefault(index, GPUTimeline(index))
+
+    def end_idle(gpu: GPUTimeline, t: float) -> None:
+        # A GPU which is placed on by the pass which found it free was never idle
+        if gpu._idle_since is not None and t > gpu._idle_since:
+            gpu.idle += t - gpu._idle_since
+            gpu.spells.append((gpu._idle_since, t))
+        gpu._idle_since = None
+
+    def occupy(assigned: list[int], t: float) -> None:
+        for index in assigned:
+            gpu = gpu_of(index)
+            end_idle(gpu, t)
+            if gpu._jobs == 0:
+                gpu._busy_since = t
+            gpu._jobs += 1
+
+    def vacate(job: JobTimeline, t: float) -> None:
+        if job.state != "running":
+            return
+        job.run += t - job._since
+        for index in job.assigned:
+            gpu = gpu_of(index)
+            gpu._jobs -= 1
+            if gpu._jobs == 0 and gpu._busy_since is not None:
+                gpu.busy += t - gpu._busy_since
+                gpu._busy_since = None
+
+    for event in events:
+        if start is None:
+            start = event["t"]
+        t = last = event["t"] - start
+        kind = event["event"]
+
+        if kind == "poll":
+            free = set(event["free"])
+            backing_off = sum(job.state == "queued" and job._ready_at > t for job in jobs.values())
+            waiting = event["pending"] > backing_off
+            for index in free:
+                gpu = gpu_of(index)
+                if waiting and gpu._idle_since is None:
+                    gpu._idle_since = t
+            for gpu in gpus.values():
+                if gpu.index not in free or not waiting:
+                    end_idle(gpu, t)
+        elif kind in ("submit", "retry"):
+            job = job_of(event)
+            job.cmd = event.get("cmd", job.cmd)
+            if job.submitted is None:
+                job.submitted = t
+            vacate(job, t)
+            job.state, job._since = "queued", t
+            job._ready_at = t + event.get("delay", 0.0)
+            if kind == "submit" and event.get("after"):
+                # Waiting for the jobs it depends on is not waiting for GPUs
+                job.state, job._since = "blocked", None
+        elif kind == "released":
+            job = job_of(event)
+            job.state, job._since = "queued", t
+        elif kind in ("placed", "attach"):
+            job = job_of(event)
+            job.cmd = event.get("cmd", job.cmd)
+            if job.state == "queued" and job._since is not None:
+                job.wait += t - job._since
+            job.attempts += 1
+            job.assigned = list(event["assigned"])
+            job.state, job._since = "running", t
+            occupy(job.assigned, t)
+        elif kind in ("exited", "start_failed", "cancelled", "discarded", "skipped"):
+            job = job_of(event)
+            vacate(job, t)
+            if job.state == "queued" and job._since is not None:
+                job.wait += t - job._since
+            if kind == "exited":
+                job.state = "succeeded" if event["returncode"] == 0 else "failed"
+            else:
+                job.state = {"start_failed": "failed"}.get(kind, kind)
+            job.ended, job._since = t, None
+
+    if start is None:
+        return Analysis(0.0, 0.0, [], [])
+
+    # Cut off what is still going on at the end of the log
+    for job in jobs.values():
+        if job.state == "running":
+            job.run += last - job._since
+            for index in job.assigned:
+                gpu = gpus[index]
+                if gpu._busy_since is not None:
+                    gpu.busy += last - gpu._busy_since
+                    gpu._busy_since = None
+        elif job.state == "queued" and job._since is not None:
+            job.wait += last - job._since
+    for gpu in gpus.values():
+        end_idle(gpu, last)
+
+    return Analysis(
+        start, last, sorted(jobs.values(), key=lambda job: job.job_id), sorted(gpus.values(), key=lambda g: g.index)
+    )
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Get the nearest-rank percentile of the values, 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def format_duration(seconds: float) -> str:
+    """Format seconds compactly, e.g. `45s`, `12.5m` or `3.2h`."""
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds / 3600:.1f}h"
+
+
+def format_analysis(analysis: Analysis) -> str:
+    """Format the timelines as a table of jobs, a table of GPUs and a summary."""
+    lines = [f"{'ID':>6}  {'STATE':<9} {'TRIES':>5} {'SUBMIT':>7} {'WAIT':>7} {'RUN':>7}  {'ASSIGNED':<8}  CMD"]
+    for job in analysis.jobs:
+        submitted = f"+{format_duration(job.submitted)}" if job.submitted is not None else "-"
+        assigned = ",".join(map(str, job.assigned)) or "-"
+        lines.append(
+            f"{job.job_id:>6}  {job.state:<9} {job.attempts:>5} {submitted:>7} {format_duration(job.wait):>7} "
+            f"{format_duration(job.run):>7}  {assigned:<8}  {job.cmd}"
+        )
+
+    lines.append("")
+    lines.append(f"{'GPU':>6}  {'BUSY':>7} {'IDLE':>7} {'SPELLS':>6}  LONGEST IDLE")
+    for gpu in analysis.gpus:
+        longest = max(gpu.spells, key=lambda spell: spell[1] - spell[0], default=None)
+        longest_str = (
+            f"{format_duration(longest[1] - longest[0])} from +{format_duration(longest[0])}" if longest else "-"
+        )
+        lines.append(
+            f"{gpu.index:>6}  {format_duration(gpu.busy):>7} {format_duration(gpu.idle):>7} {len(gpu.spells):>6}  "
+            f"{longest_str}"
+        )
+
+    waits = analysis.waits
+    lines.append("")
+    lines.append(
+        f"{len(analysis.jobs)} jobs over {format_duration(analysis.span)}, "
+        f"mean wait {format_duration(statistics.fmean(waits)) if waits else '-'}, "
+        f"p99 wait {format_duration(percentile(waits, 0.99)) if waits else '-'}, "
+        f"GPUs idle while jobs waited {analysis.idle_fraction:.1%}"
+    )
+    return "\n".join(lines)
+
+
+def run_analysis(path: str | Path, as_json: bool = False) -> None:
+    """Analyse an event log and print the timelines, as JSON if asked to."""
+    analysis = analyze(read_events(path))
+    if as_json:
+        print(
+            json.dumps(
+                {
+                    "start": analysis.start,
+                    "span": analysis.span,
+                    "idle_fraction": analysis.idle_fraction,
+                    "jobs": [_public(asdict(job)) for job in analysis.jobs],
+                    "gpus": [_public(asdict(gpu)) for gpu in analysis.gpus],
+                },
+                indent=2,
+            )
+        )
+    else:
+        print(format_analysis(analysis))
+
+
+def _public(fields: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in fields.items() if not key.startswith("_")}
@@ -0,0 +1,351 @@
+import contextlib
+import functools
+import itertools
+import json
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import pynvml
+
+from gpusitter.scheduler import Clock
+from gpusitter.topology import NVLINK
+
+
+@functools.lru_cache(maxsize=1024)
+def process_owner(pid: int) -> str:
+    """Get the user name owning a process, `unknown` if it cannot be looked up, e.g. from inside a container."""
+    import psutil
+
+    try:
+        return psutil.Process(pid).username()
+    except (psutil.Error, KeyError):
+        return "unknown"
+
+
+def read_device(index: int, handle: Any) -> dict[str, Any]:
+    """Read the information of a single device.
+
+    Args:
+        index (int): The GPU index.
+        handle (Any): The NVML device handle.
+
+    Returns:
+        dict[str, Any]: The GPU information of the device. The memory is always present, the utilization, compute
+        mode and compute processes only if the device supports querying them.
+    """
+    mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+    gpu_info = {
+        "index": index,
+        "memory.free": mem.free // (1024**2),  # bytes -> MiB
+        "memory.total": mem.total // (1024**2),  # bytes -> MiB
+    }
+
+    with contextlib.suppress(pynvml.NVMLError):
+        gpu_info["utilization.gpu"] = pynvml.nvmlDeviceGetUtilizationRates(handle).gpu
+    with contextlib.suppress(pynvml.NVMLError):
+        gpu_info["compute_mode"] = pynvml.nvmlDeviceGetComputeMode(handle)
+    with contextlib.suppress(pynvml.NVMLError):
+        gpu_info["processes"] = [
+            {
+                "pid": proc.pid,
+                "used_memory": (proc.usedGpuMemory or 0) // (1024**2),  # bytes -> MiB
+                "user": process_owner(proc.pid),
+            }
+            for proc in pynvml.nvmlDeviceGetComputeRunningProcesses(handle)
+        ]
+
+    return gpu_info
+
+
+class GPUBackend(ABC):
+    """A source of GPU telemetry for the GPU manager."""
+
+    # Bumped whenever `topology` may read differently, e.g. once another host joined a cluster
+    topology_version = 0
+
+    @abstractmethod
+    def query(self) -> list[dict[str, int]] | None:
+        """Query GPU information.
+
+        Returns:
+            list[dict[str, int]] | None: A list of dictionaries with the keys `index`, `memory.free` and
+            `memory.total` (MiB), optionally `utilization.gpu` (percent), `compute_mode` and `processes` (a list of
+            dictionaries with `pid`, `used_memory` and `user`), or None if there is no GPU.
+        """
+
+    def topology(self) -> list[list[int]] | None:
+        """Read the interconnect topology.
+
+        Returns:
+            list[list[int]] | None: The link cost between every pair of GPUs as defined in `gpusitter.topology`,
+            indexed by GPU index, or None if the backend does not know the topology.
+        """
+        return None
+
+    def host_of(self, index: int) -> int:
+        """Get the host of a GPU, no job spans hosts. All GPUs are on one host by default."""
+        return 0
+
+    def close(self) -> None:  # noqa: B027
+        """Release the resources held by the backend, a hook which does nothing by default."""
+
+
+class NVMLBackend(GPUBackend):
+    """Query the local GPUs through a long-lived NVML session which caches the device handles between polls."""
+
+    def __init__(self, persistent: bool = True) -> None:
+        """Initialize the NVML backend, NVML itself is initialized lazily on the first query.
+
+        Args:
+            persistent (bool): Keep NVML initialized between polls. If False, every poll initializes and shuts down
+                NVML like `gpu.query_gpu` does.
+        """
+        self.persistent = persistent
+        self._handles: list[Any] | None = None
+
+    @property
+    def active(self) -> bool:
+        """Whether NVML is initialized and the device handles are cached."""
+        return self._handles is not None
+
+    def open(self) -> None:
+        """Initialize NVML and cache the handles of all devices."""
+        pynvml.nvmlInit()
+        try:
+            device_count = pynvml.nvmlDeviceGetCount()
+            self._handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(device_count)]
+        except Exception:
+            with contextlib.suppress(Exception):
+                pynvml.nvmlShutdown()
+            raise
+
+    def close(self) -> None:
+        """Drop the cached handles and shut NVML down."""
+        if self._handles is None:
+            return
+
+        self._handles = None
+        with contextlib.suppress(Exception):
+            pynvml.nvmlShutdown()
+
+    def query(self) -> list[dict[str, int]] | None:
+        """Query GPU information with the cached device handles.
+
+        The session is re-initialized once when NVML errors out, e.g. after a driver reload or a GPU falling off the
+        bus, since the cached handles are stale in that case. If that fails too, the session stays closed and the next
+        query initializes NVML again.
+
+        Raises:
+            RuntimeError: If NVML still fails after re-initializing it.
+        """
+        try:
+            return self._query()
+        except pynvml.NVMLError:
+            self.close()
+
+        try:
+            return self._query()
+        except Exception as e:
+            self.close()
+            raise RuntimeError("Failed to query GPU using pynvml:") from e
+
+    def topology(self) -> list[list[int]] | None:
+        """Read the link between every pair of GPUs, NVLink if peer-to-peer over NVLink works, else the PCIe level."""
+        if self._handles is None:
+            self.open()
+
+        try:
+            handles = self._handles
+            costs = [[0] * len(handles) for _ in handles]
+            for a, b in itertools.combinations(range(len(handles)), 2):
+                nvlink = pynvml.nvmlDeviceGetP2PStatus(handles[a], handles[b], pynvml.NVML_P2P_CAPS_INDEX_NVLINK)
+                if nvlink == pynvml.NVML_P2P_STATUS_OK:
+                    cost = NVLINK
+                else:
+                    cost = pynvml.nvmlDeviceGetTopologyCommonAncestor(handles[a], handles[b])
+                costs[a][b] = costs[b][a] = cost
+        finally:
+            if not self.persistent:
+                self.close()
+        return costs if costs else None
+
+    def _query(self) -> list[dict[str, int]] | None:
+        if self._handles is None:
+            self.open()
+
+        try:
+            gpu_info = [read_device(i, handle) for i, handle in enumerate(self._handles)]
+        finally:
+            if not self.persistent:
+                self.close()
+        return gpu_info if gpu_info else None
+
+
+@dataclass
+class FakeJob:
+    """A fake job of the simulated backend."""
+
+    gpus: list[int]
+    memory: int
+    end: float | None
+    utilization: int
+    user: str
+    pid: int
+
+
+class SimulatedBackend(GPUBackend):
+    """Model N GPUs whose memory is consumed and released by fake jobs."""
+
+    def __init__(
+        self,
+        num_gpus: int = 8,
+        memory_total: int = 81920,
+        clock: Clock | None = None,
+        topology: list[list[int]] | None = None,
+    ) -> None:
+        """Initialize the simulated GPUs.
+
+        Args:
+            num_gpus (int): The number of GPUs.
+            memory_total (int): The memory of every GPU in MiB.
+            clock (Clock | None): The clock which drives the durations of the fake jobs.
+            topology (list[list[int]] | None): The synthetic link cost matrix of the GPUs, None for an unknown
+                topology.
+        """
+        self.num_gpus = num_gpus
+        self.memory_total = memory_total
+        self.clock = clock if clock is not None else Clock()
+        self.links = topology
+
+        self.jobs: dict[str, FakeJob] = {}
+        self._pids = itertools.count(1000)
+
+    def allocate(
+        self,
+        owner: str,
+        gpus: list[int],
+        memory: int,
+        duration: float | None = None,
+        utilization: int = 100,
+        user: str = "simulated",
+    ) -> None:
+        """Start a fake job which consumes memory on the given GPUs.
+
+        Args:
+            owner (str): The name of the fake job.
+            gpus (list[int]): The GPU indices the job runs on.
+            memory (int): The memory in MiB the job consumes on every GPU.
+            duration (float | None): The seconds until the job releases its memory, None to run until released.
+            utilization (int): The utilization in percent the job causes on every GPU.
+            user (str): The user owning the fake job.
+        """
+        end = self.clock.now() + duration if duration is not None else None
+        self.jobs[owner] = FakeJob(list(gpus), memory, end, utilization, user, next(self._pids))
+
+    def release(self, owner: str) -> None:
+        """Stop a fake job and release its memory."""
+        self.jobs.pop(owner, None)
+
+    def topology(self) -> list[list[int]] | None:
+        """Get the synthetic topology."""
+        return self.links
+
+    def query(self) -> list[dict[str, Any]] | None:
+        """Query the simulated GPUs after expiring the fake jobs which are due."""
+        now = self.clock.now()
+        for owner in [owner for owner, job in self.jobs.items() if job.end is not None and job.end <= now]:
+            del self.jobs[owner]
+
+        gpu_info = [
+            {
+                "index": i,
+                "memory.free": self.memory_total,
+                "memory.total": self.memory_total,
+                "utilization.gpu": 0,
+                "compute_mode": pynvml.NVML_COMPUTEMODE_DEFAULT,
+                "processes": [],
+            }
+            for i in range(self.num_gpus)
+        ]
+        for job in self.jobs.values():
+            for i in job.gpus:
+                gpu = gpu_info[i]
+                gpu["memory.free"] = max(gpu["memory.free"] - job.memory, 0)
+                gpu["utilization.gpu"] = min(gpu["utilization.gpu"] + job.utilization, 100)
+                gpu["processes"].append({"pid": job.pid, "used_memory": job.memory, "user": job.user})
+        return gpu_info if gpu_info else None
+
+
+class ReplayBackend(GPUBackend):
+    """Play back a JSONL trace recorded by `TraceRecorder`."""
+
+    def __init__(self, path: str | Path, clock: Clock | None = None) -> None:
+        """Load the trace.
+
+        Args:
+            path (str | Path): The path of the JSONL trace.
+            clock (Clock | None): Replay the trace with its recorded timing on this clock. If None, every query
+                returns the next recorded poll.
+        """
+        with open(path) as f:
+            self.frames = [json.loads(line) for line in f if line.strip()]
+        if not self.frames:
+            raise ValueError(f"Trace {path} contains no polls.")
+
+        self.clock = clock
+        self._start = clock.now() if clock is not None else None
+        self._position = 0
+
+    def query(self) -> list[dict[str, int]] | None:
+        """Get the recorded poll for the current replay position, the last poll is repeated at the end."""
+        if self.clock is None:
+            frame = self.frames[min(self._position, len(self.frames) - 1)]
+            self._position += 1
+            return frame["gpus"]
+
+        elapsed = self.clock.now() - self._start
+        first = self.frames[0]["time"]
+        while self._position + 1 < len(self.frames) and self.frames[self._position + 1]["time"] - first <= elapsed:
+            self._position += 1
+        return self.frames[self._position]["gpus"]
+
+
+class TraceRecorder(GPUBackend):
+    """Wrap a backend and append every poll to a JSONL trace."""
+
+    def __init__(self, backend: GPUBackend, path: str | Path) -> None:
+        """Initialize the recorder.
+
+        Args:
+            backend (GPUBackend): The backend to record.
+            path (str | Path): The path of the JSONL trace, new polls are appended.
+        """
+        self.backend = backend
+        self._file = open(path, "a", buffering=1)  # noqa: SIM115
+
+    def query(self) -> list[dict[str, int]] | None:
+        """Query the wrapped backend and record the result."""
+        gpus = self.backend.query()
+        self._file.write(json.dumps({"time": time.time(), "gpus": gpus}) + "\n")
+        return gpus
+
+    @property
+    def topology_version(self) -> int:  # type: ignore[override]
+        """The topology version of the wrapped backend."""
+        return self.backend.topology_version
+
+    def topology(self) -> list[list[int]] | None:
+        """Read the topology of the wrapped backend."""
+        return self.backend.topology()
+
+    def host_of(self, index: int) -> int:
+        """Get the host of a GPU from the wrapped backend."""
+        return self.backend.host_of(index)
+
+    def close(self) -> None:
+        """Close the trace and the wrapped backend."""
+        self._file.close()
+        self.backend.close()
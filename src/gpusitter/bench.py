@@ -0,0 +1,423 @@
+import getpass
+import heapq
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from gpusitter.analysis import percentile
+from gpusitter.backends import SimulatedBackend
+from gpusitter.emails import EmailNotifier
+from gpusitter.gpu import GPUManager
+from gpusitter.history import RuntimeHistory
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.ledger import GPULedger
+from gpusitter.logger import console
+from gpusitter.scheduler import ExponentialBackoff, SchedulerLoop, VirtualClock
+from gpusitter.sitter import GPUSitter
+from gpusitter.topology import CROSS_SOCKET, NVLINK
+from gpusitter.utils import NullStatus
+
+# The GPU counts of the default clusters, and the metrics compared against a baseline
+DEFAULT_CLUSTERS = (8, 64, 512)
+QUALITY_METRICS = ("makespan", "mean_wait", "p99_wait", "idle_fraction")
+# The GPU count of the simulated host of the headless startup benchmark
+STARTUP_GPUS = 8
+
+MEMORY_TOTAL = 81920
+
+
+@dataclass
+class WorkloadJob:
+    """A job of a synthetic workload with the seconds it runs once launched."""
+
+    job: Job
+    duration: float
+
+
+def make_workload(num_gpus: int, num_jobs: int, seed: int = 0) -> list[WorkloadJob]:
+    """Draw a mix of job sizes and durations, like a group sharing a cluster.
+
+    Most jobs take one GPU, some of them only a slice of its memory, and the rest 2, 4 or 8 GPUs. Durations range from
+    minutes for evaluations to a day for large trainings.
+    """
+    rng = random.Random(seed)  # noqa: S311
+    workload = []
+    for i in range(num_jobs):
+        gpus = min(rng.choices([1, 2, 4, 8], weights=[60, 20, 12, 8])[0], num_gpus)
+        memory = rng.choice([8192, 12288, 20480]) if gpus == 1 and rng.random() < 0.25 else None
+        kind = rng.choices(["eval", "train", "long"], weights=[50, 35, 15])[0]
+        duration = {"eval": rng.uniform(300, 1800), "train": rng.uniform(3600, 4 * 3600), "long": rng.uniform(8, 24)}[
+            kind
+        ]
+        if kind == "long":
+            duration *= 3600
+        job = Job(f"python {kind}.py --seed={i}", gpus, priority=rng.choice([0, 0, 0, 1]), required_memory=memory)
+        workload.append(WorkloadJob(job, duration))
+    return workload
+
+
+def island_topology(num_gpus: int, island: int = 8) -> list[list[int]]:
+    """Link the GPUs through NVLink within islands of `island` GPUs, and across sockets between the islands."""
+    return [
+        [0 if a == b else NVLINK if a // island == b // island else CROSS_SOCKET for b in range(num_gpus)]
+        for a in range(num_gpus)
+    ]
+
+
+class SimulationClock(VirtualClock):
+    """A virtual clock which jumps to the next simulated event instead of sleeping through the whole timeout."""
+
+    def __init__(self, next_event: Callable[[], float | None]) -> None:
+        """Initialize the clock at 0.
+
+        Args:
+            next_event (Callable[[], float | None]): Get the time of the next simulated event, e.g. a job exit.
+        """
+        super().__init__()
+        self.next_event = next_event
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        """Advance to the next simulated event, which wakes the sleeper up like a real job exit, or the timeout."""
+        if event.is_set():
+            return True
+
+        due = self.next_event()
+        if due is not None and due <= self.time + timeout:
+            self.time = max(self.time, due)
+            return True
+        self.advance(timeout)
+        return False
+
+
+class SimulatedLauncher(Launcher):
+    """Run the jobs of a workload on a simulated backend, each for its duration on the virtual clock."""
+
+    def __init__(self, backend: SimulatedBackend, clock: VirtualClock, durations: dict[int, float]) -> None:
+        """Initialize the launcher.
+
+        Args:
+            backend (SimulatedBackend): The backend the jobs allocate their memory on.
+            clock (VirtualClock): The clock the jobs run on.
+            durations (dict[int, float]): The seconds every job runs, by job id.
+        """
+        self.backend = backend
+        self.clock = clock
+        self.durations = durations
+
+        # The virtual time at which every job was launched, by job id
+        self.launched_at: dict[int, float] = {}
+        self.busy_seconds = 0.0
+        self.last_exit = 0.0
+
+        self._exits: list[tuple[float, int, Job, list[int]]] = []
+        self._events: list[LaunchEvent] = []
+        self._jobs_per_gpu: dict[int, int] = {}
+        self._busy_since: dict[int, float] = {}
+        self._user = getpass.getuser()
+
+    def next_exit(self) -> float | None:
+        """Get the virtual time of the next job exit."""
+        return self._exits[0][0] if self._exits else None
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Allocate the memory of the job and start it right away."""
+        self._start(job, gpus)
+        self._events.append(LaunchEvent(job, list(gpus), "started", latency=0.0))
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Run a job as if it was launched now, a simulation has no jobs from before a restart."""
+        self._start(job, gpus)
+
+    def poll(self) -> list[LaunchEvent]:
+        """Exit the jobs whose time is up and hand all events over."""
+        now = self.clock.now()
+        while self._exits and self._exits[0][0] <= now:
+            end, _, job, gpus = heapq.heappop(self._exits)
+            self._stop(job, gpus, end)
+            self._events.append(LaunchEvent(job, gpus, "exited", 0))
+
+        events, self._events = self._events, []
+        return events
+
+    def cancel(self, job_id: int) -> bool:
+        """Stop a running job right away."""
+        for position, (_, exit_id, job, gpus) in enumerate(self._exits):
+            if exit_id == job_id:
+                del self._exits[position]
+                heapq.heapify(self._exits)
+                self._stop(job, gpus, self.clock.now())
+                self._events.append(LaunchEvent(job, gpus, "cancelled"))
+                return True
+        return False
+
+    def _start(self, job: Job, gpus: list[int]) -> None:
+        now = self.clock.now()
+        memory = job.required_memory if job.required_memory is not None else int(MEMORY_TOTAL * 0.9)
+        self.backend.allocate(f"job{job.job_id}", gpus, memory, user=self._user)
+        self.launched_at[job.job_id] = now
+        heapq.heappush(self._exits, (now + self.durations[job.job_id], job.job_id, job, list(gpus)))
+        for index in gpus:
+            self._jobs_per_gpu[index] = self._jobs_per_gpu.get(index, 0) + 1
+            self._busy_since.setdefault(index, now)
+
+    def _stop(self, job: Job, gpus: list[int], end: float) -> None:
+        self.backend.release(f"job{job.job_id}")
+        self.last_exit = max(self.last_exit, end)
+        for index in gpus:
+            self._jobs_per_gpu[index] -= 1
+            if not self._jobs_per_gpu[index]:
+                self.busy_seconds += end - self._busy_since.pop(index)
+
+
+@dataclass
+class BenchResult:
+    """The scheduling quality and cost of one simulated cluster.
+
+    The times are in virtual seconds, except for the CPU times which are in real microseconds.
+    """
+
+    gpus: int
+    jobs: int
+    makespan: float
+    mean_wait: float
+    p99_wait: float
+    idle_fraction: float
+    decisions: int
+    decision_cpu_mean: float
+    decision_cpu_p99: float
+    pass_cpu_mean: float
+    # The mean relative error of the predicted runtimes, None without a runtime history
+    prediction_error: float | None = None
+
+
+def run_cluster(
+    num_gpus: int, jobs_per_gpu: int = 4, seed: int = 0, topology: bool = False, history: bool = False
+) -> BenchResult:
+    """Schedule a synthetic workload on a simulated cluster on a virtual clock.
+
+    All jobs are submitted at time 0, so the wait of a job is its launch time.
+
+    Args:
+        num_gpus (int): The number of GPUs of the cluster.
+        jobs_per_gpu (int): The number of jobs of the workload per GPU.
+        seed (int): The seed of the workload.
+        topology (bool): Give the cluster NVLink islands of 8 GPUs, so multi-GPU jobs are placed by topology.
+        history (bool): Learn the runtimes as the jobs finish and backfill by the predicted runtimes, the history
+            starts empty.
+    """
+    workload = make_workload(num_gpus, num_gpus * jobs_per_gpu, seed)
+    launcher: SimulatedLauncher | None = None
+    clock = SimulationClock(lambda: launcher.next_exit())  # noqa: PLW0108
+    backend = SimulatedBackend(
+        num_gpus=num_gpus,
+        memory_total=MEMORY_TOTAL,
+        clock=clock,
+        topology=island_topology(num_gpus) if topology else None,
+    )
+    launcher = SimulatedLauncher(backend, clock, {item.job.job_id: item.duration for item in workload})
+
+    ledger = GPULedger()
+    gpu_manager = GPUManager(backend=backend, ledger=ledger, clock=clock)
+    jobs = JobQueue()
+    loop = SchedulerLoop(jobs, policy=ExponentialBackoff(1.0, 30.0), clock=clock)
+    runtimes = RuntimeHistory() if history else None
+    # Time every scheduling decision in CPU time, a simulation sends no emails
+    decision_cpu: list[float] = []
+    sitter = GPUSitter(
+        gpu_manager, ledger, loop, launcher, EmailNotifier(), history=runtimes, on_decision=decision_cpu.append
+    )
+
+    for item in workload:
+        sitter.submit(item.job)
+
+    quiet, console.quiet = console.quiet, True
+    start = time.process_time()
+    try:
+        sitter.run(NullStatus())
+    finally:
+        console.quiet = quiet
+    cpu = time.process_time() - start
+    sitter.close()
+
+    waits = list(launcher.launched_at.values())
+    makespan = launcher.last_exit
+    passes = max(gpu_manager.poll_stats.count, 1)
+    return BenchResult(
+        gpus=num_gpus,
+        jobs=len(workload),
+        makespan=makespan,
+        mean_wait=statistics.fmean(waits) if waits else 0.0,
+        p99_wait=percentile(waits, 0.99),
+        idle_fraction=1 - launcher.busy_seconds / (num_gpus * makespan) if makespan else 0.0,
+        decisions=len(decision_cpu),
+        decision_cpu_mean=statistics.fmean(decision_cpu) * 1e6 if decision_cpu else 0.0,
+        decision_cpu_p99=percentile(decision_cpu, 0.99) * 1e6,
+        pass_cpu_mean=cpu / passes * 1e6,
+        prediction_error=sitter.metrics.runtime_prediction_error.mean if history else None,
+    )
+
+
+def compare(results: list[BenchResult], baseline: list[dict[str, float]], tolerance: float = 0.02) -> list[str]:
+    """Compare the scheduling quality against a baseline of earlier results.
+
+    Only the quality metrics are compared, they are deterministic for a seed while the CPU times depend on the machine.
+
+    Returns:
+        list[str]: The regressions, metrics which are worse than the baseline by more than the tolerance.
+    """
+    by_gpus = {entry["gpus"]: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        entry = by_gpus.get(result.gpus)
+        if entry is None:
+            continue
+        for metric in QUALITY_METRICS:
+            value, reference = getattr(result, metric), entry[metric]
+            if value > reference * (1 + tolerance) + 1e-9:
+                regressions.append(f"{result.gpus} GPUs: {metric} {value:.4g} > baseline {reference:.4g}")
+    return regressions
+
+
+def format_results(results: list[BenchResult]) -> str:
+    """Format the results as a table."""
+    header = (
+        f"{'GPUS':>5} {'JOBS':>5} {'MAKESPAN':>9} {'MEAN WAIT':>10} {'P99 WAIT':>9} {'IDLE':>6} "
+        f"{'DECISIONS':>9} {'CPU/DECISION':>13} {'P99':>9} {'CPU/PASS':>9} {'PRED ERR':>9}"
+    )
+    lines = [header]
+    lines.extend(
+        f"{r.gpus:>5} {r.jobs:>5} {r.makespan / 3600:>8.1f}h {r.mean_wait / 3600:>9.2f}h "
+        f"{r.p99_wait / 3600:>8.2f}h {r.idle_fraction:>6.1%} {r.decisions:>9} {r.decision_cpu_mean:>11.0f}us "
+        f"{r.decision_cpu_p99:>7.0f}us {r.pass_cpu_mean:>7.0f}us "
+        f"{f'{r.prediction_error:.1%}' if r.prediction_error is not None else '-':>9}"
+        for r in results
+    )
+    return "\n".join(lines)
+
+
+def run_benchmarks(
+    clusters: list[int],
+    jobs_per_gpu: int = 4,
+    seed: int = 0,
+    topology: bool = False,
+    save: str | None = None,
+    baseline: str | None = None,
+    tolerance: float = 0.02,
+    history: bool = False,
+) -> None:
+    """Benchmark the scheduler on the clusters, print the results and fail on regressions against a baseline."""
+    results = [run_cluster(num_gpus, jobs_per_gpu, seed, topology, history) for num_gpus in clusters]
+    print(format_results(results))
+
+    if save:
+        Path(save).write_text(json.dumps([asdict(result) for result in results], indent=2) + "\n")
+    if baseline:
+        regressions = compare(results, json.loads(Path(baseline).read_text()), tolerance)
+        for regression in regressions:
+            console.print(f"[red]Regression: {regression}[/red]")
+        if regressions:
+            sys.exit(1)
+
+
+@dataclass
+class StartupResult:
+    """The wall-clock seconds of the cold starts of one command, every one in a fresh interpreter."""
+
+    name: str
+    runs: int
+    min: float
+    median: float
+    max: float
+
+
+def startup_commands(workdir: Path) -> dict[str, list[str]]:
+    """Get the commands whose cold start is timed, by name.
+
+    `import` loads the entry point only, `headless` runs a trivial job on a simulated host from start to exit without a
+    config file, the way a batch system would start the scheduler.
+    """
+    return {
+        "import": [sys.executable, "-c", "import gpusitter.main"],
+        "headless": [
+            sys.executable,
+            "-m",
+            "gpusitter.main",
+            "--headless",
+            f"--config={workdir / 'missing.toml'}",
+            "--set=friendly_min=0",
+            f"--simulate={STARTUP_GPUS}",
+            "--launcher=process",
+            f"--log-dir={workdir / 'logs'}",
+            f"--runtime-history={workdir / 'runtimes.json'}",
+            "--no-claims",
+            "--job=true",
+        ],
+    }
+
+
+def time_startup(name: str, command: list[str], runs: int) -> StartupResult:
+    """Time the cold starts of a command.
+
+    Raises:
+        RuntimeError: If the command fails.
+    """
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, text=True, check=False)  # noqa: S603
+        durations.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            raise RuntimeError(f"{name} startup failed with {process.returncode}: {process.stderr.strip()}")
+    return StartupResult(name, runs, min(durations), statistics.median(durations), max(durations))
+
+
+def compare_startup(
+    results: list[StartupResult], baseline: list[dict[str, float]], tolerance: float = 0.25
+) -> list[str]:
+    """Compare the median cold starts against a baseline of earlier results of the same machine.
+
+    Returns:
+        list[str]: The regressions, startups which are slower than the baseline by more than the tolerance.
+    """
+    by_name = {entry["name"]: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        entry = by_name.get(result.name)
+        if entry is not None and result.median > entry["median"] * (1 + tolerance):
+            regressions.append(
+                f"{result.name}: median {result.median * 1000:.0f}ms > baseline {entry['median'] * 1000:.0f}ms"
+            )
+    return regressions
+
+
+def run_startup_benchmark(
+    runs: int = 5, save: str | None = None, baseline: str | None = None, tolerance: float = 0.25
+) -> None:
+    """Time the cold starts, print the results and fail on regressions against a baseline."""
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [time_startup(name, command, runs) for name, command in startup_commands(Path(workdir)).items()]
+
+    lines = [f"{'STARTUP':<9} {'RUNS':>4} {'MIN':>8} {'MEDIAN':>8} {'MAX':>8}"]
+    lines.extend(
+        f"{r.name:<9} {r.runs:>4} {r.min * 1000:>6.0f}ms {r.median * 1000:>6.0f}ms {r.max * 1000:>6.0f}ms"
+        for r in results
+    )
+    print("\n".join(lines))
+
+    if save:
+        Path(save).write_text(json.dumps([asdict(result) for result in results], indent=2) + "\n")
+    if baseline:
+        regressions = compare_startup(results, json.loads(Path(baseline).read_text()), tolerance)
+        for regression in regressions:
+            console.print(f"[red]Regression: {regression}[/red]")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,209 @@
+import contextlib
+import fcntl
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+
+def default_claims_dir() -> Path:
+    """Get the directory of the claims shared by all users of the host, in the tmpfs `/dev/shm` if there is one."""
+    # Shared on purpose, every instance of every user has to find the same lock files
+    shm = Path("/dev/shm")  # noqa: S108
+    return (shm if shm.is_dir() else Path(tempfile.gettempdir())) / "gpusitter-claims"
+
+
+def _alive(pid: int, start_time: str) -> bool:
+    """Whether a process is still running, and not a later process which reuses its pid."""
+    from gpusitter.launcher import process_start_time
+
+    return process_start_time(pid) == start_time
+
+
+class GPUClaims:
+    """Claim GPUs of this host for the jobs of one instance, so that concurrent instances never share a GPU.
+
+    Every GPU has a lock file in a directory shared by all users, and an instance claims a GPU with an exclusive
+    advisory `flock` on it. The kernel drops the lock as soon as the instance exits or crashes, and it is released
+    explicitly once the jobs of the instance on the GPU have exited. A claim is per instance: the memory-sized jobs of
+    one instance may still share a GPU.
+
+    The jobs outlive the instance though, e.g. in tmux, so once the process of a job is known its claim is also bound
+    to it with a lease, `gpu<index>.<pid>.lease` holding the start time of the process. A GPU with a lease of a live
+    process stays claimed after its instance is gone, until the job exits.
+
+    Checking whether other instances claim a GPU is a non-blocking shared lock and unlock of a file which stays
+    open, two system calls per GPU and poll, and a listing of the directory for the GPUs which are not locked.
+    """
+
+    def __init__(self, path: str | Path | None = None) -> None:
+        """Initialize the claims, the directory is created when the first GPU is looked at.
+
+        Args:
+            path (str | Path | None): The directory of the lock files, `default_claims_dir()` by default. All
+                instances of the host have to use the same one.
+        """
+        self.path = Path(path) if path is not None else default_claims_dir()
+
+        self._files: dict[int, int] = {}
+        # The jobs of this instance by GPU whose claim they use
+        self._holders: dict[int, set[int]] = {}
+        self._jobs: dict[int, list[int]] = {}
+        # The pids the claims of the jobs are bound to
+        self._pids: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def claimed_by_others(self, gpus: list[int]) -> set[int]:
+        """Get the GPUs among `gpus` which another instance, or a job which outlived its instance, claims."""
+        claimed = set()
+        unlocked = []
+        with self._lock:
+            for index in gpus:
+                if index in self._holders:
+                    continue
+                fd = self._file(index)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    claimed.add(index)
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    unlocked.append(index)
+            if unlocked:
+                claimed.update(self._leased(unlocked))
+        return claimed
+
+    def claim(self, job_id: int, gpus: list[int], pid: int | None = None) -> bool:
+        """Claim GPUs for a job atomically, either all of them or none.
+
+        Args:
+            job_id (int): The job.
+            gpus (list[int]): The GPUs of the job.
+            pid (int | None): The process of the job if it runs already, e.g. after a restart. Its leases are the
+                job's own and do not stand in the way, and the claim is bound to it.
+
+        Returns:
+            bool: Whether the GPUs were claimed, False if another instance got one of them first.
+        """
+        with self._lock:
+            taken = []
+            for index in gpus:
+                if index in self._holders:
+                    continue
+                try:
+                    fcntl.flock(self._file(index), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self._unlock(taken)
+                    return False
+                taken.append(index)
+                self._holders[index] = set()
+            # Jobs which outlived their instance hold the GPUs only by their leases
+            if taken and self._leased(taken, ignore=pid):
+                self._unlock(taken)
+                return False
+
+            for index in gpus:
+                self._holders[index].add(job_id)
+            self._jobs[job_id] = list(gpus)
+        if pid is not None:
+            self.bind(job_id, pid)
+        return True
+
+    def bind(self, job_id: int, pid: int) -> None:
+        """Bind the claim of a job to its process, so its GPUs stay claimed while it runs even without this instance.
+
+        Args:
+            job_id (int): A job with a claim.
+            pid (int): A process which runs exactly as long as the job.
+        """
+        from gpusitter.launcher import process_start_time
+
+        start_time = process_start_time(pid)
+        with self._lock:
+            gpus = self._jobs.get(job_id)
+            if gpus is None or start_time is None:
+                return
+            self._pids[job_id] = pid
+            for index in gpus:
+                with contextlib.suppress(OSError):
+                    self._lease(index, pid).write_text(f"{start_time}\n")
+
+    def unbound(self) -> list[int]:
+        """Get the jobs whose claims are not bound to their processes yet."""
+        with self._lock:
+            return [job_id for job_id in self._jobs if job_id not in self._pids]
+
+    def release(self, job_id: int) -> None:
+        """Release the claims of a job, the GPUs which no other job of this instance uses are up for grabs again."""
+        with self._lock:
+            pid = self._pids.pop(job_id, None)
+            for index in self._jobs.pop(job_id, []):
+                if pid is not None:
+                    self._lease(index, pid).unlink(missing_ok=True)
+                holders = self._holders.get(index)
+                if holders is None:
+                    continue
+                holders.discard(job_id)
+                if not holders:
+                    del self._holders[index]
+                    fcntl.flock(self._files[index], fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        """Release all claims, the leases of the jobs which are still running are kept until the jobs exit."""
+        with self._lock:
+            for fd in self._files.values():
+                os.close(fd)
+            self._files.clear()
+            self._holders.clear()
+            self._jobs.clear()
+            self._pids.clear()
+
+    def _unlock(self, gpus: list[int]) -> None:
+        """Undo a partial claim, the lock is held."""
+        for index in gpus:
+            fcntl.flock(self._files[index], fcntl.LOCK_UN)
+            del self._holders[index]
+
+    def _lease(self, index: int, pid: int) -> Path:
+        return self.path / f"gpu{index}.{pid}.lease"
+
+    def _leased(self, gpus: list[int], ignore: int | None = None) -> set[int]:
+        """Get the GPUs among `gpus` with a lease of a live process other than `ignore`, stale leases are removed."""
+        wanted = set(gpus)
+        leased = set()
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return leased
+        for name in names:
+            gpu, _, rest = name.partition(".")
+            pid, _, suffix = rest.partition(".")
+            if suffix != "lease" or not gpu.startswith("gpu") or not gpu[3:].isdigit() or not pid.isdigit():
+                continue
+            index = int(gpu[3:])
+            if index not in wanted or index in leased or int(pid) == ignore:
+                continue
+            try:
+                start_time = (self.path / name).read_text().strip()
+            except OSError:
+                continue
+            if _alive(int(pid), start_time):
+                leased.add(index)
+            else:
+                # Only the owner may remove it from the shared directory, the others skip it
+                with contextlib.suppress(OSError):
+                    (self.path / name).unlink()
+        return leased
+
+    def _file(self, index: int) -> int:
+        fd = self._files.get(index)
+        if fd is None:
+            if not self.path.is_dir():
+                self.path.mkdir(parents=True, exist_ok=True)
+                # Shared by all users like /tmp, nobody may remove the lock files of others
+                with contextlib.suppress(PermissionError):
+                    self.path.chmod(0o1777)
+            # A lock works on a read-only file, so the files of other users are fine
+            fd = os.open(self.path / f"gpu{index}.lock", os.O_RDONLY | os.O_CREAT | os.O_NOFOLLOW, 0o644)
+            self._files[index] = fd
+        return fd
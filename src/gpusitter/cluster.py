@@ -0,0 +1,691 @@
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import queue
+import secrets
+import socket
+import socketserver
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from gpusitter.backends import GPUBackend
+from gpusitter.jobs import Job
+from gpusitter.journal import job_from_record, job_to_record
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.logger import console
+from gpusitter.scheduler import ExponentialBackoff
+from gpusitter.topology import CROSS_HOST, CROSS_SOCKET
+
+DEFAULT_AGENT_PORT = 7464
+
+# The kinds of launch events after which a job is gone
+_FINAL_KINDS = ("failed", "exited", "cancelled", "error")
+
+
+def parse_address(address: str, default_port: int = DEFAULT_AGENT_PORT) -> tuple[str, int]:
+    """Split `host:port` into the host and the port, the port is optional.
+
+    Raises:
+        ValueError: If the port is not a number.
+    """
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    try:
+        return host or "127.0.0.1", int(port) if port else default_port
+    except ValueError:
+        raise ValueError(f"Invalid agent address: {address}") from None
+
+
+def load_token(path: str | None = None) -> str:
+    """Read the secret shared by the coordinator and the agents from a file, or from `GPUSITTER_TOKEN`.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If there is no token.
+    """
+    token = Path(path).read_text().strip() if path else os.environ.get("GPUSITTER_TOKEN", "")
+    if not token:
+        raise ValueError("No cluster token, set GPUSITTER_TOKEN or pass --token-file.")
+    return token
+
+
+def sign(token: str, nonce: str) -> str:
+    """Answer the challenge of an agent, which proves knowing the token without sending it."""
+    return hmac.new(token.encode(), nonce.encode(), hashlib.sha256).hexdigest()
+
+
+def _encode(messages: list[dict[str, Any]]) -> bytes:
+    return b"".join(json.dumps(message).encode() + b"\n" for message in messages)
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    """Talk to the coordinator over one connection, one JSON object per line in both directions."""
+
+    server: "AgentServer"
+
+    def setup(self) -> None:
+        """Set up the streams of the connection."""
+        super().setup()
+        self.send_lock = threading.Lock()
+
+    def handle(self) -> None:
+        """Authenticate the coordinator by a challenge, then run its commands until it disconnects."""
+        nonce = secrets.token_hex(16)
+        try:
+            self.send([{"type": "challenge", "nonce": nonce}])
+            hello = json.loads(self.rfile.readline() or "{}")
+        except OSError:
+            return
+        except ValueError:
+            hello = {}
+        if not self.server.authorized(hello, nonce):
+            self.send([{"type": "error", "error": "permission denied"}])
+            return
+
+        self.server.connected(self)
+        try:
+            while line := self.rfile.readline():
+                try:
+                    self.server.dispatch(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    console.log(f"[red]Ignoring a malformed command of the coordinator: {e}[/red]")
+        except OSError:
+            pass
+        finally:
+            self.server.disconnected(self)
+
+    def send(self, messages: list[dict[str, Any]]) -> None:
+        """Send messages to the coordinator.
+
+        Raises:
+            OSError: If the connection is broken.
+        """
+        with self.send_lock:
+            self.wfile.write(_encode(messages))
+
+    def close(self) -> None:
+        """Drop the connection, e.g. when another coordinator takes over."""
+        with contextlib.suppress(OSError):
+            self.request.shutdown(socket.SHUT_RDWR)
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    """Offer the GPUs of this host to a coordinator, which places jobs on them and launches them through the agent.
+
+    The agent polls its GPUs and sends the coordinator a full snapshot when it connects, then only the GPUs which
+    changed since the last poll. So a quiet host costs next to no traffic and the coordinator scales to many hosts. The
+    launch events of the jobs are forwarded as they happen, and kept while no coordinator is connected.
+
+    The token never goes over the wire: the agent opens every connection with a random challenge, which the coordinator
+    has to answer with its HMAC under the token. The connection itself is not encrypted.
+
+    Messages to the agent:
+        - `{"op": "hello", "mac": "..."}` authenticates the coordinator, it must be the first message.
+        - `{"op": "launch", "job": {...}, "gpus": [...]}` launches a job on local GPU indices.
+        - `{"op": "attach", "job": {...}, "gpus": [...]}` follows a job launched before, e.g. after a restart.
+        - `{"op": "cancel", "job_id": 1}` cancels a job.
+
+    Messages to the coordinator:
+        - `{"type": "challenge", "nonce": "..."}` first, the coordinator answers it with `sign(token, nonce)`.
+        - `{"type": "hello", "host": "...", "topology": [[...]]}` once authenticated.
+        - `{"type": "snapshot", "gpus": [...]}` and `{"type": "delta", "gpus": [...], "removed": [...]}`.
+        - `{"type": "event", "job_id": 1, "kind": "...", "returncode": 1, "latency": null, "output": "..."}`.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        backend: GPUBackend,
+        launcher: Launcher,
+        token: str,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_AGENT_PORT,
+        poll_interval: float = 1.0,
+        wake: threading.Event | None = None,
+    ) -> None:
+        """Bind the agent.
+
+        Args:
+            backend (GPUBackend): The GPUs of this host.
+            launcher (Launcher): The launcher running the jobs on this host.
+            token (str): The secret the coordinator has to prove knowing, since it runs commands on this host.
+            host (str): The address to listen on.
+            port (int): The port to listen on, 0 picks a free port.
+            poll_interval (float): The seconds between two polls of the GPUs.
+            wake (threading.Event | None): The event the launcher sets on new launch events, which are then forwarded
+                right away rather than with the next poll.
+
+        Raises:
+            ValueError: If the token is empty.
+        """
+        if not token:
+            raise ValueError("The agent needs a token, set GPUSITTER_TOKEN.")
+
+        self.backend = backend
+        self.launcher = launcher
+        self.token = token
+        self.poll_interval = poll_interval
+        self._wake = wake if wake is not None else threading.Event()
+        try:
+            self._topology = backend.topology()
+        except Exception as e:
+            console.log(f"[yellow]Failed to read the GPU topology: {e}[/yellow]")
+            self._topology = None
+
+        self._coordinator: AgentHandler | None = None
+        # The GPUs as the coordinator knows them by index, None until it got a full snapshot
+        self._sent: dict[int, dict[str, Any]] | None = None
+        # The event messages which are not delivered yet
+        self._events: list[dict[str, Any]] = []
+        # The jobs which are launched and not gone yet, by job id
+        self._jobs: dict[int, Job] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._workers: list[threading.Thread] = []
+
+        super().__init__((host, port), AgentHandler)
+
+    @property
+    def port(self) -> int:
+        """The port the agent listens on."""
+        return self.server_address[1]
+
+    def start(self) -> None:
+        """Serve the coordinator and poll the GPUs from background threads."""
+        self._workers = [
+            threading.Thread(target=self.serve_forever, name="gpusitter-agent", daemon=True),
+            threading.Thread(target=self._run, name="gpusitter-agent-poll", daemon=True),
+        ]
+        for thread in self._workers:
+            thread.start()
+
+    def authorized(self, hello: dict[str, Any], nonce: str) -> bool:
+        """Whether the first message of a connection answers the challenge with the token."""
+        mac = hello.get("mac") if isinstance(hello, dict) and hello.get("op") == "hello" else None
+        return isinstance(mac, str) and hmac.compare_digest(mac.encode(), sign(self.token, nonce).encode())
+
+    def connected(self, handler: AgentHandler) -> None:
+        """Make an authenticated connection the coordinator, dropping the previous one."""
+        with self._lock:
+            previous, self._coordinator = self._coordinator, handler
+            self._sent = None
+        if previous is not None:
+            previous.close()
+        handler.send([{"type": "hello", "host": socket.gethostname(), "topology": self._topology}])
+        self._wake.set()
+
+    def disconnected(self, handler: AgentHandler) -> None:
+        """Forget a connection which closed."""
+        with self._lock:
+            if self._coordinator is handler:
+                self._coordinator = None
+
+    def dispatch(self, message: dict[str, Any]) -> None:
+        """Run a command of the coordinator.
+
+        Raises:
+            ValueError: If the command is unknown.
+        """
+        op = message["op"]
+        if op in ("launch", "attach"):
+            job = job_from_record(message["job"])
+            with self._lock:
+                if job.job_id in self._jobs:
+                    # The coordinator re-attaches its jobs on every connect
+                    return
+                self._jobs[job.job_id] = job
+            if op == "launch":
+                self.launcher.launch(job, list(message["gpus"]))
+            else:
+                self.launcher.attach(job, list(message["gpus"]))
+        elif op == "cancel":
+            self.launcher.cancel(int(message["job_id"]))
+        else:
+            raise ValueError(f"Unknown command {op!r}")
+
+    def sync(self) -> None:
+        """Send the coordinator the changes of the GPUs and the new launch events."""
+        events = [
+            {
+                "type": "event",
+                "job_id": event.job.job_id,
+                "kind": event.kind,
+                "returncode": event.returncode,
+                "latency": event.latency,
+                "output": event.output,
+            }
+            for event in self.launcher.poll()
+        ]
+        gpus = self.backend.query() or []
+
+        with self._lock:
+            for event in events:
+                if event["kind"] in _FINAL_KINDS:
+                    self._jobs.pop(event["job_id"], None)
+            self._events.extend(events)
+            handler = self._coordinator
+            if handler is None:
+                return
+
+            messages = self._changes(gpus)
+            events, self._events = self._events, []
+
+        try:
+            handler.send(messages + events)
+        except OSError:
+            with self._lock:
+                self._events[:0] = events
+                self._sent = None
+
+    def close(self) -> None:
+        """Stop serving, the jobs keep running."""
+        self._closed.set()
+        self._wake.set()
+        if self._workers:
+            self.shutdown()
+            for thread in self._workers:
+                thread.join()
+        with self._lock:
+            handler = self._coordinator
+        if handler is not None:
+            handler.close()
+        self.server_close()
+
+    def _changes(self, gpus: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        current = {gpu["index"]: gpu for gpu in gpus}
+        sent, self._sent = self._sent, current
+        if sent is None:
+            return [{"type": "snapshot", "gpus": gpus}]
+
+        changed = [gpu for index, gpu in current.items() if sent.get(index) != gpu]
+        removed = [index for index in sent if index not in current]
+        return [{"type": "delta", "gpus": changed, "removed": removed}] if changed or removed else []
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception as e:
+                console.log(f"[red]Failed to poll the GPUs of the agent: {e}[/red]")
+
+
+class AgentLink:
+    """The connection of the coordinator to one agent, re-established with a backoff whenever it breaks."""
+
+    def __init__(
+        self,
+        address: str,
+        token: str,
+        offset: int,
+        max_gpus: int,
+        on_connect: Callable[["AgentLink"], None],
+        on_event: Callable[["AgentLink", dict[str, Any]], None],
+        connect_timeout: float = 5.0,
+    ) -> None:
+        """Initialize the link, it connects once started.
+
+        Args:
+            address (str): The `host:port` of the agent.
+            token (str): The secret of the agent.
+            offset (int): The first global GPU index of the host, its GPUs are numbered from there on.
+            max_gpus (int): The number of global GPU indices of the host, GPUs beyond are ignored.
+            on_connect (Callable[[AgentLink], None]): Called whenever the agent accepted the coordinator.
+            on_event (Callable[[AgentLink, dict[str, Any]], None]): Called with every launch event of the agent.
+            connect_timeout (float): The seconds to wait for the agent to accept a connection.
+
+        Raises:
+            ValueError: If the address is malformed.
+        """
+        self.address = address
+        self.host, self.port = parse_address(address)
+        self.token = token
+        self.offset = offset
+        self.max_gpus = max_gpus
+        self.on_connect = on_connect
+        self.on_event = on_event
+        self.connect_timeout = connect_timeout
+
+        # The host name reported by the agent
+        self.name = address
+        self.topology: list[list[int]] | None = None
+        # Set while the GPUs of the agent are known
+        self.ready = threading.Event()
+
+        self._gpus: dict[int, dict[str, Any]] = {}
+        self._sock: socket.socket | None = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Connect to the agent from a background thread."""
+        self._thread = threading.Thread(target=self._run, name=f"gpusitter-link-{self.address}", daemon=True)
+        self._thread.start()
+
+    def gpus(self) -> list[dict[str, Any]]:
+        """Get the GPUs of the agent with their global indices, none while disconnected."""
+        with self._lock:
+            return list(self._gpus.values())
+
+    def send(self, message: dict[str, Any]) -> bool:
+        """Send a command to the agent.
+
+        Returns:
+            bool: Whether it was sent, False while disconnected.
+        """
+        with self._lock:
+            sock = self._sock
+            if sock is None:
+                return False
+            try:
+                sock.sendall(_encode([message]))
+            except OSError:
+                return False
+        return True
+
+    def close(self) -> None:
+        """Disconnect from the agent for good."""
+        self._closed.set()
+        with self._lock:
+            sock = self._sock
+        if sock is not None:
+            with contextlib.suppress(OSError):
+                sock.shutdown(socket.SHUT_RDWR)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        backoff = ExponentialBackoff(base_interval=0.5, max_interval=30.0)
+        while not self._closed.is_set():
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+            except OSError:
+                self._closed.wait(backoff.next_interval(changed=False))
+                continue
+
+            try:
+                with sock:
+                    sock.settimeout(None)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    with self._lock:
+                        self._sock = sock
+                    with sock.makefile("rb") as f:
+                        for line in f:
+                            self._apply(json.loads(line))
+                            backoff.reset()
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                if not self._closed.is_set():
+                    console.log(f"[yellow]Lost the agent {self.address}: {e}[/yellow]")
+            finally:
+                with self._lock:
+                    self._sock = None
+                    self._gpus = {}
+                self.ready.clear()
+
+            self._closed.wait(backoff.next_interval(changed=False))
+
+    def _global(self, gpu: dict[str, Any]) -> dict[str, Any] | None:
+        if not 0 <= gpu["index"] < self.max_gpus:
+            return None
+        return {**gpu, "index": self.offset + gpu["index"], "host": self.name}
+
+    def _apply(self, message: dict[str, Any]) -> None:
+        kind = message["type"]
+        if kind == "challenge":
+            if not self.send({"op": "hello", "mac": sign(self.token, message["nonce"])}):
+                raise ConnectionError("the connection closed during the handshake")
+        elif kind == "hello":
+            self.name = message["host"]
+            self.topology = message.get("topology")
+            self.on_connect(self)
+        elif kind in ("snapshot", "delta"):
+            # The GPU dictionaries are replaced rather than updated, so a snapshot handed out stays as it was
+            with self._lock:
+                gpus = {} if kind == "snapshot" else dict(self._gpus)
+                for index in message.get("removed", []):
+                    gpus.pop(self.offset + index, None)
+                for gpu in message["gpus"]:
+                    gpu = self._global(gpu)  # noqa: PLW2901
+                    if gpu is not None:
+                        gpus[gpu["index"]] = gpu
+                self._gpus = gpus
+            self.ready.set()
+        elif kind == "event":
+            self.on_event(self, message)
+        elif kind == "error":
+            raise ConnectionError(message["error"])
+
+
+class ClusterBackend(GPUBackend):
+    """The GPUs of several hosts, as reported by their agents, numbered globally.
+
+    The GPUs of the n-th agent get the indices from `n * max_gpus_per_host` on, so the indices are stable no matter
+    which agents are connected. The GPUs of a disconnected agent are left out until it is back.
+    """
+
+    def __init__(
+        self, agents: list[str], token: str, max_gpus_per_host: int = 16, connect_timeout: float = 10.0
+    ) -> None:
+        """Connect to the agents and wait for their GPUs.
+
+        Args:
+            agents (list[str]): The `host:port` addresses of the agents.
+            token (str): The secret shared with the agents.
+            max_gpus_per_host (int): The number of global GPU indices of every host.
+            connect_timeout (float): The seconds to wait for the agents, the ones which are not up by then are
+                connected to in the background.
+
+        Raises:
+            ValueError: If there is no agent or an address is malformed.
+        """
+        if not agents:
+            raise ValueError("The coordinator needs at least one agent.")
+
+        self.max_gpus_per_host = max_gpus_per_host
+        # Bumped whenever an agent connects, since it may bring a topology with it
+        self.topology_version = 0
+        # Set by the `ClusterLauncher`
+        self.on_connect: Callable[[AgentLink], None] | None = None
+        self.on_event: Callable[[AgentLink, dict[str, Any]], None] | None = None
+
+        self.links = [
+            AgentLink(
+                address,
+                token,
+                offset=position * max_gpus_per_host,
+                max_gpus=max_gpus_per_host,
+                on_connect=self._connected,
+                on_event=self._received,
+            )
+            for position, address in enumerate(agents)
+        ]
+        for link in self.links:
+            link.start()
+
+        deadline = time.monotonic() + connect_timeout
+        for link in self.links:
+            if not link.ready.wait(max(deadline - time.monotonic(), 0.0)):
+                console.log(
+                    f"[yellow]The agent {link.address} is not reachable yet, retrying in the background.[/yellow]"
+                )
+
+    def query(self) -> list[dict[str, Any]] | None:
+        """Get the latest GPUs of all connected agents, which only costs a copy of their lists."""
+        gpus = [gpu for link in self.links for gpu in link.gpus()]
+        return gpus or None
+
+    def topology(self) -> list[list[int]] | None:
+        """Combine the topologies of the hosts, GPUs of different hosts are linked by `CROSS_HOST`.
+
+        The GPUs of a host whose topology is unknown count as linked across sockets.
+        """
+        size = len(self.links) * self.max_gpus_per_host
+        costs = [[CROSS_HOST] * size for _ in range(size)]
+        for link in self.links:
+            local = link.topology or []
+            for a in range(self.max_gpus_per_host):
+                row = costs[link.offset + a]
+                for b in range(self.max_gpus_per_host):
+                    known = a < len(local) and b < len(local[a])
+                    row[link.offset + b] = local[a][b] if known else (0 if a == b else CROSS_SOCKET)
+        return costs
+
+    def host_of(self, index: int) -> int:
+        """Get the position of the agent of a global GPU index."""
+        return index // self.max_gpus_per_host
+
+    def locate(self, gpus: list[int]) -> tuple[AgentLink, list[int]]:
+        """Find the agent of global GPU indices and their local indices.
+
+        Raises:
+            ValueError: If the GPUs are not all on one known host.
+        """
+        positions = {index // self.max_gpus_per_host for index in gpus}
+        if len(positions) != 1 or not 0 <= min(positions) < len(self.links):
+            raise ValueError(f"The GPUs {gpus} are not on one host of the cluster.")
+
+        link = self.links[positions.pop()]
+        return link, [index - link.offset for index in gpus]
+
+    def close(self) -> None:
+        """Disconnect from the agents."""
+        for link in self.links:
+            link.close()
+
+    def _connected(self, link: AgentLink) -> None:
+        console.log(f"[green]Connected to the agent {link.name} at {link.address}[/green]")
+        self.topology_version += 1
+        if self.on_connect is not None:
+            self.on_connect(link)
+
+    def _received(self, link: AgentLink, message: dict[str, Any]) -> None:
+        if self.on_event is not None:
+            self.on_event(link, message)
+
+
+@dataclass
+class _RemoteLaunch:
+    job: Job
+    gpus: list[int]
+    link: AgentLink
+    started: bool = False
+
+
+class ClusterLauncher(Launcher):
+    """Launch jobs through the agents of a `ClusterBackend` and relay their launch events.
+
+    The agents confirm the jobs with the grace period of their own launchers. Whenever an agent (re)connects, it is
+    told to attach to all jobs the coordinator believes run on it, which the agent ignores for jobs it still tracks.
+    """
+
+    def __init__(self, backend: ClusterBackend, on_event: Callable[[], None] | None = None) -> None:
+        """Initialize the launcher.
+
+        Args:
+            backend (ClusterBackend): The cluster whose agents run the jobs.
+            on_event (Callable[[], None] | None): Called whenever a launch event is ready, e.g. to wake the scheduler.
+        """
+        self.backend = backend
+        self.on_event = on_event
+
+        self._events: queue.Queue[LaunchEvent] = queue.Queue()
+        self._launches: dict[int, _RemoteLaunch] = {}
+        self._lock = threading.Lock()
+
+        backend.on_connect = self._reattach
+        backend.on_event = self._received
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Send the job to the agent of its GPUs."""
+        try:
+            link, local = self.backend.locate(gpus)
+        except ValueError as e:
+            console.log(f"[red]Failed to launch job {job}: {e}[/red]")
+            self._emit(LaunchEvent(job, gpus, "error", output=str(e)))
+            return
+
+        with self._lock:
+            self._launches[job.job_id] = _RemoteLaunch(job, list(gpus), link)
+        if not link.send({"op": "launch", "job": job_to_record(job), "gpus": local}):
+            with self._lock:
+                self._launches.pop(job.job_id, None)
+            message = f"the agent {link.address} is not connected"
+            console.log(f"[red]Failed to launch job {job}: {message}[/red]")
+            self._emit(LaunchEvent(job, gpus, "error", output=message))
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Follow a job launched before a restart, the agent is told once it is connected."""
+        try:
+            link, local = self.backend.locate(gpus)
+        except ValueError as e:
+            console.log(f"[red]Failed to attach to job {job}: {e}[/red]")
+            self._emit(LaunchEvent(job, gpus, "exited"))
+            return
+
+        with self._lock:
+            self._launches[job.job_id] = _RemoteLaunch(job, list(gpus), link, started=True)
+        link.send({"op": "attach", "job": job_to_record(job), "gpus": local})
+
+    def poll(self) -> list[LaunchEvent]:
+        """Get the launch events which happened since the last poll."""
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a job on its agent, it counts as cancelled right away even if the agent is unreachable."""
+        with self._lock:
+            launch = self._launches.pop(job_id, None)
+        if launch is None:
+            return False
+
+        launch.link.send({"op": "cancel", "job_id": job_id})
+        self._emit(LaunchEvent(launch.job, launch.gpus, "cancelled"))
+        return True
+
+    def _emit(self, event: LaunchEvent) -> None:
+        self._events.put(event)
+        if self.on_event is not None:
+            self.on_event()
+
+    def _reattach(self, link: AgentLink) -> None:
+        with self._lock:
+            launches = [launch for launch in self._launches.values() if launch.link is link]
+        for launch in launches:
+            _, local = self.backend.locate(launch.gpus)
+            link.send({"op": "attach", "job": job_to_record(launch.job), "gpus": local})
+
+    def _received(self, link: AgentLink, message: dict[str, Any]) -> None:
+        kind = message["kind"]
+        with self._lock:
+            launch = self._launches.get(message["job_id"])
+            if launch is None or launch.link is not link:
+                # E.g. the late confirmation of a job cancelled here
+                return
+            if kind in _FINAL_KINDS:
+                del self._launches[launch.job.job_id]
+            elif kind == "started":
+                launch.started = True
+
+        self._emit(
+            LaunchEvent(
+                launch.job,
+                launch.gpus,
+                kind,
+                message.get("returncode"),
+                latency=message.get("latency"),
+                output=message.get("output"),
+            )
+        )
@@ -1,12 +1,20 @@
+import os
 import tomllib
+from collections.abc import Mapping
 from dataclasses import asdict, dataclass, fields
 from pathlib import Path
-
-import tomli_w
-from rich.table import Table
+from typing import TYPE_CHECKING, Any
 
 from gpusitter.logger import console, prompt
 
+if TYPE_CHECKING:
+    from rich.table import Table
+
+# The prefix of the environment variables which override the configuration, e.g. GPUSITTER_FRIENDLY_MIN=0
+ENV_PREFIX = "GPUSITTER_"
+# The values of the fields which are neither in the file, nor in the environment, nor overridden in headless mode
+HEADLESS_DEFAULTS = {"gpu_free_memory_ratio_threshold": 0.85, "friendly_min": 0.0}
+
 
 @dataclass
 class ConfigData:
@@ -21,6 +29,21 @@ class ConfigData:
     email_receivers: list[str] | None = None
 
 
+def parse_value(key: str, value: str) -> Any:
+    """Parse the value of a configuration field given as a string, e.g. in the environment or on the command line.
+
+    Raises:
+        ValueError: If there is no such field or the value is not a number where one is expected.
+    """
+    if key in ("gpu_free_memory_ratio_threshold", "friendly_min"):
+        return float(value)
+    if key == "email_receivers":
+        return [email.strip() for email in value.split(",") if email.strip()]
+    if key not in {f.name for f in fields(ConfigData)}:
+        raise ValueError(f"Unknown config key {key!r}")
+    return value
+
+
 class ConfigManager:
     """Manage the configuration for GPU Snatcher."""
 
@@ -46,6 +69,36 @@ class ConfigManager:
             self.config = self.update_config()
             self.save_config(self.config_path)
 
+    def load_headless(
+        self, overrides: Mapping[str, str] | None = None, environ: Mapping[str, str] | None = None
+    ) -> None:
+        """Load the configuration without ever prompting, e.g. for a service or a batch job.
+
+        The file is read if there is one, then the `GPUSITTER_<FIELD>` environment variables and the overrides take
+        precedence in this order. Missing fields keep `HEADLESS_DEFAULTS`, and mails are off without an email host.
+
+        Args:
+            overrides (Mapping[str, str] | None): The values of fields by name, e.g. from the command line.
+            environ (Mapping[str, str] | None): The environment, `os.environ` by default.
+
+        Raises:
+            ValueError: If a key is unknown or a value cannot be parsed.
+        """
+        environ = environ if environ is not None else os.environ
+        data: dict[str, Any] = dict(HEADLESS_DEFAULTS)
+        if self.config_path.exists():
+            with open(self.config_path, "rb") as f:
+                data.update(tomllib.load(f))
+
+        for f in fields(ConfigData):
+            if (value := environ.get(ENV_PREFIX + f.name.upper())) is not None:
+                data[f.name] = parse_value(f.name, value)
+        for key, value in (overrides or {}).items():
+            data[key] = parse_value(key, value)
+
+        valid_keys = {f.name for f in fields(ConfigData)}
+        self.config = ConfigData(**{k: v for k, v in data.items() if k in valid_keys})
+
     def confirm_config(self) -> None:
         """Confirm the current configuration."""
         while True:
@@ -71,13 +124,13 @@ class ConfigManager:
             current_value = getattr(self.config, k)
             if k in ["gpu_free_memory_ratio_threshold", "friendly_min"]:
                 new_value = prompt.ask(f"Please enter the {k}: ", default=str(current_value or ""))
-                setattr(self.config, k, float(new_value))
+                setattr(self.config, k, parse_value(k, new_value))
             elif k == "email_receivers":
                 new_value = prompt.ask(
                     f"Please enter the {k} (comma-separated): ",
                     default=",".join(current_value or []),
                 )
-                setattr(self.config, k, [email.strip() for email in new_value.split(",") if email.strip()])
+                setattr(self.config, k, parse_value(k, new_value))
             elif k == "email_pwd":
                 current_value = "*" * 8
                 new_value = prompt.ask(f"Please enter the {k}: ", default=str(current_value or ""), password=True)
@@ -112,11 +165,15 @@ class ConfigManager:
 
     def save_config(self, cf_path: Path) -> None:
         """Save configuration to a file."""
+        import tomli_w
+
         with open(cf_path, "wb") as f:
             tomli_w.dump(asdict(self.config), f)
 
-    def pad_config(self) -> tuple[Table, list[str]]:
+    def pad_config(self) -> tuple["Table", list[str]]:
         """Pad the configuration data with default values."""
+        from rich.table import Table
+
         fields_list = [f.name for f in fields(ConfigData)]
 
         table = Table(title="Current Configuration")
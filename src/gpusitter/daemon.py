@@ -0,0 +1,171 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from gpusitter.jobfiles import JobNames, JobStream, is_sweep
+from gpusitter.jobs import parse_job
+
+if TYPE_CHECKING:
+    from gpusitter.sitter import GPUSitter
+
+
+def default_socket_path() -> Path:
+    """Get the socket of the daemon of the current user, in the runtime directory if there is one."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "gpusitter.sock"
+    return Path(tempfile.gettempdir()) / f"gpusitter-{os.getuid()}.sock"
+
+
+def request(message: dict[str, Any], path: str | Path | None = None, timeout: float = 10.0) -> dict[str, Any]:
+    """Send one request to the daemon and get its response.
+
+    Raises:
+        ConnectionError: If no daemon listens on the socket.
+        RuntimeError: If the daemon rejects the request.
+    """
+    path = path if path is not None else default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise ConnectionError(f"No GPUSitter daemon listens on {path}, start one with `gpust daemon`.") from e
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+
+    if not line:
+        raise ConnectionError(f"The GPUSitter daemon on {path} closed the connection.")
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error", "unknown error"))
+    return response
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Answer the requests of one client connection, one JSON object per line."""
+
+    server: "DaemonServer"
+
+    def handle(self) -> None:
+        """Handle the requests of the connection."""
+        if not self.server.authorized(self.request):
+            self.reply({"ok": False, "error": "permission denied"})
+            return
+
+        while line := self.rfile.readline():
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.reply(response)
+
+    def reply(self, response: dict[str, Any]) -> None:
+        """Send a response line."""
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    """Serve the job submission API of a `GPUSitter` on a Unix domain socket.
+
+    The socket is only accessible to the user running the daemon, since the jobs run as that user.
+
+    Requests:
+        - `{"op": "submit", "jobs": ["cmd:gpus:options", ...], "files": [...]}` queues jobs and returns the
+          `job_ids` of the jobs without sweeps. Sweeps and job files are read as the queue drains, they are returned as
+          `streamed`.
+        - `{"op": "ls"}` returns the running and pending `jobs`.
+        - `{"op": "cancel", "job_ids": [...]}` cancels jobs and returns the `cancelled` ones with their state.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, sitter: "GPUSitter", path: str | Path | None = None) -> None:
+        """Bind the socket, replacing the socket of a daemon which is no longer running.
+
+        Raises:
+            RuntimeError: If another daemon is listening on the socket.
+        """
+        self.sitter = sitter
+        self.path = Path(path) if path is not None else default_socket_path()
+
+        if self.path.exists():
+            try:
+                request({"op": "ls"}, self.path, timeout=1.0)
+            except (ConnectionError, OSError, RuntimeError):
+                self.path.unlink()
+            else:
+                raise RuntimeError(f"A GPUSitter daemon is already listening on {self.path}")
+
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(str(self.path), DaemonHandler)
+        finally:
+            os.umask(old_umask)
+
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Serve the requests from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="gpusitter-daemon", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop serving and remove the socket."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+        self.server_close()
+        self.path.unlink(missing_ok=True)
+
+    @staticmethod
+    def authorized(sock: socket.socket) -> bool:
+        """Whether the peer runs as the same user as the daemon, or as root."""
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", creds)
+        return uid in (os.getuid(), 0)
+
+    def dispatch(self, message: dict[str, Any]) -> dict[str, Any]:
+        """Execute a request."""
+        op = message.get("op")
+        if op == "submit":
+            # Parse and check everything before queueing anything, so a bad request, e.g. with a job which never
+            # fits on the GPUs, queues nothing. The jobs of a request may run after the names of earlier jobs of the
+            # request
+            names = JobNames()
+            jobs = []
+            streams = []
+            for job_str in message.get("jobs", []):
+                if is_sweep(job_str):
+                    streams.append((JobStream.sweep(job_str, names), job_str))
+                else:
+                    jobs.append((names.resolve(parse_job(job_str)), job_str))
+            streams += [(JobStream.file(path), path) for path in message.get("files", [])]
+            self.sitter.check_dependencies(job for job, _ in jobs)
+            self.sitter.check_fit(job for job, _ in jobs)
+            for job, _ in jobs:
+                self.sitter.submit(job)
+            for stream, _ in streams:
+                self.sitter.submit_stream(stream)
+            return {
+                "ok": True,
+                "job_ids": [job.job_id for job, _ in jobs],
+                "streamed": [source for _, source in streams],
+            }
+        if op == "ls":
+            return {"ok": True, "jobs": self.sitter.list_jobs()}
+        if op == "cancel":
+            cancelled = {}
+            for job_id in message["job_ids"]:
+                state = self.sitter.cancel(int(job_id))
+                if state is not None:
+                    cancelled[str(job_id)] = state
+            return {"ok": True, "cancelled": cancelled}
+        return {"ok": False, "error": f"unknown operation {op!r}"}
@@ -1,49 +1,210 @@
-from email.mime.text import MIMEText
-from email.utils import formataddr
-from smtplib import SMTP_SSL, SMTPResponseException
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
 from gpusitter.logger import console
 
+if TYPE_CHECKING:
+    from email.mime.text import MIMEText
+    from smtplib import SMTP
+
 
 class EmailManager:
-    """Class to manage email notifications."""
+    """Class to manage email notifications.
+
+    The mail modules are imported with the first mail, a scheduler which never sends one does not pay for them.
+    """
 
-    def __init__(self, host_server: str, user: str, pwd: str, sender: str, receivers: list[str] | str) -> None:
+    def __init__(
+        self,
+        host_server: str | None,
+        user: str | None,
+        pwd: str | None,
+        sender: str | None,
+        receivers: list[str] | str | None,
+        use_ssl: bool = True,
+    ) -> None:
         """Initialize the EmailManager.
 
         Args:
-            host_server (str): The email server host.
+            host_server (str | None): The email server host, optionally with a port as `host:port`. No mails are sent
+                without one.
             user (str): The email account username.
             pwd (str): The email account password.
             sender (str): The email sender address.
             receivers (list[str]): The list of email receiver addresses.
+            use_ssl (bool): Connect with SSL, otherwise with plain SMTP.
         """
         self.host_server = host_server
         self.user = user
         self.pwd = pwd
         self.sender = sender
-        self.receivers = [receivers] if isinstance(receivers, str) else receivers
+        self.receivers = [receivers] if isinstance(receivers, str) else receivers or []
+        self.use_ssl = use_ssl
+
+        self._smtp: SMTP | None = None
 
-    def init_msg(self, subject: str, body: str) -> MIMEText:
+    @property
+    def enabled(self) -> bool:
+        """Whether there is a server to send mails through and anyone to send them to."""
+        return bool(self.host_server and self.receivers)
+
+    def init_msg(self, subject: str, body: str) -> "MIMEText":
         """Initialize the email message."""
+        from email.mime.text import MIMEText
+        from email.utils import formataddr
+
         message = MIMEText(f"{body}", "plain", "utf-8")
         message["Subject"] = f"{subject}"
         message["From"] = formataddr(("GPUSitter", self.sender))
         message["To"] = ", ".join(self.receivers)
         return message
 
+    def connect(self) -> "SMTP":
+        """Get the authenticated connection, opening it if there is none."""
+        from smtplib import SMTP, SMTP_SSL
+
+        if self._smtp is None:
+            smtp = SMTP_SSL(self.host_server) if self.use_ssl else SMTP(self.host_server)
+            try:
+                smtp.login(self.user, self.pwd)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+        return self._smtp
+
+    def close(self) -> None:
+        """Close the connection."""
+        if self._smtp is None:
+            return
+
+        smtp, self._smtp = self._smtp, None
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def _drop(self) -> None:
+        if self._smtp is not None:
+            self._smtp.close()
+            self._smtp = None
+
     def send_email(self, subject: str, body: str) -> None:
-        """Send an email notification."""
+        """Send an email notification over the reused connection, reconnecting once if it was dropped."""
+        from smtplib import SMTPResponseException, SMTPServerDisconnected
+
         try:
             msg = self.init_msg(subject, body)
-            with SMTP_SSL(self.host_server) as smtp:
-                smtp.login(self.user, self.pwd)
-                smtp.send_message(msg)
+            try:
+                self.connect().send_message(msg)
+            except (SMTPServerDisconnected, ConnectionError):
+                self._drop()
+                self.connect().send_message(msg)
         except SMTPResponseException as e:
             if e.smtp_code == -1:
                 pass
             else:
                 raise
         except Exception as e:
+            self._drop()
             console.log(f"[red]Failed to send email: {e}[/red]")
             console.log()
+
+
+def format_gpus(gpus: list[int]) -> str:
+    """Format GPU indices with ranges, e.g. `0-3, 6`."""
+    parts = []
+    for i in sorted(set(gpus)):
+        if parts and parts[-1][1] == i - 1:
+            parts[-1][1] = i
+        else:
+            parts.append([i, i])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in parts)
+
+
+@dataclass
+class Notification:
+    """A job notification waiting to be sent."""
+
+    status: str
+    gpus: list[int]
+    subject: str
+    body: str
+
+
+class EmailNotifier:
+    """Send notifications from a background thread and coalesce bursts into one digest mail."""
+
+    def __init__(self, email_mgr: EmailManager | None = None, batch_window: float = 5.0) -> None:
+        """Initialize the notifier and start its worker thread.
+
+        Args:
+            email_mgr (EmailManager | None): The email manager which sends the mails. If None, every notification is
+                dropped and no worker thread is started, e.g. for simulations.
+            batch_window (float): The seconds to collect further notifications after the first one of a burst.
+        """
+        self.email_mgr = email_mgr
+        self.batch_window = batch_window
+
+        self._queue: queue.Queue[Notification | None] = queue.Queue()
+        self._worker: threading.Thread | None = None
+        if email_mgr is not None:
+            self._worker = threading.Thread(target=self._run, name="gpusitter-notify", daemon=True)
+            self._worker.start()
+
+    def notify(self, notification: Notification) -> None:
+        """Queue a notification, this never blocks on the mail server. Without mail settings it is dropped."""
+        if self.email_mgr is not None and self.email_mgr.enabled:
+            self._queue.put(notification)
+
+    def close(self) -> None:
+        """Send all queued notifications and stop the worker."""
+        if self._worker is None or not self._worker.is_alive():
+            return
+
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.batch_window
+            while (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    notification = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if notification is None:
+                    stopping = True
+                    break
+                batch.append(notification)
+
+            try:
+                self.email_mgr.send_email(*self.digest(batch))
+            except Exception as e:
+                console.log(f"[red]Failed to send email: {e}[/red]")
+
+        self.email_mgr.close()
+
+    @staticmethod
+    def digest(batch: list[Notification]) -> tuple[str, str]:
+        """Merge a batch of notifications into the subject and body of one mail."""
+        if len(batch) == 1:
+            return batch[0].subject, batch[0].body
+
+        gpu_str = format_gpus([i for notification in batch for i in notification.gpus])
+        statuses = {notification.status for notification in batch}
+        if len(statuses) == 1:
+            subject = f"GPUSitter: {len(batch)} jobs {statuses.pop()} on GPUs {gpu_str}"
+        else:
+            subject = f"GPUSitter: {len(batch)} job updates on GPUs {gpu_str}"
+        body = "\n\n".join(notification.body for notification in batch)
+        return subject, body
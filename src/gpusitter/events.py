@@ -0,0 +1,136 @@
+import contextlib
+import json
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+from gpusitter.logger import console
+
+
+class EventLog:
+    """Write what the scheduler does as a stream of JSON lines, one event per line, see `gpusitter.analysis`.
+
+    Every event has its kind in `event` and its time in `t`, the other fields depend on the kind. Emitting an event
+    only puts it on a bounded queue, a background thread encodes and writes the events in batches and rotates the
+    file once it grows beyond `max_bytes`. Unlike the journal, the events are not fsynced: losing the last batch in a
+    crash is fine for a log which is only analysed. If the writer falls behind, events are dropped and counted rather
+    than slowing the scheduler down.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        flush_interval: float = 1.0,
+        max_bytes: int = 100 * 1024**2,
+        backups: int = 3,
+        max_pending: int = 100000,
+        clock: Callable[[], float] | None = None,
+    ) -> None:
+        """Open the log and start its writer, the directory is created if needed.
+
+        Args:
+            path (str | Path): The path of the log.
+            flush_interval (float): The seconds to collect events before writing them in one batch.
+            max_bytes (int): The size above which the log is rotated to `<path>.1`, 0 to never rotate.
+            backups (int): The number of rotated logs which are kept.
+            max_pending (int): The number of events which may wait for the writer, further events are dropped.
+            clock (Callable[[], float] | None): The source of the event times, the wall clock by default.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.clock = clock if clock is not None else time.time
+        self.dropped = 0
+
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue(maxsize=max_pending)
+        self._file = open(self.path, "a")  # noqa: SIM115
+        self._worker = threading.Thread(target=self._run, name="gpusitter-events", daemon=True)
+        self._worker.start()
+
+    def emit(self, event: str, **fields: Any) -> None:
+        """Log an event, this never blocks.
+
+        Args:
+            event (str): The kind of the event, e.g. `placed`.
+            **fields (Any): The JSON-serializable fields of the event.
+        """
+        try:
+            self._queue.put_nowait({"t": self.clock(), "event": event, **fields})
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Write the remaining events and close the log."""
+        if not self._worker.is_alive():
+            return
+
+        self._queue.put(None)
+        self._worker.join()
+        if self.dropped:
+            console.log(f"[yellow]Dropped {self.dropped} events the writer of {self.path} fell behind on[/yellow]")
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            backup = self.path.with_name(f"{self.path.name}.{i}")
+            if backup.exists():
+                os.replace(backup, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        self._file = open(self.path, "w")  # noqa: SIM115
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            event = self._queue.get()
+            if event is None:
+                break
+
+            batch = [event]
+            deadline = time.monotonic() + self.flush_interval
+            while (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    event = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+
+            try:
+                self._file.writelines(json.dumps(event, separators=(",", ":")) + "\n" for event in batch)
+                self._file.flush()
+                if self.max_bytes > 0 and self._file.tell() > self.max_bytes:
+                    self._rotate()
+            except (OSError, TypeError, ValueError) as e:
+                console.log(f"[red]Failed to write the event log {self.path}: {e}[/red]")
+
+        with contextlib.suppress(OSError):
+            self._file.close()
+
+
+def read_events(path: str | Path) -> Iterator[dict[str, Any]]:
+    """Read the events of a log, including its rotated backups, from the oldest to the newest.
+
+    Lines which are not valid JSON, e.g. one cut off by a crash, are skipped.
+    """
+    path = Path(path)
+    backups = sorted(
+        (p for p in path.parent.glob(f"{path.name}.*") if p.suffix[1:].isdigit()),
+        key=lambda p: int(p.suffix[1:]),
+        reverse=True,
+    )
+    for log in [*backups, path]:
+        if not log.exists():
+            continue
+        with open(log) as f:
+            for line in f:
+                with contextlib.suppress(ValueError):
+                    yield json.loads(line)
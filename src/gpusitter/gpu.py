@@ -1,8 +1,23 @@
 import contextlib
+import getpass
 import os
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
 
 import pynvml
 
+from gpusitter.backends import GPUBackend, NVMLBackend, read_device
+from gpusitter.claims import GPUClaims
+from gpusitter.jobs import GPUShare
+from gpusitter.ledger import GPULedger
+from gpusitter.logger import console
+from gpusitter.scheduler import Clock
+from gpusitter.telemetry import GPUTelemetry
+from gpusitter.topology import Topology
+
 
 def query_gpu() -> list[dict[str, int]] | None:
     """Query GPU information using pynvml.
@@ -17,18 +32,7 @@ def query_gpu() -> list[dict[str, int]] | None:
     try:
         pynvml.nvmlInit()
         device_count = pynvml.nvmlDeviceGetCount()
-        gpu_info = []
-
-        for i in range(device_count):
-            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-            mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
-            gpu_info.append(
-                {
-                    "index": i,
-                    "memory.free": mem.free // (1024**2),  # bytes -> MiB
-                    "memory.total": mem.total // (1024**2),  # bytes -> MiB
-                }
-            )
+        gpu_info = [read_device(i, pynvml.nvmlDeviceGetHandleByIndex(i)) for i in range(device_count)]
 
         return gpu_info if gpu_info else None
 
@@ -40,18 +44,168 @@ def query_gpu() -> list[dict[str, int]] | None:
             pynvml.nvmlShutdown()
 
 
+@dataclass
+class PollStats:
+    """Timing statistics of the GPU polls."""
+
+    count: int = 0
+    total: float = 0.0
+    last: float = 0.0
+    max: float = 0.0
+    # The polls which failed, e.g. while the driver was reloaded
+    failures: int = 0
+
+    @property
+    def mean(self) -> float:
+        """The mean duration of a poll in seconds."""
+        return self.total / self.count if self.count else 0.0
+
+    def record(self, duration: float) -> None:
+        """Record the duration of a poll in seconds."""
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        self.max = max(self.max, duration)
+
+
+# A predicate inspects the snapshot of one GPU and returns why the GPU is rejected, or None if it is acceptable.
+# Keys a backend does not report, e.g. the utilization in an old trace, never reject a GPU. Predicates on the free
+# memory are marked with `checks_memory`, GPUs shared by memory-sized jobs of ours skip them since the jobs take the
+# memory on purpose.
+Predicate = Callable[[dict[str, Any]], str | None]
+
+
+def memory_ratio_above(threshold: float) -> Predicate:
+    """Reject GPUs whose free memory ratio is not above the threshold."""
+
+    def predicate(gpu: dict[str, Any]) -> str | None:
+        ratio = gpu["memory.free"] / gpu["memory.total"]
+        return None if ratio > threshold else f"free memory {ratio:.0%} <= {threshold:.0%}"
+
+    predicate.checks_memory = True  # type: ignore[attr-defined]
+    return predicate
+
+
+def utilization_below(max_utilization: float) -> Predicate:
+    """Reject GPUs whose SM utilization is above `max_utilization` percent."""
+
+    def predicate(gpu: dict[str, Any]) -> str | None:
+        utilization = gpu.get("utilization.gpu")
+        if utilization is None or utilization <= max_utilization:
+            return None
+        return f"utilization {utilization}% > {max_utilization:g}%"
+
+    return predicate
+
+
+def compute_mode_allows() -> Predicate:
+    """Reject GPUs whose compute mode forbids new processes, i.e. prohibited or exclusive and already taken."""
+
+    def predicate(gpu: dict[str, Any]) -> str | None:
+        mode = gpu.get("compute_mode")
+        if mode == pynvml.NVML_COMPUTEMODE_PROHIBITED:
+            return "compute mode prohibited"
+        if mode == pynvml.NVML_COMPUTEMODE_EXCLUSIVE_PROCESS and gpu.get("processes"):
+            return "exclusive compute mode taken"
+        return None
+
+    return predicate
+
+
+def no_foreign_processes(user: str | None = None) -> Predicate:
+    """Reject GPUs running compute processes of other users than `user`, the current user by default."""
+    user = user if user is not None else getpass.getuser()
+
+    def predicate(gpu: dict[str, Any]) -> str | None:
+        foreign = sorted({proc["user"] for proc in gpu.get("processes", []) if proc["user"] != user})
+        return f"processes of {', '.join(foreign)}" if foreign else None
+
+    return predicate
+
+
+def default_predicates(
+    gpu_free_memory_ratio_threshold: float, max_utilization: float = 100.0, allow_foreign_processes: bool = True
+) -> list[Predicate]:
+    """Build the predicate set of the GPU manager.
+
+    Args:
+        gpu_free_memory_ratio_threshold (float): The threshold for the free memory ratio to consider a GPU as free.
+        max_utilization (float): The SM utilization in percent above which a GPU is contended, 100 to ignore it.
+        allow_foreign_processes (bool): Accept GPUs running compute processes of other users.
+    """
+    predicates = [memory_ratio_above(gpu_free_memory_ratio_threshold), compute_mode_allows()]
+    if max_utilization < 100:
+        predicates.append(utilization_below(max_utilization))
+    if not allow_foreign_processes:
+        predicates.append(no_foreign_processes())
+    return predicates
+
+
 class GPUManager:
-    """A class to manage GPU selection based on memory availability."""
+    """A class to manage GPU selection based on memory availability and contention."""
 
-    def __init__(self, gpu_free_memory_ratio_threshold: float = 0.85) -> None:
+    def __init__(
+        self,
+        gpu_free_memory_ratio_threshold: float = 0.85,
+        backend: GPUBackend | None = None,
+        ledger: GPULedger | None = None,
+        stability_window: float = 0.0,
+        clock: Clock | None = None,
+        predicates: list[Predicate] | None = None,
+        max_jobs_per_gpu: int = 4,
+        max_memory_fraction: float = 0.95,
+        claims: GPUClaims | None = None,
+    ) -> None:
         """Initialize the GPU manager.
 
         Args:
             gpu_free_memory_ratio_threshold (float): The threshold for the free memory ratio to consider a GPU as free.
+            backend (GPUBackend | None): The source of GPU telemetry, a persistent NVML session by default.
+            ledger (GPULedger | None): The GPUs reserved by this ledger are never reported as free.
+            stability_window (float): The seconds a GPU has to stay acceptable before it is reported as free.
+            clock (Clock | None): The clock to timestamp the telemetry with.
+            predicates (list[Predicate] | None): The predicates every GPU has to pass, the free memory ratio and the
+                compute mode by default.
+            max_jobs_per_gpu (int): The number of memory-sized jobs which may share one GPU.
+            max_memory_fraction (float): The fraction of the total memory of a GPU which the memory-sized jobs may
+                reserve in total, the rest is headroom against overcommitting it.
+            claims (GPUClaims | None): The GPUs claimed by other instances on this host are never reported as free.
         """
         self.gpu_free_memory_ratio_threshold = gpu_free_memory_ratio_threshold
+        self.backend = backend if backend is not None else NVMLBackend()
+        self.ledger = ledger
+        self.predicates = predicates if predicates is not None else default_predicates(gpu_free_memory_ratio_threshold)
+        self.telemetry = GPUTelemetry(stability_window, clock=clock)
+        self.poll_stats = PollStats()
+        self.max_jobs_per_gpu = max_jobs_per_gpu
+        self.max_memory_fraction = max_memory_fraction
+        self.claims = claims
+        # The GPUs of the last poll
+        self.snapshot: list[dict[str, Any]] = []
+        # The reasons why every GPU of the last poll was rejected, an empty list for the free GPUs
+        self.rejections: dict[int, list[str]] = {}
 
         self._gpu_maps: dict[int, int] | None = None
+        # Whether the next poll may reuse the startup inventory
+        self._reuse_snapshot = False
+        # Whether the last poll failed, only the first failure in a row is logged
+        self._failing = False
+        # The topology with the backend version it was read at
+        self._topology: tuple[int, Topology | None] | None = None
+
+    def __enter__(self) -> "GPUManager":
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the backend when leaving the runtime context."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the backend, e.g. shut the NVML session down, and release the claims."""
+        self.backend.close()
+        if self.claims is not None:
+            self.claims.close()
 
     def get_all_gpus(self) -> list[dict[str, int]]:
         """Get a list of all GPUs.
@@ -59,25 +213,174 @@ class GPUManager:
         Returns:
             list[dict[str, int]]: A list of dictionaries containing information about all GPUs.
         """
-        gpus = query_gpu()
+        if self._reuse_snapshot:
+            self._reuse_snapshot = False
+            return self.snapshot
+
+        start = time.perf_counter()
+        gpus = self.backend.query()
+        self.poll_stats.record(time.perf_counter() - start)
+
         if gpus is None:
             return []
 
-        return self.get_visible_gpus(gpus)
+        gpus = self.get_visible_gpus(gpus)
+        self.snapshot = gpus
+        self.rejections = self.evaluate(gpus)
+        available = {index for index, reasons in self.rejections.items() if not reasons}
+        self.telemetry.record(gpus, available | self._shareable(gpus))
+        return gpus
+
+    def inventory(self) -> list[dict[str, int]]:
+        """Poll all GPUs at startup, e.g. to check that the jobs fit, and let the first scheduling pass reuse the poll.
+
+        Returns:
+            list[dict[str, int]]: A list of dictionaries containing information about all GPUs.
+        """
+        gpus = self.get_all_gpus()
+        self._reuse_snapshot = bool(gpus)
+        return gpus
+
+    def evaluate(self, gpus: list[dict[str, Any]]) -> dict[int, list[str]]:
+        """Evaluate all GPUs of a poll against the predicates in one pass.
+
+        Returns:
+            dict[int, list[str]]: The reasons why each GPU was rejected, an empty list if it passed every predicate.
+        """
+        return {
+            gpu["index"]: [reason for predicate in self.predicates if (reason := predicate(gpu)) is not None]
+            for gpu in gpus
+        }
 
     def get_free_gpus(self) -> list[dict[str, int] | None]:
         """Get a list of free GPUs.
 
+        A GPU is free once it has passed every predicate for the whole stability window, it is not reserved in the
+        ledger and no other instance claims it. The reasons for rejecting the other GPUs are left in `rejections`.
+
+        A poll which fails, e.g. since the driver is being reloaded, reports no free GPUs instead of raising, so the
+        scheduling loop keeps running and the backend retries on the next poll.
+
         Returns:
             list[dict[str, int] | None]: A list of dictionaries containing information about free GPUs.
         """
-        all_gpus = self.get_all_gpus()
+        try:
+            all_gpus = self.get_all_gpus()
+        except Exception as e:
+            self._poll_failed(e)
+            return []
+        if self._failing:
+            self._failing = False
+            console.log("[green]Querying the GPUs works again[/green]")
         if not all_gpus:
             return []
 
-        return [
-            gpu for gpu in all_gpus if gpu["memory.free"] / gpu["memory.total"] > self.gpu_free_memory_ratio_threshold
-        ]
+        reserved = self.ledger.reserved_gpus() if self.ledger is not None else set()
+        stable = self.telemetry.stable_gpus()
+        claimed = set()
+        if self.claims is not None:
+            # Only the GPUs which are free otherwise are worth checking
+            candidates = [gpu["index"] for gpu in all_gpus if not self.rejections[gpu["index"]]]
+            claimed = self.claims.claimed_by_others([i for i in candidates if i not in reserved])
+        free_gpus = []
+        for gpu in all_gpus:
+            reasons = self.rejections[gpu["index"]]
+            if gpu["index"] in reserved:
+                reasons.append("reserved")
+            elif gpu["index"] in claimed:
+                reasons.append("claimed")
+            elif not reasons and gpu["index"] not in stable:
+                reasons.append("stabilizing")
+            if not reasons:
+                free_gpus.append(gpu)
+        return free_gpus
+
+    def _poll_failed(self, error: Exception) -> None:
+        """Forget the last poll, so no GPU is free or shared and the stability window starts over once polls work."""
+        self.poll_stats.failures += 1
+        self.telemetry.record(self.snapshot, set())
+        self.snapshot = []
+        self.rejections = {}
+        if not self._failing:
+            self._failing = True
+            console.log(f"[red]Failed to query the GPUs, no GPU is used until a poll succeeds: {error}[/red]")
+
+    def max_job_gpus(self, gpus: list[dict[str, int]]) -> int:
+        """Get the most GPUs one job can get among the given GPUs, the GPUs of the largest host."""
+        hosts = Counter(self.backend.host_of(gpu["index"]) for gpu in gpus)
+        return max(hosts.values(), default=0)
+
+    def get_shared_gpus(self, free_gpus: list[dict[str, int]]) -> dict[int, GPUShare]:
+        """Get the room the GPUs of the last poll have left for memory-sized jobs.
+
+        A GPU accepts memory-sized jobs if it is free, or if it runs only memory-sized jobs of ours and fewer than
+        `max_jobs_per_gpu` of them. Such a GPU still has to pass every predicate but the ones on the free memory, for
+        the whole stability window. Its room is the actual free memory minus the reservations which do not show up in
+        it yet, and all reservations together stay below `max_memory_fraction` of the total memory.
+
+        Args:
+            free_gpus (list[dict[str, int]]): The GPUs `get_free_gpus` reported free in the last poll.
+
+        Returns:
+            dict[int, GPUShare]: The free MiB and job slots of every GPU which accepts memory-sized jobs.
+        """
+        reservations = self.ledger.shared_reservations() if self.ledger is not None else {}
+        free = {gpu["index"] for gpu in free_gpus}
+        stable = self.telemetry.stable_gpus() if reservations else set()
+        user = getpass.getuser()
+        shares = {}
+        for gpu in self.snapshot:
+            index = gpu["index"]
+            jobs = reservations.get(index)
+            if jobs is None:
+                if index not in free:
+                    continue
+                jobs = []
+            elif index not in stable:
+                continue
+            if len(jobs) >= self.max_jobs_per_gpu:
+                continue
+
+            reserved = sum(jobs)
+            # Our jobs which have allocated their memory already are part of the actual free memory
+            used = sum(proc["used_memory"] for proc in gpu.get("processes", []) if proc["user"] == user)
+            memory = min(
+                gpu["memory.free"] - max(reserved - used, 0),
+                int(gpu["memory.total"] * self.max_memory_fraction) - reserved,
+            )
+            shares[index] = GPUShare(max(memory, 0), self.max_jobs_per_gpu - len(jobs))
+        return shares
+
+    def _shareable(self, gpus: list[dict[str, Any]]) -> set[int]:
+        """Get the GPUs running only memory-sized jobs of ours which pass the predicates not on the free memory."""
+        reservations = self.ledger.shared_reservations() if self.ledger is not None else {}
+        if not reservations:
+            return set()
+        predicates = [predicate for predicate in self.predicates if not getattr(predicate, "checks_memory", False)]
+        return {
+            gpu["index"]
+            for gpu in gpus
+            if gpu["index"] in reservations and all(predicate(gpu) is None for predicate in predicates)
+        }
+
+    @property
+    def topology(self) -> Topology | None:
+        """The interconnect topology, read from the backend again only once its `topology_version` changed.
+
+        None if it cannot be read.
+        """
+        version = self.backend.topology_version
+        if self._topology is not None and self._topology[0] == version:
+            return self._topology[1]
+
+        try:
+            costs = self.backend.topology()
+        except Exception as e:
+            console.log(f"[yellow]Failed to read the GPU topology, GPUs are assigned in index order: {e}[/yellow]")
+            costs = None
+        topology = Topology(costs) if costs else None
+        self._topology = (version, topology)
+        return topology
 
     @property
     def gpu_maps(self) -> dict[int, int] | None:
@@ -0,0 +1,103 @@
+import functools
+import json
+import os
+import re
+import statistics
+import threading
+from pathlib import Path
+
+from gpusitter.jobs import Job
+from gpusitter.logger import console
+
+# The options which sweeps vary without changing how long a job runs, unlike e.g. `--epochs` or `--steps`
+SWEEP_PARAMETERS = ("seed", "lr", "learning[-_]rate", "weight[-_]decay", "wd", "dropout", "momentum")
+
+# The numeric value of a sweep parameter, e.g. of `--seed=3`, `--lr 1e-4` or `seed=3` but not of `--seeds=3`
+_SWEEP_VALUE = re.compile(
+    rf"(?<![\w-])(-{{0,2}}(?:{'|'.join(SWEEP_PARAMETERS)})(?:=| ))[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:e[-+]?\d+)?(?![\w.])",
+    re.IGNORECASE,
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_command(cmd: str) -> str:
+    """Get the key of a command in the runtime history.
+
+    Whitespace is collapsed and the values of the `SWEEP_PARAMETERS` are masked, so the jobs of a sweep over seeds or
+    learning rates share one history while different scripts and options do not. Other numbers like the epochs or
+    steps stay part of the key, they change the runtime. The keys are cached, the queued jobs are estimated on every
+    scheduling pass.
+    """
+    return _SWEEP_VALUE.sub(r"\1#", " ".join(cmd.split()))
+
+
+class RuntimeHistory:
+    """The runtimes of the last successful runs of every command, to predict how long a queued job will run.
+
+    A command keeps only its last `keep` runtimes and the history only its `max_commands` most recently finished
+    commands, so the file stays small. The prediction is the mean of the kept runtimes, recent runs of a command are
+    a better guess than the whole history of a script which keeps changing.
+    """
+
+    def __init__(self, path: str | Path | None = None, keep: int = 4, max_commands: int = 1000) -> None:
+        """Initialize the history, loading it from its file if there is one.
+
+        Args:
+            path (str | Path | None): The JSON file which persists the history across runs. If None, the history
+                is only kept in memory.
+            keep (int): The number of runtimes kept per command.
+            max_commands (int): The number of commands kept, the ones which finished least recently are dropped.
+        """
+        self.path = Path(path) if path is not None else None
+        self.keep = keep
+        self.max_commands = max_commands
+
+        # The runtimes in seconds by command key, in the order the commands last finished
+        self._runtimes: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        """Get the number of commands with a history."""
+        return len(self._runtimes)
+
+    def estimate(self, job: Job) -> float | None:
+        """Predict the runtime of a job in seconds.
+
+        Returns:
+            float | None: The mean of the last runtimes of its command, or None if the command never finished.
+        """
+        with self._lock:
+            runtimes = self._runtimes.get(normalize_command(job.cmd))
+            return statistics.fmean(runtimes) if runtimes else None
+
+    def record(self, job: Job, runtime: float) -> None:
+        """Record the runtime of a job which finished successfully and save the history."""
+        key = normalize_command(job.cmd)
+        with self._lock:
+            runtimes = self._runtimes.pop(key, [])
+            runtimes.append(runtime)
+            self._runtimes[key] = runtimes[-self.keep :]
+            while len(self._runtimes) > self.max_commands:
+                del self._runtimes[next(iter(self._runtimes))]
+            data = {"version": 1, "runtimes": dict(self._runtimes)}
+        if self.path is not None:
+            self._save(data)
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text())
+            self._runtimes = {str(key): [float(value) for value in values] for key, values in data["runtimes"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            console.log(f"[yellow]Ignoring the unreadable runtime history {self.path}: {e}[/yellow]")
+
+    def _save(self, data: dict) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Written to a temporary file first, a crash never leaves a truncated history behind
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            console.log(f"[yellow]Failed to save the runtime history {self.path}: {e}[/yellow]")
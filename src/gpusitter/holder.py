@@ -0,0 +1,248 @@
+import ctypes
+import math
+import os
+import select
+import subprocess
+import sys
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any
+
+from gpusitter.logger import console
+from gpusitter.scheduler import Clock
+from gpusitter.utils import compute_storage_size
+
+BYTES_PER_ELEMENT = {"float32": 4, "float64": 8}
+
+
+def cuda_allocate(nbytes: int) -> None:
+    """Allocate `nbytes` on the first visible GPU through the CUDA driver API.
+
+    The memory stays allocated until the process exits, the driver frees it together with the context.
+    """
+    cuda = ctypes.CDLL("libcuda.so.1")
+
+    def check(result: int, call: str) -> None:
+        if result != 0:
+            raise RuntimeError(f"{call} failed with CUDA error {result}")
+
+    device = ctypes.c_int()
+    context = ctypes.c_void_p()
+    pointer = ctypes.c_uint64()
+    check(cuda.cuInit(0), "cuInit")
+    check(cuda.cuDeviceGet(ctypes.byref(device), 0), "cuDeviceGet")
+    check(cuda.cuCtxCreate_v2(ctypes.byref(context), 0, device), "cuCtxCreate")
+    check(cuda.cuMemAlloc_v2(ctypes.byref(pointer), ctypes.c_size_t(nbytes)), "cuMemAlloc")
+
+
+class Allocator(ABC):
+    """Allocate placeholder buffers on GPUs and free them again."""
+
+    @abstractmethod
+    def allocate(self, index: int, shape: list[int], dtype: str) -> Any:
+        """Start allocating a buffer of the given shape and dtype on a GPU, without waiting for it.
+
+        Returns:
+            Any: A token which tells whether the buffer is allocated when passed to `ready`, and frees the buffer, or
+            stops the allocation, when passed to `free`.
+        """
+
+    def ready(self, token: Any) -> bool:
+        """Check without blocking whether a buffer is allocated, allocators which allocate right away always are.
+
+        Raises:
+            RuntimeError: If the allocation failed.
+        """
+        return True
+
+    @abstractmethod
+    def free(self, token: Any) -> None:
+        """Free a buffer, the memory has to be available again when this returns."""
+
+
+@dataclass
+class HolderProcess:
+    """A holder process and what it allocates."""
+
+    proc: subprocess.Popen
+    index: int
+    nbytes: int
+    deadline: float
+
+
+class ProcessAllocator(Allocator):
+    """Allocate every buffer in a lightweight holder process, `python -m gpusitter.holder <bytes>`.
+
+    The holder allocates through the CUDA driver API, so neither a deep learning framework nor a CUDA toolkit is
+    needed. It prints `ready` once the buffer is allocated, and exits, and the driver frees its memory, as soon as its
+    stdin is closed, which also happens when GPUSitter itself dies.
+    """
+
+    def __init__(self, startup_timeout: float = 30.0, exit_timeout: float = 10.0) -> None:
+        """Initialize the allocator.
+
+        Args:
+            startup_timeout (float): The seconds a holder may take to allocate its buffer.
+            exit_timeout (float): The seconds a holder may take to exit before it is killed.
+        """
+        self.startup_timeout = startup_timeout
+        self.exit_timeout = exit_timeout
+
+    def allocate(self, index: int, shape: list[int], dtype: str) -> HolderProcess:
+        """Start a holder process on the GPU."""
+        nbytes = math.prod(shape) * BYTES_PER_ELEMENT[dtype]
+        proc = subprocess.Popen(  # noqa: S603
+            [sys.executable, "-m", "gpusitter.holder", str(nbytes)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env={**os.environ, "CUDA_VISIBLE_DEVICES": str(index)},
+            text=True,
+        )
+        return HolderProcess(proc, index, nbytes, time.monotonic() + self.startup_timeout)
+
+    def ready(self, token: HolderProcess) -> bool:
+        """Check whether the holder process has reported that it allocated the buffer.
+
+        Raises:
+            RuntimeError: If the holder exited or did not allocate the buffer within the startup timeout.
+        """
+        readable, _, _ = select.select([token.proc.stdout], [], [], 0)
+        if readable:
+            # The holder prints `ready` in one line, or exits and closes the pipe
+            if token.proc.stdout.readline().strip() == "ready":
+                return True
+        elif time.monotonic() < token.deadline:
+            return False
+        raise RuntimeError(f"Failed to hold {token.nbytes // 1024**2} MiB on GPU {token.index}")
+
+    def free(self, token: HolderProcess) -> None:
+        """Stop the holder process and wait for it to exit."""
+        proc = token.proc
+        proc.stdin.close()
+        try:
+            proc.wait(self.exit_timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+
+@dataclass
+class Hold:
+    """The placeholder buffer held on one GPU."""
+
+    index: int
+    memory: int
+    since: float
+    token: Any
+
+
+class HoldManager:
+    """Hold the memory of free GPUs until a job is launched on them, so other users cannot grab them meanwhile.
+
+    Holds are started without waiting for the allocation, which may take seconds, and only count as held once a later
+    `update` finds the buffer allocated.
+    """
+
+    def __init__(
+        self,
+        allocator: Allocator | None = None,
+        max_held: int = 1,
+        timeout: float = 600.0,
+        dtype: str = "float32",
+        clock: Clock | None = None,
+    ) -> None:
+        """Initialize the hold manager.
+
+        Args:
+            allocator (Allocator | None): The allocator of the placeholder buffers, holder processes by default.
+            max_held (int): The number of GPUs which may be held at once.
+            timeout (float): The seconds a GPU is held without a job being launched on it. After that the GPU is
+                released and not held again for the same time.
+            dtype (str): The dtype of the placeholder buffers, see `utils.compute_storage_size`.
+            clock (Clock | None): The clock of the timeouts.
+        """
+        self.allocator = allocator if allocator is not None else ProcessAllocator()
+        self.max_held = max_held
+        self.timeout = timeout
+        self.dtype = dtype
+        self.clock = clock if clock is not None else Clock()
+
+        self.holds: dict[int, Hold] = {}
+        # The holds whose buffers are still being allocated, `since` is when the allocation started
+        self.starting: dict[int, Hold] = {}
+        self._expired: dict[int, float] = {}
+
+    def __len__(self) -> int:
+        """Get the number of held GPUs."""
+        return len(self.holds)
+
+    def held_gpus(self) -> list[int]:
+        """Get the indices of the held GPUs."""
+        return sorted(self.holds)
+
+    def update(self, free_gpus: list[dict[str, int]]) -> None:
+        """Count the started holds which are allocated now, release timed out holds and start holding free GPUs.
+
+        No more than `max_held` GPUs are held or being held at once.
+
+        Args:
+            free_gpus (list[dict[str, int]]): The free GPUs which are not about to get a job.
+        """
+        now = self.clock.now()
+        for index, hold in list(self.starting.items()):
+            try:
+                if not self.allocator.ready(hold.token):
+                    continue
+            except Exception as e:
+                console.log(f"[red]Failed to hold GPU {index}: {e}[/red]")
+                self.release([index])
+                self._expired[index] = now
+                continue
+            del self.starting[index]
+            hold.since = now
+            self.holds[index] = hold
+            console.log(f"Holding {hold.memory} MiB on GPU {index}")
+
+        for index in [index for index, hold in self.holds.items() if now - hold.since >= self.timeout]:
+            console.log(f"[yellow]Hold on GPU {index} timed out without a job, releasing it[/yellow]")
+            self.release([index])
+            self._expired[index] = now
+
+        for gpu in free_gpus:
+            index = gpu["index"]
+            if len(self.holds) + len(self.starting) >= self.max_held:
+                break
+            if index in self.holds or index in self.starting:
+                continue
+            if now - self._expired.get(index, -math.inf) < self.timeout:
+                continue
+
+            shape = compute_storage_size(gpu["memory.free"], dtype=self.dtype)
+            try:
+                token = self.allocator.allocate(index, shape, self.dtype)
+            except Exception as e:
+                console.log(f"[red]Failed to hold GPU {index}: {e}[/red]")
+                self._expired[index] = now
+                continue
+            memory = math.prod(shape) * BYTES_PER_ELEMENT[self.dtype] // 1024**2
+            self.starting[index] = Hold(index, memory, now, token)
+
+    def release(self, gpus: list[int]) -> None:
+        """Free the holds on the given GPUs, e.g. right before a job is launched on them, or stop starting them."""
+        for index in gpus:
+            hold = self.holds.pop(index, None) or self.starting.pop(index, None)
+            if hold is not None:
+                self.allocator.free(hold.token)
+
+    def close(self) -> None:
+        """Release all holds, including the ones which are still starting."""
+        self.release([*self.holds, *self.starting])
+
+
+if __name__ == "__main__":
+    cuda_allocate(int(sys.argv[1]))
+    print("ready", flush=True)
+    # Hold the memory until the parent closes our stdin or dies
+    sys.stdin.read()
@@ -0,0 +1,262 @@
+import itertools
+import json
+import re
+import tomllib
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+from typing import IO, Any
+
+from gpusitter.jobs import JOB_OPTIONS, Job, parse_job
+from gpusitter.logger import console
+
+# A sweep is a brace group of comma separated values, `{1e-3,1e-4}`, or of an inclusive integer range with an optional
+# step, `{0..4}` or `{0..100..10}`, as in the brace expansion of bash
+_SWEEP = re.compile(r"\{([^{}]*,[^{}]*|-?\d+\.\.-?\d+(?:\.\.\d+)?)\}")
+
+# The fields of a job record in a TOML or JSONL job file besides its `cmd`, mapped to the Job argument they set and the
+# parser of their value
+RECORD_FIELDS = {
+    "gpus": ("required_gpus", int),
+    "max_retries": ("max_retries", int),
+    **JOB_OPTIONS,
+}
+
+
+def _sweep_values(spec: str) -> Iterable[str | int]:
+    match = re.fullmatch(r"(-?\d+)\.\.(-?\d+)(?:\.\.(\d+))?", spec)
+    if match is None:
+        return spec.split(",")
+
+    start, stop, step = int(match.group(1)), int(match.group(2)), int(match.group(3) or 1)
+    if step == 0:
+        raise ValueError(f"Invalid sweep step: {{{spec}}}")
+    return range(start, stop + 1, step) if start <= stop else range(start, stop - 1, -step)
+
+
+def is_sweep(text: str) -> bool:
+    """Whether a job string contains a sweep, see `expand_sweep`."""
+    return _SWEEP.search(text) is not None
+
+
+def expand_sweep(text: str) -> Iterator[str]:
+    """Expand the sweeps of a job string lazily into the grid of all their combinations.
+
+    For example `python train.py --lr={1e-3,1e-4} --seed={0..2}` expands into six job strings, the last sweep varies
+    fastest. A string without sweeps is yielded as it is.
+    """
+    parts = _SWEEP.split(text)
+    literals, specs = parts[::2], parts[1::2]
+    if not specs:
+        yield text
+        return
+
+    for values in itertools.product(*(_sweep_values(spec) for spec in specs)):
+        yield "".join(itertools.chain.from_iterable(zip(literals, [*map(str, values), ""], strict=True)))
+
+
+def sweep_jobs(job_str: str) -> Iterator[Job]:
+    """Parse the jobs of a job string with sweeps lazily.
+
+    The first job is parsed right away, so a malformed job string raises here rather than while the jobs are read.
+
+    Raises:
+        ValueError: If the first job string cannot be parsed.
+    """
+    job_strs = expand_sweep(job_str)
+    first = parse_job(next(job_strs))
+    return itertools.chain([first], map(parse_job, job_strs))
+
+
+class JobNames:
+    """Turn the job names in the dependencies of jobs into the ids of the earlier jobs with these names.
+
+    A name stands for all the jobs given it so far, e.g. all the jobs of a sweep, so a job can run after a whole
+    sweep. Names are only known to the job file or the command line they appear in, and only to the jobs after them,
+    which also rules out cycles.
+    """
+
+    def __init__(self, ids: dict[str, list[int]] | None = None) -> None:
+        """Initialize the names.
+
+        Args:
+            ids (dict[str, list[int]] | None): The ids of the jobs by name known already, e.g. of the jobs before a
+                restart. None if no name is known yet.
+        """
+        self._ids: dict[str, list[int]] = {name: list(job_ids) for name, job_ids in (ids or {}).items()}
+
+    def resolve(self, job: Job) -> Job:
+        """Replace the names in the dependencies of a job by job ids and remember the name of the job.
+
+        Raises:
+            ValueError: If the job depends on a name no earlier job has.
+        """
+        after = []
+        for upstream in job.after:
+            if isinstance(upstream, int):
+                after.append(upstream)
+            elif upstream in self._ids:
+                after.extend(self._ids[upstream])
+            else:
+                raise ValueError(f"{job.cmd!r} runs after {upstream!r}, but no earlier job has this name")
+        job.after = after
+        if job.name is not None:
+            self._ids.setdefault(job.name, []).append(job.job_id)
+        return job
+
+    def ids(self) -> dict[str, list[int]]:
+        """Get the ids of the jobs by name, e.g. to journal them."""
+        return {name: list(job_ids) for name, job_ids in self._ids.items()}
+
+    def rename(self, old: int, new: int) -> None:
+        """Let the names of a job stand for another job id, e.g. for the id a job had before a restart."""
+        for job_ids in self._ids.values():
+            job_ids[:] = [new if job_id == old else job_id for job_id in job_ids]
+
+
+def record_jobs(record: dict[str, Any]) -> Iterator[Job]:
+    """Build the jobs of a record of a TOML or JSONL job file lazily, its `cmd` may contain sweeps.
+
+    Raises:
+        ValueError: If the record has no command, an unknown field or an invalid value.
+    """
+    if not isinstance(record, dict) or not isinstance(record.get("cmd"), str):
+        raise ValueError("A job record needs a `cmd` string.")
+    unknown = sorted(set(record) - {"cmd", *RECORD_FIELDS})
+    if unknown:
+        raise ValueError(f"Unknown job record fields: {', '.join(unknown)}")
+
+    options = {}
+    for field, value in record.items():
+        if field != "cmd":
+            name, parse = RECORD_FIELDS[field]
+            # Dependencies may be given as an array, `after = ["prep", "train"]`
+            options[name] = parse(",".join(map(str, value)) if isinstance(value, list) else str(value))
+    for cmd in expand_sweep(record["cmd"]):
+        yield Job(cmd, **options)
+
+
+def read_job_file(path: str | Path, names: JobNames | None = None) -> Iterator[Job]:
+    """Read the jobs of a job file lazily, so even huge sweeps never sit in memory as a whole.
+
+    The format follows the suffix of the file:
+        - `.toml`: `[[jobs]]` tables with a `cmd` and optionally `gpus`, `priority`, `mem`, `max_retries`, `name`
+          and `after`.
+        - `.jsonl`: one JSON object per line with the same fields.
+        - Anything else: one job string per line as for `--job`, blank lines and `#` comments are skipped.
+
+    Every command may contain sweeps, see `expand_sweep`. The jobs of a file form a pipeline when they depend on the
+    names of earlier jobs of the file, see `JobNames`. Records which cannot be parsed are logged and skipped, and so
+    are the records depending on their names.
+
+    Args:
+        path (str | Path): The path of the job file.
+        names (JobNames | None): The names the jobs of the file resolve and register. If None, the file has names of
+            its own.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If a TOML file is malformed.
+    """
+    path = Path(path)
+    names = names if names is not None else JobNames()
+    if path.suffix == ".toml":
+        with open(path, "rb") as f:
+            records = tomllib.load(f).get("jobs", [])
+        if not isinstance(records, list):
+            raise ValueError(f"The jobs of {path} must be an array of tables, `[[jobs]]`.")
+        return _read_toml(path, records, names)
+
+    f = open(path)  # noqa: SIM115
+    return _read_jsonl(path, f, names) if path.suffix == ".jsonl" else _read_lines(path, f, names)
+
+
+class JobStream:
+    """The jobs of a sweep or a job file, read lazily and counted, so a journal can reopen the stream where it was.
+
+    The source of a stream is a JSON object: `{"sweep": "cmd:gpus:options", "names": {...}}` with the names known to
+    the sweep, or `{"file": "/path/of/the/job/file"}`.
+    """
+
+    def __init__(self, source: dict[str, Any], names: JobNames | None = None) -> None:
+        """Open the stream.
+
+        Args:
+            source (dict[str, Any]): The source of the stream.
+            names (JobNames | None): The names the jobs resolve and register. If None, the stream has names of its own,
+                which know the `names` of the source.
+
+        Raises:
+            OSError: If the job file cannot be read.
+            ValueError: If the source is unknown, the first job of a sweep or a TOML file is malformed.
+        """
+        self.source = source
+        self.names = names if names is not None else JobNames(source.get("names"))
+        # The number of jobs read so far
+        self.position = 0
+        if isinstance(source.get("sweep"), str):
+            self._jobs: Iterator[Job] = map(self.names.resolve, sweep_jobs(source["sweep"]))
+        elif isinstance(source.get("file"), str):
+            self._jobs = read_job_file(source["file"], self.names)
+        else:
+            raise ValueError(f"Unknown job stream: {source!r}")
+
+    @classmethod
+    def sweep(cls, job_str: str, names: JobNames) -> "JobStream":
+        """Stream the jobs of a job string with sweeps, which may run after the jobs already in `names`.
+
+        Raises:
+            ValueError: If the first job string cannot be parsed.
+        """
+        return cls({"sweep": job_str, "names": names.ids()}, names)
+
+    @classmethod
+    def file(cls, path: str | Path) -> "JobStream":
+        """Stream the jobs of a job file, see `read_job_file`.
+
+        Raises:
+            OSError: If the file cannot be read.
+            ValueError: If a TOML file is malformed.
+        """
+        return cls({"file": str(Path(path).resolve())})
+
+    def __iter__(self) -> "JobStream":
+        """Get the stream itself, it is its own iterator."""
+        return self
+
+    def __next__(self) -> Job:
+        """Read the next job."""
+        job = next(self._jobs)
+        self.position += 1
+        return job
+
+
+def _checked(location: str, make_jobs: Callable[[], Iterable[Job]]) -> Iterator[Job]:
+    try:
+        yield from make_jobs()
+    except ValueError as e:
+        console.log(f"[red]Skipping the jobs at {location}: {e}[/red]")
+
+
+def _read_toml(path: Path, records: list[Any], names: JobNames) -> Iterator[Job]:
+    for number, record in enumerate(records, 1):
+        yield from _checked(f"{path} job {number}", lambda record=record: map(names.resolve, record_jobs(record)))
+
+
+def _read_jsonl(path: Path, f: IO[str], names: JobNames) -> Iterator[Job]:
+    with f:
+        for lineno, line in enumerate(f, 1):
+            if line.strip():
+                yield from _checked(
+                    f"{path}:{lineno}", lambda line=line: map(names.resolve, record_jobs(json.loads(line)))
+                )
+
+
+def _read_lines(path: Path, f: IO[str], names: JobNames) -> Iterator[Job]:
+    with f:
+        for lineno, line in enumerate(f, 1):
+            job_str = line.strip()
+            if job_str and not job_str.startswith("#"):
+                yield from _checked(
+                    f"{path}:{lineno}",
+                    lambda job_str=job_str: (names.resolve(parse_job(s)) for s in expand_sweep(job_str)),
+                )
@@ -0,0 +1,387 @@
+import bisect
+import re
+import threading
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from gpusitter.topology import Topology
+
+if TYPE_CHECKING:
+    from gpusitter.scheduler import Clock
+
+
+class _JobIds:
+    """Hand out increasing job ids."""
+
+    def __init__(self) -> None:
+        self._next = 1
+        self._lock = threading.Lock()
+
+    def __next__(self) -> int:
+        with self._lock:
+            job_id = self._next
+            self._next += 1
+        return job_id
+
+    def skip(self, last_id: int) -> None:
+        with self._lock:
+            self._next = max(self._next, last_id + 1)
+
+
+_job_ids = _JobIds()
+
+
+def skip_job_ids(last_id: int) -> None:
+    """Make sure new jobs get ids above `last_id`, e.g. after jobs with their old ids were restored."""
+    _job_ids.skip(last_id)
+
+
+_MEMORY_UNITS = {"": 1, "K": 1 / 1024, "M": 1, "G": 1024, "T": 1024**2}
+
+
+def parse_memory(value: str) -> int:
+    """Parse a memory size like `6G`, `512MiB` or `6144` (MiB) into MiB."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?", value.strip(), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid memory size: {value!r}")
+    return max(int(float(match.group(1)) * _MEMORY_UNITS[match.group(2).upper()]), 1)
+
+
+def parse_after(value: str) -> list[int | str]:
+    """Parse the dependencies of a job like `3`, `3,5` or `prep,train` into job ids and job names."""
+    after = [item.strip() for item in value.split(",")]
+    if not all(after):
+        raise ValueError(f"Invalid dependencies: {value!r}")
+    return [int(item) if item.isdigit() else item for item in after]
+
+
+# Options which may follow the command and the GPU count in a job string, e.g. "python train.py:4:priority=10",
+# mapped to the Job argument they set and the parser of their value
+JOB_OPTIONS = {
+    "priority": ("priority", int),
+    "mem": ("required_memory", parse_memory),
+    "name": ("name", str),
+    "after": ("after", parse_after),
+}
+
+
+class Job:
+    """A job to be executed when a GPU is free."""
+
+    def __init__(
+        self,
+        cmd: str,
+        required_gpus: int = 1,
+        max_retries: int = 3,
+        priority: int = 0,
+        required_memory: int | None = None,
+        job_id: int | None = None,
+        name: str | None = None,
+        after: list[int | str] | None = None,
+    ) -> None:
+        """Initialize a Job instance.
+
+        Args:
+            cmd (str): The command to run.
+            required_gpus (int): The number of GPUs.
+            max_retries (int): The number of failures after which the job is discarded, see `gpusitter.retries`.
+            priority (int): Jobs with a higher priority are started first.
+            required_memory (int | None): The MiB the job needs on each of its GPUs, so it can share GPUs with other
+                memory-sized jobs. If None, the job takes its GPUs as a whole.
+            job_id (int | None): The id of a restored job, new jobs get the next free id.
+            name (str | None): A name later jobs of the same job file or command line can depend on, the jobs of a
+                sweep share it.
+            after (list[int | str] | None): The ids or names of the jobs which have to succeed before this job is
+                queued, see `gpusitter.jobfiles.JobNames` for how names become ids.
+        """
+        self.job_id = job_id if job_id is not None else next(_job_ids)
+        self.cmd = cmd
+        self.required_gpus = required_gpus
+        self.required_memory = required_memory
+        self.retry_count = 0
+        self.max_retries = max_retries
+        self.priority = priority
+        self.name = name
+        self.after = list(after or [])
+        # Scheduling passes in which the job did not fit while jobs behind it were started
+        self.overtaken = 0
+        # When the job last entered the queue, on the clock of the queue
+        self.queued_at = 0.0
+        # The number of failures by class, and when a failed job may be retried, on the clock of the queue
+        self.failures: dict[str, int] = {}
+        self.not_before = 0.0
+
+    def __repr__(self) -> str:
+        """Return a string representation of the Job."""
+        return f"<Job cmd={self.cmd!r} gpus={self.required_gpus} retry={self.retry_count}/{self.max_retries}>"
+
+
+def parse_job(job_str: str) -> Job:
+    """Parse a job string into a Job instance.
+
+    A job string is a command, optionally followed by the number of GPUs and `key=value` options, all separated by
+    colons, e.g. `python train.py:4:priority=10`, `python eval.py:1:mem=6G` or `python eval.py:1:after=train`. A job
+    with 0 GPUs, e.g. a preprocessing step, runs without GPUs and never waits for one.
+
+    Raises:
+        ValueError: If an option is given twice, comes before the number of GPUs or has an invalid value.
+    """
+    cmd = job_str.strip()
+    gpus = None
+    options = {}
+    while ":" in cmd:
+        rest, field = cmd.rsplit(":", 1)
+        field = field.strip()
+        match = re.fullmatch(r"(\w+)=(\S+)", field)
+        if match and match.group(1) in JOB_OPTIONS:
+            if gpus is not None:
+                raise ValueError(f"The option {field!r} has to come after the number of GPUs in {job_str!r}")
+            name, parse = JOB_OPTIONS[match.group(1)]
+            if name in options:
+                raise ValueError(f"The option {match.group(1)!r} is given twice in {job_str!r}")
+            options[name] = parse(match.group(2))
+        elif field.isdigit() and gpus is None:
+            gpus = int(field)
+        else:
+            break
+        cmd = rest.strip()
+
+    return Job(cmd, gpus if gpus is not None else 1, **options)
+
+
+@dataclass
+class GPUShare:
+    """The room a GPU has left for memory-sized jobs."""
+
+    memory: int
+    slots: int
+
+
+def _scheduling_order(job: Job) -> tuple[int, int]:
+    return -job.priority, job.job_id
+
+
+class JobQueue:
+    """A queue of pending jobs which is scheduled as a whole on every pass.
+
+    Jobs are considered in order of priority, then submission. Every job which fits on the free GPUs is started, so
+    small jobs are backfilled around a large job that does not fit yet. A job which has been overtaken
+    `starvation_limit` times gets a reservation: no job behind it is started until it has been started itself.
+
+    With predicted runtimes, the reservation is EASY-style instead: the starving job reserves the GPUs which are
+    expected to be free first, and a job behind it is still started if it is expected to finish before the
+    reservation starts or if it leaves the reserved GPUs alone, so it never delays the starving job.
+    """
+
+    def __init__(self, starvation_limit: int = 10, clock: "Clock | None" = None) -> None:
+        """Initialize the job queue.
+
+        Args:
+            starvation_limit (int): The number of passes a job may be overtaken before it blocks the jobs behind it.
+            clock (Clock | None): The clock of the queueing times and of the backoff of failed jobs. If None, the
+                queue takes the clock of the scheduler loop it is handed to, the wall clock without one.
+        """
+        self.starvation_limit = starvation_limit
+        self.clock = clock
+
+        self._jobs: list[Job] = []
+        # The number of queued jobs which need no GPU
+        self._cpu_jobs = 0
+        self._lock = threading.Lock()
+
+    def put(self, job: Job) -> None:
+        """Add a job to the queue, a re-queued job keeps its place."""
+        job.queued_at = self.now()
+        with self._lock:
+            bisect.insort(self._jobs, job, key=_scheduling_order)
+            self._cpu_jobs += job.required_gpus == 0
+
+    def remove(self, job_id: int) -> Job | None:
+        """Remove a pending job from the queue.
+
+        Returns:
+            Job | None: The removed job, or None if no pending job has this id.
+        """
+        with self._lock:
+            for position, job in enumerate(self._jobs):
+                if job.job_id == job_id:
+                    self._cpu_jobs -= job.required_gpus == 0
+                    return self._jobs.pop(position)
+        return None
+
+    def empty(self) -> bool:
+        """Whether there is no pending job."""
+        return not self._jobs
+
+    def __len__(self) -> int:
+        """Get the number of pending jobs."""
+        return len(self._jobs)
+
+    def now(self) -> float:
+        """Get the current time on the clock of the queue."""
+        return self.clock.now() if self.clock is not None else time.monotonic()
+
+    @property
+    def cpu_jobs(self) -> int:
+        """The number of pending jobs which need no GPU, they can be started while every GPU is busy."""
+        return self._cpu_jobs
+
+    def __iter__(self) -> Iterator[Job]:
+        """Iterate over a snapshot of the pending jobs in scheduling order."""
+        with self._lock:
+            return iter(list(self._jobs))
+
+    def schedule(
+        self,
+        free_gpus: list[int],
+        topology: Topology | None = None,
+        shared: dict[int, GPUShare] | None = None,
+        releases: dict[int, float] | None = None,
+        estimate: Callable[[Job], float | None] | None = None,
+    ) -> list[tuple[Job, list[int]]]:
+        """Pack the pending jobs onto the free GPUs and remove the placed jobs from the queue.
+
+        Jobs with a required memory are packed best-fit onto the GPUs with the least room that still fits them, so
+        several of them share one GPU and the free GPUs are kept whole for as long as possible.
+
+        Args:
+            free_gpus (list[int]): The indices of the free GPUs.
+            topology (Topology | None): Assign the best-connected free GPUs to multi-GPU jobs. If None, the free GPUs
+                are assigned in order.
+            shared (dict[int, GPUShare] | None): The room of the GPUs which accept memory-sized jobs, by GPU index.
+                If None, memory-sized jobs take whole free GPUs.
+            releases (dict[int, float] | None): The seconds until the busy GPUs are expected to be free, by GPU index,
+                GPUs whose release cannot be predicted are left out. If None, or if the GPUs of a starving job cannot
+                be predicted, the starving job blocks all jobs behind it.
+            estimate (Callable[[Job], float | None] | None): Predict the runtime of a job in seconds, None if it cannot
+                be predicted. Jobs without a prediction are only backfilled onto GPUs which are not reserved.
+
+        Returns:
+            list[tuple[Job, list[int]]]: The placed jobs with their assigned GPU indices.
+        """
+        free = list(free_gpus)
+        if shared is not None:
+            shared = {i: GPUShare(share.memory, share.slots) for i, share in shared.items()}
+        placements = []
+        waiting = []
+        last_placed = -1
+        # When the reservation of the first waiting job starts, in seconds from now, and its GPUs
+        reservation: tuple[float, set[int]] | None = None
+        now = self.now()
+        with self._lock:
+            for position, job in enumerate(self._jobs):
+                if job.required_gpus and not free and not (shared and any(share.slots for share in shared.values())):
+                    if not self._cpu_jobs:
+                        break
+                    # Only the jobs which need no GPU can still be started
+                    continue
+                if job.not_before > now:
+                    # A failed job backing off neither runs nor holds up the jobs behind it
+                    continue
+
+                allowed_free, allowed_shared = free, shared
+                if reservation is not None:
+                    start, reserved = reservation
+                    runtime = estimate(job) if estimate is not None else None
+                    if runtime is None or runtime > start:
+                        # The job would still run when the reservation starts, it must keep off the reserved GPUs
+                        allowed_free = [i for i in free if i not in reserved]
+                        if shared is not None:
+                            allowed_shared = {i: share for i, share in shared.items() if i not in reserved}
+
+                assigned = self._place(job, allowed_free, topology, allowed_shared)
+                if assigned is not None:
+                    placements.append((job, assigned))
+                    free = [i for i in free if i not in assigned]
+                    if shared is not None and job.required_memory is None:
+                        for i in assigned:
+                            shared.pop(i, None)
+                    last_placed = position
+                    continue
+
+                waiting.append((position, job))
+                if job.overtaken < self.starvation_limit:
+                    continue
+                if reservation is None and releases is not None and (job.required_memory is None or shared is None):
+                    reservation = self._reserve(job, free, topology, releases)
+                    if reservation is not None:
+                        # Only the jobs which would delay the starving job are held back
+                        continue
+                # Reserve the GPUs for the starving job, nothing behind it may start
+                break
+
+            for position, job in waiting:
+                if position < last_placed:
+                    job.overtaken += 1
+
+            placed = {job.job_id for job, _ in placements}
+            self._jobs = [job for job in self._jobs if job.job_id not in placed]
+            self._cpu_jobs -= sum(job.required_gpus == 0 for job, _ in placements)
+
+        return placements
+
+    def backing_off(self) -> int:
+        """Get the number of failed jobs which are still backing off before their retry."""
+        now = self.now()
+        with self._lock:
+            return sum(job.not_before > now for job in self._jobs)
+
+    def next_ready_in(self) -> float | None:
+        """Get the seconds until the first failed job is done backing off, or None if no job is backing off."""
+        now = self.now()
+        with self._lock:
+            waits = [job.not_before - now for job in self._jobs if job.not_before > now]
+        return min(waits) if waits else None
+
+    @staticmethod
+    def _reserve(
+        job: Job, free: list[int], topology: Topology | None, releases: dict[int, float]
+    ) -> tuple[float, set[int]] | None:
+        """Find the earliest time at which a job taking whole GPUs fits, and the GPUs it would get then."""
+        available = list(free)
+        for start, index in sorted((start, i) for i, start in releases.items() if i not in free):
+            available.append(index)
+            if len(available) < job.required_gpus:
+                continue
+            if topology is None:
+                # Reserve the GPUs which are busy now rather than free ones, the free ones are left for backfilling
+                return start, set(available[::-1][: job.required_gpus])
+            gpus = topology.best_subset(sorted(available), job.required_gpus)
+            if gpus is not None:
+                return start, set(gpus)
+        return None
+
+    @staticmethod
+    def _place(
+        job: Job, free: list[int], topology: Topology | None, shared: dict[int, GPUShare] | None
+    ) -> list[int] | None:
+        if job.required_memory is not None and shared is not None:
+            fitting = [i for i, share in shared.items() if share.slots > 0 and share.memory >= job.required_memory]
+            if len(fitting) < job.required_gpus:
+                return None
+
+            # Pack the jobs tightly, a job on several GPUs takes the best-connected ones of one host
+            fitting.sort(key=lambda i: (shared[i].memory, i))
+            if topology is not None:
+                assigned = topology.best_subset(fitting, job.required_gpus)
+                if assigned is None:
+                    return None
+            else:
+                assigned = fitting[: job.required_gpus]
+            for i in assigned:
+                shared[i].memory -= job.required_memory
+                shared[i].slots -= 1
+            return assigned
+
+        if job.required_gpus > len(free):
+            return None
+
+        assigned = topology.best_subset(free, job.required_gpus) if topology is not None else free[: job.required_gpus]
+        if assigned is None:
+            return None
+        if shared is not None:
+            for i in assigned:
+                shared.pop(i, None)
+        return assigned
@@ -0,0 +1,291 @@
+import contextlib
+import json
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from gpusitter.jobs import Job, skip_job_ids
+from gpusitter.logger import console
+
+
+def job_to_record(job: Job) -> dict[str, Any]:
+    """Serialize the fields of a job which survive a restart."""
+    return {
+        "id": job.job_id,
+        "cmd": job.cmd,
+        "gpus": job.required_gpus,
+        "memory": job.required_memory,
+        "priority": job.priority,
+        "max_retries": job.max_retries,
+        "retries": job.retry_count,
+        "after": job.after,
+    }
+
+
+def job_from_record(record: dict[str, Any]) -> Job:
+    """Rebuild a job serialized by `job_to_record`."""
+    job = Job(
+        record["cmd"],
+        required_gpus=record["gpus"],
+        max_retries=record["max_retries"],
+        priority=record["priority"],
+        required_memory=record["memory"],
+        job_id=record["id"],
+        # Journals written before dependencies existed have none
+        after=record.get("after"),
+    )
+    job.retry_count = record["retries"]
+    return job
+
+
+@dataclass
+class StreamState:
+    """A job stream recovered from a journal, see `JobStream`."""
+
+    key: int
+    source: dict[str, Any]
+    # The number of jobs read from the stream
+    position: int
+    # The ids of the live jobs read from the stream, by their position in it
+    jobs: dict[int, int] = field(default_factory=dict)
+
+
+@dataclass
+class JournalState:
+    """The jobs recovered from a journal."""
+
+    pending: list[Job]
+    # The running jobs with their assigned GPUs
+    running: list[tuple[Job, list[int]]]
+    # The job streams which were not read to the end, in the order they were submitted
+    streams: list[StreamState] = field(default_factory=list)
+
+
+class Journal:
+    """Persist the pending and running jobs in an append-only JSONL journal.
+
+    Every change is one record: `submit` and `requeue` make a job pending, `start` marks it running on its GPUs and
+    `end` forgets it. A job stream is recorded by `stream` with its source, `read` moves its position, which the
+    `submit` records of its jobs do too, and `drained` forgets it. `ids` keeps the highest job id ever issued, so the
+    ids of ended jobs are not issued again after a compaction. Replaying the records rebuilds the state, and applying a
+    record twice does no harm. The records are written and fsynced in batches by a background thread. Once the journal
+    holds many more records than live jobs, it is compacted into one record per live job and atomically swapped in.
+    """
+
+    def __init__(self, path: str | Path, flush_interval: float = 0.1, compact_threshold: int = 10000) -> None:
+        """Open the journal, the records are only appended after `load`.
+
+        Args:
+            path (str | Path): The path of the journal, its directory is created if needed.
+            flush_interval (float): The seconds to collect records before writing them in one batch.
+            compact_threshold (int): Compact once this many records were written, and they are more than twice the
+                number of live jobs.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.compact_threshold = compact_threshold
+
+        # The live jobs as the records which recreate them, by job id
+        self._live: dict[int, dict[str, Any]] = {}
+        # The job streams which are not drained as their source and position, by key
+        self._streams: dict[int, dict[str, Any]] = {}
+        self._next_stream = 0
+        # The highest job id ever submitted, ended jobs included
+        self._last_id = 0
+        self._records = 0
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[str | None] = queue.Queue()
+        self._file = None
+        self._worker: threading.Thread | None = None
+
+    def load(self) -> JournalState:
+        """Replay the journal, compact it and start appending to it.
+
+        Returns:
+            JournalState: The jobs which were pending or running when the journal was last written.
+        """
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        # A torn last record of a crash
+                        console.log(f"[yellow]Skipping a damaged record in the journal {self.path}[/yellow]")
+
+        self._compact()
+        self._worker = threading.Thread(target=self._run, name="gpusitter-journal", daemon=True)
+        self._worker.start()
+
+        pending = []
+        running = []
+        streams = {key: StreamState(key, stream["source"], stream["position"]) for key, stream in self._streams.items()}
+        for record in self._live.values():
+            job = job_from_record(record["job"])
+            if "gpus" in record:
+                running.append((job, record["gpus"]))
+            else:
+                pending.append(job)
+            if "stream" in record and record["stream"][0] in streams:
+                key, position = record["stream"]
+                streams[key].jobs[position] = job.job_id
+        if self._last_id:
+            skip_job_ids(self._last_id)
+        return JournalState(pending, running, list(streams.values()))
+
+    def submitted(self, job: Job, stream: tuple[int, int] | None = None) -> None:
+        """Record a new pending job, read from the stream at the given key and position if there is one."""
+        record = {"op": "submit", "job": job_to_record(job)}
+        if stream is not None:
+            record["stream"] = list(stream)
+        self._append(record)
+
+    def streamed(self, source: dict[str, Any]) -> int:
+        """Record a new job stream.
+
+        Returns:
+            int: The key of the stream.
+        """
+        with self._lock:
+            key = self._next_stream
+            self._next_stream += 1
+        self._append({"op": "stream", "id": key, "source": source})
+        return key
+
+    def read(self, key: int, position: int) -> None:
+        """Record how many jobs were read from a stream."""
+        self._append({"op": "read", "id": key, "position": position})
+
+    def drained(self, key: int) -> None:
+        """Record that a stream was read to the end, or dropped."""
+        self._append({"op": "drained", "id": key})
+
+    def started(self, job: Job, gpus: list[int]) -> None:
+        """Record that a job was launched on the given GPUs."""
+        self._append({"op": "start", "id": job.job_id, "gpus": list(gpus), "time": time.time()})
+
+    def requeued(self, job: Job) -> None:
+        """Record that a job went back into the queue, e.g. after a failed start, with its raised requirements."""
+        self._append({"op": "requeue", "id": job.job_id, "retries": job.retry_count, "job": job_to_record(job)})
+
+    def ended(self, job: Job) -> None:
+        """Record that a job is gone for good: it exited, was cancelled or discarded."""
+        self._append({"op": "end", "id": job.job_id})
+
+    def __len__(self) -> int:
+        """Get the number of live jobs."""
+        return len(self._live)
+
+    def close(self) -> None:
+        """Write the remaining records and close the journal."""
+        if self._worker is None or not self._worker.is_alive():
+            return
+
+        self._queue.put(None)
+        self._worker.join()
+
+    def _apply(self, record: dict[str, Any]) -> None:
+        op = record["op"]
+        if op == "submit":
+            self._live[record["job"]["id"]] = {"job": record["job"]}
+            self._last_id = max(self._last_id, record["job"]["id"])
+            if "stream" in record:
+                key, position = record["stream"]
+                self._live[record["job"]["id"]]["stream"] = [key, position]
+                self._read(key, position + 1)
+        elif op == "ids":
+            self._last_id = max(self._last_id, record["last"])
+        elif op == "stream":
+            self._streams[record["id"]] = {"source": record["source"], "position": record.get("position", 0)}
+            self._next_stream = max(self._next_stream, record["id"] + 1)
+        elif op == "read":
+            self._read(record["id"], record["position"])
+        elif op == "drained":
+            self._streams.pop(record["id"], None)
+        elif op == "start":
+            if record["id"] in self._live:
+                self._live[record["id"]]["gpus"] = record["gpus"]
+        elif op == "requeue":
+            live = self._live.get(record["id"])
+            if live is not None:
+                live.pop("gpus", None)
+                # Journals written before the whole job was recorded only know the retries
+                live["job"] = {**live["job"], **record.get("job", {}), "retries": record["retries"]}
+        elif op == "end":
+            self._live.pop(record["id"], None)
+        else:
+            raise ValueError(f"Unknown journal record {op!r}")
+
+    def _read(self, key: int, position: int) -> None:
+        stream = self._streams.get(key)
+        if stream is not None:
+            stream["position"] = max(stream["position"], position)
+
+    def _append(self, record: dict[str, Any]) -> None:
+        with self._lock:
+            self._apply(record)
+        self._queue.put(json.dumps(record))
+
+    def _compact(self) -> None:
+        with self._lock:
+            lines = [json.dumps({"op": "ids", "last": self._last_id})] if self._last_id else []
+            lines += [
+                json.dumps({"op": "stream", "id": key, "source": stream["source"], "position": stream["position"]})
+                for key, stream in self._streams.items()
+            ]
+            for live in self._live.values():
+                submit = {"op": "submit", "job": live["job"]}
+                # The jobs of a drained stream are on their own
+                if "stream" in live and live["stream"][0] in self._streams:
+                    submit["stream"] = live["stream"]
+                lines.append(json.dumps(submit))
+                if "gpus" in live:
+                    lines.append(json.dumps({"op": "start", "id": live["job"]["id"], "gpus": live["gpus"]}))
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.writelines(line + "\n" for line in lines)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._file is not None:
+            self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a")  # noqa: SIM115
+        self._records = len(lines)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            line = self._queue.get()
+            if line is None:
+                break
+
+            batch = [line]
+            deadline = time.monotonic() + self.flush_interval
+            while (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    line = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if line is None:
+                    stopping = True
+                    break
+                batch.append(line)
+
+            try:
+                self._file.writelines(line + "\n" for line in batch)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._records += len(batch)
+                if self._records >= self.compact_threshold and self._records > 2 * len(self._live):
+                    self._compact()
+            except OSError as e:
+                console.log(f"[red]Failed to write the journal {self.path}: {e}[/red]")
+
+        with contextlib.suppress(OSError):
+            self._file.close()
@@ -0,0 +1,822 @@
+import contextlib
+import os
+import queue
+import re
+import select
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from gpusitter.jobs import Job
+
+# The number of lines of the output of a failed job which are kept, e.g. to classify the failure
+OUTPUT_LINES = 50
+
+# Run the job in a shell of its own and write its exit status. The trap keeps the outer shell alive on SIGTERM, which
+# the job gets too, until the job exited, a handled signal is reset for the job while an ignored one would stick
+_STATUS_WRAPPER = 'trap : TERM; sh -c "$1"; rc=$?; echo $rc > "$2"; exit $rc'
+
+
+class LaunchError(RuntimeError):
+    """The launcher itself failed to start a job, e.g. tmux could not create its window, so the job never ran."""
+
+
+@dataclass
+class LaunchEvent:
+    """A change in the state of a launched job.
+
+    The kind is one of:
+        - started: the job is still running after the grace period, or exited successfully within it.
+        - failed: the job exited with an error within the grace period.
+        - exited: the job exited after it was started, see the return code. The return code is None if the job
+          vanished without an exit status, e.g. its tmux window was killed.
+        - cancelled: the job was cancelled through the launcher.
+        - error: the launcher failed to start the job, which never ran. The output carries the reason.
+
+    A `started` event carries the seconds from the launch until the job ran, e.g. its tmux window existed, if known.
+    A `failed` or `exited` event of a job which exited with an error carries the last lines of its output, if known.
+    """
+
+    job: Job
+    gpus: list[int]
+    kind: str
+    returncode: int | None = None
+    latency: float | None = field(default=None, compare=False)
+    output: str | None = field(default=None, compare=False)
+
+
+def job_window_name(job: Job) -> str:
+    """Get the name of the tmux window of a job, it finds the window again after a restart."""
+    return f"gpusitter_{job.job_id}"
+
+
+def worker(
+    gpu_indices: list[int], job: Job, status_file: Path, notify_fifo: Path | None = None, pid_file: Path | None = None
+) -> str | None:
+    """Run a job on assigned GPUs in tmux.
+
+    The exit status of the job is written to the status file and, if given, announced on the notification FIFO as
+    `<job_id> <exit status>`. If a pid file is given, the job runs in a process of its own whose pid is written to it,
+    so the process exits together with the job rather than staying around with the shell of the window.
+
+    Returns:
+        str | None: The id of the tmux pane the job runs in.
+
+    Raises:
+        LaunchError: If tmux cannot be run or fails to create the window.
+    """
+    gpu_str = ",".join(map(str, gpu_indices))
+
+    window_name = job_window_name(job)
+    raw_name = job.cmd.replace(" ", "_")
+    safe_name = re.sub(r"\W+", "_", raw_name)
+    session_name = f"GPUSitter_{safe_name}"
+
+    env = os.environ.copy()
+
+    # The notification runs in the background so a FIFO without a reader never blocks the window
+    status = shlex.quote(str(status_file))
+    fifo = shlex.quote(str(notify_fifo)) if notify_fifo else None
+    notify = f"[ -p {fifo} ] && (echo {job.job_id} $rc > {fifo} &); " if fifo else ""
+    run = job.cmd
+    if pid_file is not None:
+        # sh records its pid and replaces itself with the shell running the job
+        record = """'echo $$ > "$0"; exec "${SHELL:-sh}" -c "$1"'"""
+        run = f"sh -c {record} {shlex.quote(str(pid_file))} {shlex.quote(job.cmd)}"
+    window_cmd = f"{run}; rc=$?; echo $rc > {status}; {notify}exec bash"
+
+    try:
+        exists = (
+            subprocess.run(  # noqa: S603
+                ["tmux", "has-session", "-t", session_name],  # noqa: S607
+                check=False,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            ).returncode
+            == 0
+        )
+        if exists:
+            tmux_cmd = ["tmux", "new-window", "-P", "-F", "#{pane_id}", "-t", session_name, "-n", window_name]
+        else:
+            tmux_cmd = ["tmux", "new-session", "-P", "-F", "#{pane_id}", "-d", "-s", session_name, "-n", window_name]
+        tmux_cmd += ["-e", f"CUDA_VISIBLE_DEVICES={gpu_str}", window_cmd]
+        result = subprocess.run(tmux_cmd, check=False, env=env, cwd=os.getcwd(), capture_output=True, text=True)  # noqa: S603
+    except OSError as e:
+        raise LaunchError(f"Failed to run tmux: {e}") from e
+    if result.returncode != 0:
+        raise LaunchError(f"tmux exited with status {result.returncode}: {result.stderr.strip()}")
+    return result.stdout.strip() or None
+
+
+def alive_panes() -> set[str] | None:
+    """Get the ids of all tmux panes, or None if tmux cannot be asked."""
+    try:
+        result = subprocess.run(
+            ["tmux", "list-panes", "-a", "-F", "#{pane_id}"],  # noqa S607
+            check=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+    except OSError:
+        return None
+
+    # tmux fails when there is no server at all, i.e. no pane is alive
+    return set(result.stdout.split()) if result.returncode == 0 else set()
+
+
+def find_pane(window_name: str) -> str | None:
+    """Get the id of the pane of the tmux window with the given name, or None if there is no such window."""
+    try:
+        result = subprocess.run(
+            ["tmux", "list-panes", "-a", "-F", "#{window_name} #{pane_id}"],  # noqa S607
+            check=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+    except OSError:
+        return None
+
+    for line in result.stdout.splitlines():
+        name, _, pane = line.partition(" ")
+        if name == window_name:
+            return pane
+    return None
+
+
+def capture_pane(pane: str, lines: int = OUTPUT_LINES) -> str | None:
+    """Get the last lines of a tmux pane, or None if the pane is gone."""
+    result = subprocess.run(  # noqa: S603
+        ["tmux", "capture-pane", "-p", "-J", "-S", f"-{lines}", "-t", pane],  # noqa S607
+        check=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    return result.stdout if result.returncode == 0 else None
+
+
+def read_tail(path: Path, lines: int = OUTPUT_LINES, max_bytes: int = 64 * 1024) -> str | None:
+    """Get the last lines of a file without reading all of it, or None if it cannot be read."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(f.seek(0, os.SEEK_END) - max_bytes, 0))
+            data = f.read()
+    except OSError:
+        return None
+    return "\n".join(data.decode(errors="replace").splitlines()[-lines:])
+
+
+def kill_pane(pane: str) -> None:
+    """Kill a tmux pane and the job running in it."""
+    subprocess.run(  # noqa: S603
+        ["tmux", "kill-pane", "-t", pane],  # noqa S607
+        check=False,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def pidfd_open(pid: int) -> int | None:
+    """Open a pidfd of a process, it becomes readable once the process exits.
+
+    Returns:
+        int | None: The pidfd, or None if the platform has no pidfds.
+
+    Raises:
+        ProcessLookupError: If there is no such process.
+    """
+    if not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except ProcessLookupError:
+        raise
+    except OSError:
+        return None
+
+
+def process_start_time(pid: int) -> str | None:
+    """Get the start time of a process in clock ticks since boot, or None if it has exited.
+
+    The start time tells a process apart from a later one which reuses its pid.
+    """
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    # The command name in parentheses may contain spaces, the state and the start time are the 1st and 20th field
+    # after it. A zombie has exited and only waits for its parent to collect it.
+    fields = stat.rpartition(")")[2].split()
+    return fields[19] if fields[0] != "Z" else None
+
+
+def rotate_log(path: Path, backups: int) -> None:
+    """Rotate a log file which a job keeps appending to, to `<path>.1` and the older backups up to `<path>.<backups>`.
+
+    The log is copied and then truncated rather than renamed, since the job holds it open. Whatever the job writes
+    between the copy and the truncation is lost.
+    """
+    for i in range(backups - 1, 0, -1):
+        backup = path.with_name(f"{path.name}.{i}")
+        if backup.exists():
+            os.replace(backup, path.with_name(f"{path.name}.{i + 1}"))
+    if backups > 0:
+        shutil.copyfile(path, path.with_name(f"{path.name}.1"))
+    os.truncate(path, 0)
+
+
+class Launcher(ABC):
+    """Launch jobs without blocking the scheduler and report their state as `LaunchEvent`."""
+
+    @abstractmethod
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Dispatch a job onto the given GPUs and return immediately."""
+
+    @abstractmethod
+    def poll(self) -> list[LaunchEvent]:
+        """Get the launch events which happened since the last poll."""
+
+    @abstractmethod
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Follow a job which was launched before a restart, its `exited` event follows."""
+
+    @abstractmethod
+    def cancel(self, job_id: int) -> bool:
+        """Stop a launched job, its `cancelled` event follows.
+
+        Returns:
+            bool: Whether the job was being tracked.
+        """
+
+    def pid(self, job_id: int) -> int | None:
+        """Get the pid of a process which runs exactly as long as a launched job, None if it is not known (yet)."""
+        return None
+
+    def close(self) -> None:  # noqa: B027
+        """Stop tracking the launched jobs, a hook which does nothing by default."""
+
+
+@dataclass
+class _Launch:
+    job: Job
+    gpus: list[int]
+    # The confirmation deadline, None once the job is confirmed as started
+    deadline: float | None
+    pane: str | None = None
+    launched_at: float = field(default_factory=time.monotonic)
+    # The seconds until the job ran, once it does
+    latency: float | None = None
+
+    def started(self) -> LaunchEvent:
+        return LaunchEvent(self.job, self.gpus, "started", latency=self.latency)
+
+
+class _TrackingLauncher(Launcher):
+    """Track the launched jobs through their grace period and turn their exits into launch events."""
+
+    def __init__(self, on_event: Callable[[], None] | None, grace_period: float) -> None:
+        self.on_event = on_event
+        self.grace_period = grace_period
+
+        self._events: queue.Queue[LaunchEvent] = queue.Queue()
+        self._launches: dict[int, _Launch] = {}
+        self._lock = threading.Lock()
+
+    def poll(self) -> list[LaunchEvent]:
+        """Get the launch events which happened since the last poll."""
+        events = []
+        with contextlib.suppress(queue.Empty):
+            while True:
+                events.append(self._events.get_nowait())
+        return events
+
+    @property
+    def pending(self) -> int:
+        """The number of launched jobs which are neither confirmed nor failed yet."""
+        with self._lock:
+            return sum(1 for launch in self._launches.values() if launch.deadline is not None)
+
+    def _confirm_due(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                launch for launch in self._launches.values() if launch.deadline is not None and launch.deadline <= now
+            ]
+            for launch in due:
+                launch.deadline = None
+                self._events.put(launch.started())
+        if due and self.on_event is not None:
+            self.on_event()
+
+    def _finish(self, job_id: int, returncode: int | None) -> None:
+        with self._lock:
+            launch = self._launches.pop(job_id, None)
+            if launch is None:
+                return
+            self._forget(launch.job)
+
+        # Only failures are worth the output, e.g. to tell running out of memory from a typo
+        output = self._output(launch) if returncode not in (0, None) else None
+        job, gpus = launch.job, launch.gpus
+        if launch.deadline is None:
+            self._events.put(LaunchEvent(job, gpus, "exited", returncode, output=output))
+        elif returncode == 0:
+            self._events.put(launch.started())
+            self._events.put(LaunchEvent(job, gpus, "exited", returncode))
+        else:
+            self._events.put(LaunchEvent(job, gpus, "failed", returncode, output=output))
+        if self.on_event is not None:
+            self.on_event()
+
+    def _error(self, job_id: int, message: str) -> None:
+        """Report a job which the launcher failed to start."""
+        with self._lock:
+            launch = self._launches.pop(job_id, None)
+            if launch is None:
+                return
+            self._forget(launch.job)
+
+        self._events.put(LaunchEvent(launch.job, launch.gpus, "error", output=message))
+        if self.on_event is not None:
+            self.on_event()
+
+    def _forget(self, job: Job) -> None:
+        """Clean up after a job which exited, called with the lock held."""
+
+    def _output(self, launch: _Launch) -> str | None:
+        """Get the last lines of the output of a job which exited, None if they are unknown."""
+        return None
+
+
+class TmuxLauncher(_TrackingLauncher):
+    """Launch jobs in tmux from a thread pool and track them through a notification FIFO."""
+
+    def __init__(
+        self,
+        on_event: Callable[[], None] | None = None,
+        grace_period: float = 60.0,
+        max_workers: int = 8,
+        liveness_interval: float = 10.0,
+        status_dir: str | Path | None = None,
+    ) -> None:
+        """Initialize the launcher and start watching the notification FIFO.
+
+        Args:
+            on_event (Callable[[], None] | None): Called from a background thread whenever new events are available,
+                e.g. to wake the scheduler up.
+            grace_period (float): The seconds a job has to keep running before it is confirmed as started.
+            max_workers (int): The number of tmux invocations which may run at the same time.
+            liveness_interval (float): The seconds between two checks for tmux panes which were killed.
+            status_dir (str | Path | None): The directory of the status files and the notification FIFO, which is kept
+                so that a later launcher can attach to the running jobs. If None, a temporary directory is used.
+        """
+        super().__init__(on_event, grace_period)
+        self.liveness_interval = liveness_interval
+
+        self.persistent = status_dir is not None
+        if status_dir is not None:
+            self.status_dir = Path(status_dir)
+            self.status_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            self.status_dir = Path(tempfile.mkdtemp(prefix="gpusitter_"))
+        self.fifo = self.status_dir / "exit.fifo"
+        if not self.fifo.is_fifo():
+            self.fifo.unlink(missing_ok=True)
+            os.mkfifo(self.fifo)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gpusitter-launch")
+        self._next_liveness_check = time.monotonic() + liveness_interval
+
+        self._fifo_fd = os.open(self.fifo, os.O_RDWR | os.O_NONBLOCK)
+        self._wake_r, self._wake_w = os.pipe()
+        self._closed = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, name="gpusitter-watch", daemon=True)
+        self._watcher.start()
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Dispatch a job onto the given GPUs, tmux runs in a worker thread."""
+        with self._lock:
+            self._launches[job.job_id] = _Launch(job, list(gpus), time.monotonic() + self.grace_period)
+        self._executor.submit(self._run, job, list(gpus))
+        os.write(self._wake_w, b"\0")
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Follow a job launched into the same status directory before a restart.
+
+        A job which exited meanwhile is reported with the exit status from its status file, a job whose tmux window
+        is gone without a status file as vanished.
+        """
+        launch = _Launch(job, list(gpus), None, find_pane(job_window_name(job)))
+        with self._lock:
+            self._launches[job.job_id] = launch
+
+        status_file = self._status_file(job)
+        if status_file.exists():
+            try:
+                returncode = int(status_file.read_text().strip())
+            except ValueError:
+                returncode = None
+            self._finish(job.job_id, returncode)
+        elif launch.pane is None:
+            self._finish(job.job_id, None)
+        os.write(self._wake_w, b"\0")
+
+    def cancel(self, job_id: int) -> bool:
+        """Kill the tmux pane of a launched job, a pane which is still being created is killed once it exists."""
+        with self._lock:
+            launch = self._launches.pop(job_id, None)
+            if launch is None:
+                return False
+            self._events.put(LaunchEvent(launch.job, launch.gpus, "cancelled"))
+
+        if launch.pane is not None:
+            kill_pane(launch.pane)
+        if self.on_event is not None:
+            self.on_event()
+        return True
+
+    def close(self) -> None:
+        """Stop the watcher and remove a temporary notification FIFO, running jobs are left alone."""
+        if self._closed.is_set():
+            return
+
+        self._closed.set()
+        os.write(self._wake_w, b"\0")
+        self._watcher.join()
+        self._executor.shutdown(wait=True)
+        for fd in (self._fifo_fd, self._wake_r, self._wake_w):
+            os.close(fd)
+        if self.persistent:
+            # Jobs still running announce their exit to the next launcher on this directory
+            return
+        # Jobs still running write their status file later, so only an empty status directory is removed
+        self.fifo.unlink(missing_ok=True)
+        with contextlib.suppress(OSError):
+            self.status_dir.rmdir()
+
+    def pid(self, job_id: int) -> int | None:
+        """Get the pid of the process of a job, which its window records once it runs."""
+        with self._lock:
+            launch = self._launches.get(job_id)
+        if launch is None:
+            return None
+        try:
+            return int(self._pid_file(launch.job).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _status_file(self, job: Job) -> Path:
+        return self.status_dir / f"job_{job.job_id}_retry{job.retry_count}.status"
+
+    def _pid_file(self, job: Job) -> Path:
+        return self.status_dir / f"job_{job.job_id}.pid"
+
+    def _run(self, job: Job, gpus: list[int]) -> None:
+        try:
+            pane = worker(gpus, job, self._status_file(job), self.fifo, self._pid_file(job))
+        except Exception as e:
+            # A broken tmux is no failure of the job
+            self._error(job.job_id, str(e))
+            return
+
+        with self._lock:
+            launch = self._launches.get(job.job_id)
+            cancelled = launch is None
+            if not cancelled:
+                launch.pane = pane
+                launch.latency = time.monotonic() - launch.launched_at
+        if cancelled and pane is not None:
+            kill_pane(pane)
+
+    def _watch(self) -> None:
+        buffer = b""
+        while not self._closed.is_set():
+            ready, _, _ = select.select([self._fifo_fd, self._wake_r], [], [], self._next_timeout())
+            if self._wake_r in ready:
+                os.read(self._wake_r, 1024)
+            if self._fifo_fd in ready:
+                with contextlib.suppress(BlockingIOError):
+                    buffer += os.read(self._fifo_fd, 4096)
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    with contextlib.suppress(ValueError):
+                        job_id, returncode = map(int, line.split())
+                        self._finish(job_id, returncode)
+            self._confirm_due()
+            self._check_liveness()
+
+    def _next_timeout(self) -> float | None:
+        with self._lock:
+            deadlines = [launch.deadline for launch in self._launches.values() if launch.deadline is not None]
+            if any(launch.pane is not None for launch in self._launches.values()):
+                deadlines.append(self._next_liveness_check)
+        return max(min(deadlines) - time.monotonic(), 0.0) if deadlines else None
+
+    def _check_liveness(self) -> None:
+        if time.monotonic() < self._next_liveness_check:
+            return
+        self._next_liveness_check = time.monotonic() + self.liveness_interval
+
+        with self._lock:
+            watched = [job_id for job_id, launch in self._launches.items() if launch.pane is not None]
+        if not watched:
+            return
+
+        panes = alive_panes()
+        if panes is None:
+            return
+
+        for job_id in watched:
+            with self._lock:
+                launch = self._launches.get(job_id)
+            # The pane is gone without an exit status, e.g. the window was killed
+            if launch is not None and launch.pane not in panes:
+                self._finish(job_id, None)
+
+    def _forget(self, job: Job) -> None:
+        self._pid_file(job).unlink(missing_ok=True)
+        if self.persistent:
+            self._status_file(job).unlink(missing_ok=True)
+
+    def _output(self, launch: _Launch) -> str | None:
+        # The window keeps a shell open after the job exits, so its output is still there
+        return capture_pane(launch.pane) if launch.pane is not None else None
+
+
+@dataclass
+class _Process:
+    pid: int
+    # None for a job which was launched before a restart, it is no child of ours so its status file tells its exit
+    popen: subprocess.Popen | None
+    pidfd: int | None
+    # The time at which a cancelled job is killed if it ignored SIGTERM
+    kill_deadline: float | None = None
+
+
+class ProcessLauncher(_TrackingLauncher):
+    """Launch jobs as processes of their own, without tmux.
+
+    Every job runs `sh -c <cmd>` under a shell which writes its exit status to `job_<id>.status`, in a new session, so
+    it is its own process group, with `CUDA_VISIBLE_DEVICES` set to its GPUs. Its stdout and stderr are appended to
+    `job_<id>.log` in the log directory, which is rotated once it exceeds `max_log_bytes`. The exit is noticed through
+    a pidfd as soon as it happens and its status is collected with waitpid. Without pidfds the jobs are polled every
+    `check_interval`.
+
+    The jobs write their logs themselves and do not depend on the launcher, so they survive a restart of GPUSitter.
+    A pid file next to the log lets a later launcher attach to them, and learn their exit status from the status file.
+    """
+
+    def __init__(
+        self,
+        on_event: Callable[[], None] | None = None,
+        grace_period: float = 60.0,
+        log_dir: str | Path | None = None,
+        max_log_bytes: int = 100 * 1024**2,
+        log_backups: int = 3,
+        kill_timeout: float = 10.0,
+        check_interval: float = 10.0,
+    ) -> None:
+        """Initialize the launcher and start watching the jobs.
+
+        Args:
+            on_event (Callable[[], None] | None): Called from a background thread whenever new events are available,
+                e.g. to wake the scheduler up.
+            grace_period (float): The seconds a job has to keep running before it is confirmed as started.
+            log_dir (str | Path | None): The directory of the logs and pid files. If None, a temporary directory is
+                used.
+            max_log_bytes (int): The size above which a log is rotated, 0 to never rotate.
+            log_backups (int): The number of rotated logs which are kept.
+            kill_timeout (float): The seconds a cancelled job has to exit after SIGTERM before it is killed.
+            check_interval (float): The seconds between two checks of the log sizes.
+        """
+        super().__init__(on_event, grace_period)
+        self.max_log_bytes = max_log_bytes
+        self.log_backups = log_backups
+        self.kill_timeout = kill_timeout
+        self.check_interval = check_interval
+
+        if log_dir is not None:
+            self.log_dir = Path(log_dir)
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            self.log_dir = Path(tempfile.mkdtemp(prefix="gpusitter_logs_"))
+
+        # The processes by job id, including cancelled jobs which have not exited yet
+        self._processes: dict[int, _Process] = {}
+        self._next_check = time.monotonic() + check_interval
+
+        self._wake_r, self._wake_w = os.pipe()
+        self._closed = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, name="gpusitter-watch", daemon=True)
+        self._watcher.start()
+
+    def log_file(self, job: Job) -> Path:
+        """Get the log of a job, all its attempts append to it."""
+        return self.log_dir / f"job_{job.job_id}.log"
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Start a job on the given GPUs, a job whose process cannot be created is reported as an error."""
+        launch = _Launch(job, list(gpus), time.monotonic() + self.grace_period)
+        with self._lock:
+            self._launches[job.job_id] = launch
+
+        gpu_str = ",".join(map(str, gpus))
+        status_file = self._status_file(job)
+        try:
+            status_file.unlink(missing_ok=True)
+            with open(self.log_file(job), "ab") as log:
+                log.write(f"==> {job.cmd} on GPUs {gpu_str}, attempt {job.retry_count + 1}\n".encode())
+                log.flush()
+                popen = subprocess.Popen(  # noqa: S603
+                    ["/bin/sh", "-c", _STATUS_WRAPPER, "sh", job.cmd, str(status_file)],
+                    stdin=subprocess.DEVNULL,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True,
+                    env={**os.environ, "CUDA_VISIBLE_DEVICES": gpu_str},
+                )
+        except OSError as e:
+            # E.g. the log directory is not writable, the shell reports a command which cannot be run itself
+            self._error(job.job_id, f"Failed to start the job: {e}")
+            return
+
+        launch.latency = time.monotonic() - launch.launched_at
+        process = _Process(popen.pid, popen, pidfd_open(popen.pid))
+        with contextlib.suppress(OSError):
+            self._pid_file(job).write_text(f"{popen.pid} {process_start_time(popen.pid)}\n")
+        with self._lock:
+            self._processes[job.job_id] = process
+        os.write(self._wake_w, b"\0")
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Follow a job launched into the same log directory before a restart.
+
+        A job which exited meanwhile is reported with the exit status from its status file, a job which is gone without
+        a status file, e.g. since it was killed, without an exit status.
+        """
+        with self._lock:
+            self._launches[job.job_id] = _Launch(job, list(gpus), None)
+
+        try:
+            pid, start_time = self._pid_file(job).read_text().split()
+            # A pid which was reused by another process since does not count
+            if process_start_time(int(pid)) != start_time:
+                raise ProcessLookupError
+            process = _Process(int(pid), None, pidfd_open(int(pid)))
+        except (OSError, ValueError):
+            self._finish(job.job_id, self._read_status(job))
+            return
+
+        with self._lock:
+            self._processes[job.job_id] = process
+        os.write(self._wake_w, b"\0")
+
+    def cancel(self, job_id: int) -> bool:
+        """Terminate the process group of a launched job, it is killed if it is still alive after `kill_timeout`."""
+        with self._lock:
+            launch = self._launches.pop(job_id, None)
+            if launch is None:
+                return False
+            self._events.put(LaunchEvent(launch.job, launch.gpus, "cancelled"))
+            self._forget(launch.job)
+            process = self._processes.get(job_id)
+            if process is not None:
+                process.kill_deadline = time.monotonic() + self.kill_timeout
+
+        if process is not None:
+            self._signal(process, signal.SIGTERM)
+        os.write(self._wake_w, b"\0")
+        if self.on_event is not None:
+            self.on_event()
+        return True
+
+    def pid(self, job_id: int) -> int | None:
+        """Get the pid of the shell running a job, the leader of its process group."""
+        with self._lock:
+            process = self._processes.get(job_id)
+        return process.pid if process is not None else None
+
+    def close(self) -> None:
+        """Stop watching the jobs, running jobs are left alone."""
+        if self._closed.is_set():
+            return
+
+        self._closed.set()
+        os.write(self._wake_w, b"\0")
+        self._watcher.join()
+        with self._lock:
+            pidfds = [process.pidfd for process in self._processes.values() if process.pidfd is not None]
+        for fd in (*pidfds, self._wake_r, self._wake_w):
+            os.close(fd)
+
+    def _pid_file(self, job: Job) -> Path:
+        return self.log_dir / f"job_{job.job_id}.pid"
+
+    def _status_file(self, job: Job) -> Path:
+        return self.log_dir / f"job_{job.job_id}.status"
+
+    def _read_status(self, job: Job) -> int | None:
+        try:
+            return int(self._status_file(job).read_text().strip())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _signal(process: _Process, signum: int) -> None:
+        with contextlib.suppress(ProcessLookupError, PermissionError):
+            os.killpg(process.pid, signum)
+
+    def _watch(self) -> None:
+        while not self._closed.is_set():
+            with self._lock:
+                pidfds = {process.pidfd: job_id for job_id, process in self._processes.items() if process.pidfd}
+            ready, _, _ = select.select([*pidfds, self._wake_r], [], [], self._next_timeout())
+            if self._wake_r in ready:
+                os.read(self._wake_r, 1024)
+            for fd in ready:
+                if fd in pidfds:
+                    self._reap(pidfds[fd])
+            self._confirm_due()
+            self._kill_due()
+            self._check()
+
+    def _next_timeout(self) -> float | None:
+        with self._lock:
+            deadlines = [launch.deadline for launch in self._launches.values() if launch.deadline is not None]
+            deadlines += [p.kill_deadline for p in self._processes.values() if p.kill_deadline is not None]
+            if self._processes:
+                deadlines.append(self._next_check)
+        return max(min(deadlines) - time.monotonic(), 0.0) if deadlines else None
+
+    def _reap(self, job_id: int) -> None:
+        with self._lock:
+            process = self._processes.get(job_id)
+        if process is None:
+            return
+
+        if process.popen is not None:
+            returncode = process.popen.poll()
+            if returncode is None:
+                return
+            # Report a job killed by a signal like a shell does
+            if returncode < 0:
+                returncode = 128 - returncode
+        else:
+            if process_start_time(process.pid) is not None:
+                return
+            with self._lock:
+                launch = self._launches.get(job_id)
+            returncode = self._read_status(launch.job) if launch is not None else None
+
+        with self._lock:
+            self._processes.pop(job_id, None)
+        if process.pidfd is not None:
+            os.close(process.pidfd)
+        self._finish(job_id, returncode)
+
+    def _kill_due(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = [p for p in self._processes.values() if p.kill_deadline is not None and p.kill_deadline <= now]
+            for process in due:
+                process.kill_deadline = None
+        for process in due:
+            self._signal(process, signal.SIGKILL)
+
+    def _check(self) -> None:
+        if time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_interval
+
+        with self._lock:
+            processes = dict(self._processes)
+            jobs = [launch.job for launch in self._launches.values()]
+        for job_id, process in processes.items():
+            if process.pidfd is None:
+                self._reap(job_id)
+
+        if self.max_log_bytes <= 0:
+            return
+        for job in jobs:
+            path = self.log_file(job)
+            with contextlib.suppress(OSError):
+                if path.stat().st_size > self.max_log_bytes:
+                    rotate_log(path, self.log_backups)
+
+    def _forget(self, job: Job) -> None:
+        self._pid_file(job).unlink(missing_ok=True)
+        self._status_file(job).unlink(missing_ok=True)
+
+    def _output(self, launch: _Launch) -> str | None:
+        return read_tail(self.log_file(launch.job))
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from gpusitter.jobs import Job
+
+
+@dataclass
+class JobRecord:
+    """The GPUs assigned to a launched job and its outcome."""
+
+    job: Job
+    gpus: list[int]
+    started_at: float
+    ended_at: float | None = None
+    returncode: int | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the job has not exited yet."""
+        return self.ended_at is None
+
+
+class GPULedger:
+    """Reserve the GPUs of launched jobs until the jobs exit.
+
+    A freshly launched job may not have allocated any memory yet, so its GPUs still look free to NVML. The ledger
+    keeps them out of the free GPUs until the job is gone.
+    """
+
+    def __init__(self, history_size: int = 1000) -> None:
+        """Initialize the ledger.
+
+        Args:
+            history_size (int): The number of finished jobs to keep records of.
+        """
+        self.history: deque[JobRecord] = deque(maxlen=history_size)
+
+        self._running: dict[int, JobRecord] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Get the number of running jobs."""
+        return len(self._running)
+
+    @property
+    def running(self) -> list[JobRecord]:
+        """The records of the running jobs."""
+        with self._lock:
+            return list(self._running.values())
+
+    def reserve(self, job: Job, gpus: list[int]) -> JobRecord:
+        """Reserve the GPUs for a job which is being launched."""
+        record = JobRecord(job, list(gpus), started_at=time.time())
+        with self._lock:
+            self._running[job.job_id] = record
+        return record
+
+    def release(self, job_id: int, returncode: int | None) -> JobRecord | None:
+        """Release the GPUs of a job which has exited.
+
+        Returns:
+            JobRecord | None: The completed record of the job, or None if the job holds no reservation.
+        """
+        with self._lock:
+            record = self._running.pop(job_id, None)
+        if record is None:
+            return None
+
+        record.ended_at = time.time()
+        record.returncode = returncode
+        self.history.append(record)
+        return record
+
+    def reserved_gpus(self) -> set[int]:
+        """Get the indices of all reserved GPUs."""
+        with self._lock:
+            return {i for record in self._running.values() for i in record.gpus}
+
+    def shared_reservations(self) -> dict[int, list[int]]:
+        """Get the required memory in MiB of the memory-sized jobs on every GPU which runs only such jobs."""
+        shared: dict[int, list[int]] = {}
+        exclusive = set()
+        with self._lock:
+            for record in self._running.values():
+                for i in record.gpus:
+                    if record.job.required_memory is None:
+                        exclusive.add(i)
+                    else:
+                        shared.setdefault(i, []).append(record.job.required_memory)
+        return {i: memory for i, memory in shared.items() if i not in exclusive}
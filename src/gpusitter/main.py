@@ -1,150 +1,406 @@
 import argparse
-import datetime
-import multiprocessing
-import os
-import queue
-import re
-import shlex
-import subprocess
-import tempfile
-import time
+import signal
+import sys
+import threading
+from collections.abc import Callable
 from contextlib import nullcontext
 from pathlib import Path
+from typing import TYPE_CHECKING
 
+from gpusitter.claims import default_claims_dir
 from gpusitter.configs import ConfigData, ConfigManager
-from gpusitter.emails import EmailManager
-from gpusitter.gpu import GPUManager
+from gpusitter.daemon import request
+from gpusitter.jobfiles import JobNames, JobStream, is_sweep
+from gpusitter.jobs import parse_job, parse_memory
 from gpusitter.logger import console
-from gpusitter.utils import DummyStatus, check_jobs, get_server_info
 
+# Every command imports the subsystems it uses when it runs, so that a client or a headless start does not load the
+# mail, metrics, cluster or benchmark code it never touches
+if TYPE_CHECKING:
+    from gpusitter.launcher import ProcessLauncher, TmuxLauncher
+    from gpusitter.sitter import GPUSitter
+
+DEFAULT_JOURNAL = Path.home() / ".local" / "state" / "gpusitter" / "journal.jsonl"
+DEFAULT_LOG_DIR = Path.home() / ".local" / "state" / "gpusitter" / "logs"
+DEFAULT_RUNTIMES = Path.home() / ".local" / "state" / "gpusitter" / "runtimes.json"
+DEFAULT_AGENT_STATE = Path.home() / ".local" / "state" / "gpusitter" / "agent.tmux"
+
+
+def add_launcher_args(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments which configure the launcher of the jobs."""
+    parser.add_argument(
+        "--launch-grace",
+        default=60.0,
+        type=float,
+        help="Seconds a job has to keep running before it counts as started, earlier errors are retried.",
+    )
+    parser.add_argument(
+        "--launcher",
+        default="tmux",
+        choices=["tmux", "process"],
+        help="Run every job in a tmux window, or as a plain process writing to a log file.",
+    )
+    parser.add_argument(
+        "--log-dir",
+        default=str(DEFAULT_LOG_DIR),
+        type=str,
+        help="Directory of the job logs job_<id>.log of the process launcher.",
+    )
+    parser.add_argument(
+        "--max-log-size",
+        default="100M",
+        type=parse_memory,
+        help="Size above which the log of a job is rotated, keeping 3 old logs.",
+    )
 
-def set_args() -> argparse.Namespace:
-    """Set command line arguments."""
-    parser = argparse.ArgumentParser(description="Manage and run GPU jobs automatically when GPU is free.")
-    parser.add_argument("--job", dest="jobs", action="append", help="Job command to run when GPU is FREE.")
+
+def parse_override(value: str) -> tuple[str, str]:
+    """Parse a `key=value` override of a configuration field."""
+    key, sep, value = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected key=value, got {key!r}")
+    return key.strip(), value
+
+
+def add_scheduler_args(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments which configure the scheduler."""
     parser.add_argument("-c", "--config", default=None, type=str, help="Path to config file.")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Never prompt: read the config file if there is one, then GPUSITTER_<FIELD> variables and --set. "
+        "Implied when stdin is not a terminal.",
+    )
+    parser.add_argument(
+        "--set",
+        dest="overrides",
+        action="append",
+        default=[],
+        type=parse_override,
+        metavar="KEY=VALUE",
+        help="Override a config field, e.g. --set friendly_min=0, implies --headless.",
+    )
     parser.add_argument("--debug", action="store_true", help="Enable debug mode.")
-    return parser.parse_args()
+    parser.add_argument(
+        "--poll-interval", default=1.0, type=float, help="Base interval in seconds between two GPU polls."
+    )
+    parser.add_argument(
+        "--max-poll-interval",
+        default=30.0,
+        type=float,
+        help="Upper bound in seconds of the poll interval while the free GPUs do not change.",
+    )
+    parser.add_argument("--record-trace", default=None, type=str, help="Append every GPU poll to this JSONL trace.")
+    parser.add_argument(
+        "--replay-trace", default=None, type=str, help="Replay a recorded JSONL trace instead of querying the GPUs."
+    )
+    parser.add_argument(
+        "--simulate", default=None, type=int, help="Schedule onto this many simulated GPUs, e.g. to try settings out."
+    )
+    parser.add_argument(
+        "--max-utilization",
+        default=20.0,
+        type=float,
+        help="SM utilization in percent above which a GPU counts as busy, 100 to judge by memory only.",
+    )
+    parser.add_argument(
+        "--avoid-foreign-processes",
+        action="store_true",
+        help="Treat GPUs running compute processes of other users as busy.",
+    )
+    parser.add_argument(
+        "--max-jobs-per-gpu", default=4, type=int, help="Number of memory-sized jobs (mem=6G) which may share a GPU."
+    )
+    parser.add_argument(
+        "--max-memory-fraction",
+        default=0.95,
+        type=float,
+        help="Fraction of a GPU's memory which the memory-sized jobs sharing it may reserve in total.",
+    )
+    add_launcher_args(parser)
+    parser.add_argument(
+        "--hold",
+        action="store_true",
+        help="Hold the memory of free GPUs with a placeholder until a job is launched on them.",
+    )
+    parser.add_argument("--max-held", default=1, type=int, help="Number of GPUs which may be held at once.")
+    parser.add_argument(
+        "--hold-timeout",
+        default=600.0,
+        type=float,
+        help="Seconds a GPU is held without a job being launched on it before it is released.",
+    )
+    parser.add_argument(
+        "--max-pending",
+        default=1000,
+        type=int,
+        help="Number of jobs of job files and sweeps which are queued at once, the rest is read as the queue drains.",
+    )
+    parser.add_argument(
+        "--metrics-port", default=None, type=int, help="Serve Prometheus metrics at http://<host>:<port>/metrics."
+    )
+    parser.add_argument("--metrics-host", default="127.0.0.1", type=str, help="Address to serve the metrics on.")
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        type=str,
+        help="Write the metrics to this file every 15 seconds, e.g. for the node_exporter textfile collector.",
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        type=str,
+        help=f"Persist the jobs in this journal and restore them on restart, the daemon uses {DEFAULT_JOURNAL}.",
+    )
+    parser.add_argument(
+        "--events",
+        default=None,
+        type=str,
+        help="Log the polls, placements, launches, exits and retries to this JSONL file, see `gpust analyze`.",
+    )
+    parser.add_argument(
+        "--events-max-size",
+        default="100M",
+        type=parse_memory,
+        help="Size above which the event log is rotated, keeping 3 old logs.",
+    )
+    parser.add_argument(
+        "--runtime-history",
+        default=str(DEFAULT_RUNTIMES),
+        type=str,
+        help="File of the runtimes of finished jobs by command, used to backfill jobs which do not delay the first "
+        "waiting job.",
+    )
+    parser.add_argument(
+        "--no-runtime-history",
+        action="store_true",
+        help="Do not predict runtimes, backfill every job which fits until a waiting job has been overtaken 10 times.",
+    )
+    parser.add_argument(
+        "--claims-dir",
+        default=None,
+        type=str,
+        help=f"Directory of the GPU claims shared by all instances on this host, {default_claims_dir()} by default.",
+    )
+    parser.add_argument(
+        "--no-claims",
+        action="store_true",
+        help="Do not claim GPUs, other instances on this host may then launch onto the same GPUs.",
+    )
+    parser.add_argument(
+        "--agents",
+        default=None,
+        type=lambda value: value.split(","),
+        help="Coordinate a cluster: place the jobs on the GPUs of these agents, host:port,host:port,...",
+    )
+    parser.add_argument(
+        "--max-gpus-per-host", default=16, type=int, help="Upper bound of the number of GPUs of an agent's host."
+    )
+    parser.add_argument(
+        "--token-file", default=None, type=str, help="File of the cluster token, else GPUSITTER_TOKEN is used."
+    )
 
 
-class Job:
-    """A job to be executed when a GPU is free."""
+def set_args() -> argparse.Namespace:
+    """Set command line arguments."""
+    parser = argparse.ArgumentParser(description="Manage and run GPU jobs automatically when GPU is free.")
+    parser.add_argument(
+        "--job",
+        dest="jobs",
+        action="append",
+        help="Job command to run when GPU is FREE, `{a,b}` and `{0..9}` sweep over values.",
+    )
+    parser.add_argument(
+        "--job-file",
+        dest="job_files",
+        action="append",
+        help="File of jobs: one job per line, or [[jobs]] tables in .toml, or JSON objects in .jsonl.",
+    )
+    add_scheduler_args(parser)
 
-    def __init__(self, cmd: str, required_gpus: int = 1, max_retries: int = 3) -> None:
-        """Initialize a Job instance."""
-        self.cmd = cmd
-        self.required_gpus = required_gpus
-        self.retry_count = 0
-        self.max_retries = max_retries
+    subparsers = parser.add_subparsers(dest="command")
+    daemon = subparsers.add_parser("daemon", help="Run one long-lived scheduler which accepts jobs over a socket.")
+    add_scheduler_args(daemon)
+    daemon.add_argument("--socket", default=None, type=str, help="Path of the Unix socket to listen on.")
+    daemon.set_defaults(journal=str(DEFAULT_JOURNAL))
 
-    def __repr__(self) -> str:
-        """Return a string representation of the Job."""
-        return f"<Job cmd={self.cmd!r} gpus={self.required_gpus} retry={self.retry_count}/{self.max_retries}>"
+    submit = subparsers.add_parser("submit", help="Submit jobs to the daemon.")
+    submit.add_argument(
+        "jobs", nargs="*", help="Job commands, e.g. 'python train.py:4' or 'python train.py --seed={0..9}'."
+    )
+    submit.add_argument(
+        "-f", "--file", dest="files", action="append", default=[], help="Job file which the daemon reads as it goes."
+    )
+    ls = subparsers.add_parser("ls", help="List the running and pending jobs of the daemon.")
+    cancel = subparsers.add_parser("cancel", help="Cancel pending or running jobs of the daemon.")
+    cancel.add_argument("job_ids", nargs="+", type=int, help="Ids of the jobs to cancel.")
+    bench = subparsers.add_parser("bench", help="Benchmark the scheduler on simulated clusters, no GPU needed.")
+    bench.add_argument(
+        "--gpus", nargs="+", type=int, default=None, help="GPU counts of the simulated clusters, 8 64 512 by default."
+    )
+    bench.add_argument("--jobs-per-gpu", default=4, type=int, help="Number of jobs of the workload per GPU.")
+    bench.add_argument("--seed", default=0, type=int, help="Seed of the synthetic workload.")
+    bench.add_argument("--topology", action="store_true", help="Give the clusters NVLink islands of 8 GPUs.")
+    bench.add_argument(
+        "--history",
+        action="store_true",
+        help="Learn the runtimes as jobs finish and backfill by them, reports the error of the predictions.",
+    )
+    bench.add_argument("--save", default=None, type=str, help="Save the results as JSON, e.g. as a new baseline.")
+    bench.add_argument(
+        "--baseline", default=None, type=str, help="Fail if the scheduling quality is worse than these saved results."
+    )
+    bench.add_argument(
+        "--tolerance",
+        default=0.02,
+        type=float,
+        help="Relative slack of the baseline comparison, startup times are noisy and need more, e.g. 0.25.",
+    )
+    bench.add_argument(
+        "--startup",
+        action="store_true",
+        help="Time the cold start of the import and of a headless run in fresh interpreters instead.",
+    )
+    bench.add_argument("--runs", default=5, type=int, help="Number of cold starts of every startup measurement.")
 
+    analyze = subparsers.add_parser("analyze", help="Turn an event log into per-job and per-GPU timelines.")
+    analyze.add_argument("log", type=str, help="The event log written with --events.")
+    analyze.add_argument("--json", action="store_true", help="Print the timelines as JSON.")
 
-def worker(gpu_indices: list[int], job: Job, status_file: Path) -> None:
-    """Run a job on assigned GPUs."""
-    gpu_str = ",".join(map(str, gpu_indices))
+    agent = subparsers.add_parser("agent", help="Offer the GPUs of this host to a coordinator over TCP.")
+    agent.add_argument(
+        "--listen", default="127.0.0.1", type=str, help="host:port to listen on, e.g. 0.0.0.0:7464 for other hosts."
+    )
+    agent.add_argument("--poll-interval", default=1.0, type=float, help="Seconds between two GPU polls.")
+    agent.add_argument("--simulate", default=None, type=int, help="Offer this many simulated GPUs, e.g. for tests.")
+    agent.add_argument(
+        "--token-file", default=None, type=str, help="File of the cluster token, else GPUSITTER_TOKEN is used."
+    )
+    add_launcher_args(agent)
+
+    for client in (submit, ls, cancel):
+        client.add_argument("--socket", default=None, type=str, help="Path of the Unix socket of the daemon.")
 
-    raw_name = job.cmd.replace(" ", "_")
-    safe_name = re.sub(r"\W+", "_", raw_name)
-    session_name = f"GPUSitter_{safe_name}"
+    return parser.parse_args()
 
-    env = os.environ.copy()
 
+def run_client(args: argparse.Namespace) -> None:
+    """Run a client command against the daemon."""
     try:
-        subprocess.run(  # noqa S603
-            ["tmux", "has-session", "-t", session_name],  # noqa S603
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+        if args.command == "submit":
+            files = [str(Path(path).resolve()) for path in args.files]
+            response = request({"op": "submit", "jobs": args.jobs, "files": files}, args.socket)
+            job_strs = [job_str for job_str in args.jobs if not is_sweep(job_str)]
+            for job_str, job_id in zip(job_strs, response["job_ids"], strict=True):
+                print(f"{job_id}\t{job_str}")
+            for source in response["streamed"]:
+                print(f"-\t{source} (streamed)")
+        elif args.command == "ls":
+            response = request({"op": "ls"}, args.socket)
+            lines = [f"{'ID':>6}  {'STATE':<8} {'GPUS':>4} {'MEM':>7} {'PRIO':>4}  ASSIGNED  CMD"]
+            for job in response["jobs"]:
+                memory = f"{job['memory']}M" if job["memory"] is not None else "-"
+                assigned = ",".join(map(str, job["assigned"])) or "-"
+                after = f"  (after {','.join(map(str, job['after']))})" if job.get("after") else ""
+                lines.append(
+                    f"{job['id']:>6}  {job['state']:<8} {job['gpus']:>4} {memory:>7} {job['priority']:>4}  "
+                    f"{assigned:<8}  {job['cmd']}{after}"
+                )
+            sys.stdout.write("\n".join(lines) + "\n")
+        else:
+            response = request({"op": "cancel", "job_ids": args.job_ids}, args.socket)
+            for job_id in args.job_ids:
+                state = response["cancelled"].get(str(job_id))
+                print(f"{job_id}\t{f'cancelled ({state})' if state else 'not found'}")
+    except (ConnectionError, RuntimeError) as e:
+        console.print(f"[red]{e}[/red]")
+        sys.exit(1)
+
+
+def create_launcher(
+    args: argparse.Namespace, on_event: Callable[[], None], status_dir: Path | None
+) -> "ProcessLauncher | TmuxLauncher":
+    """Create the launcher chosen by the arguments."""
+    from gpusitter.launcher import ProcessLauncher, TmuxLauncher
+
+    if args.launcher == "process":
+        return ProcessLauncher(
+            on_event=on_event,
+            grace_period=args.launch_grace,
+            log_dir=args.log_dir,
+            max_log_bytes=args.max_log_size * 1024**2,
         )
-        tmux_cmd = f'tmux new-window -t {session_name} -e CUDA_VISIBLE_DEVICES={gpu_str} "{job.cmd}; echo $? > {status_file}; exec bash"'  # noqa E501
-    except subprocess.CalledProcessError:
-        tmux_cmd = f'tmux new-session -d -s {session_name} -e CUDA_VISIBLE_DEVICES={gpu_str} "{job.cmd}; echo $? > {status_file}; exec bash"'  # noqa E501
+    return TmuxLauncher(on_event=on_event, grace_period=args.launch_grace, status_dir=status_dir)
 
-    cmd_list = shlex.split(tmux_cmd)
 
-    subprocess.run(cmd_list, env=env, cwd=os.getcwd())  # noqa S603
+def run_agent(args: argparse.Namespace) -> None:
+    """Serve the GPUs of this host to a coordinator until interrupted."""
+    from gpusitter.backends import NVMLBackend, SimulatedBackend
+    from gpusitter.cluster import AgentServer, load_token, parse_address
 
-
-def parse_job(job_str: str) -> Job:
-    """Parse a job string into a Job instance."""
-    if ":" in job_str:
-        cmd, gpus = job_str.rsplit(":", 1)
-        job = Job(cmd.strip(), int(gpus))
-    else:
-        job = Job(job_str.strip(), 1)
-    return job
-
-
-def send_job_notification(email_mgr: EmailManager, job: Job, gpus: list[int], status: str) -> None:
-    """Send a notification email about job status."""
-    server_name, ip, user_name = get_server_info()
-    server_info = f"{user_name}@{ip} in Server: {server_name}" if ip else f"{user_name} in Server: {server_name}"
-
-    gpu_str = ", ".join(map(str, gpus))
-    if status == "started":
-        subject = f"GPUSitter: Job started on GPUs {gpu_str}"
-        body = f"Job {job.cmd} started successfully on GPUs {gpu_str}.\n {server_info}"
-    elif status == "finished":
-        subject = f"GPUSitter: Job finished on GPUs {gpu_str}"
-        body = f"Job {job.cmd} has finished execution on GPUs {gpu_str}.\n {server_info}"
-    elif status == "failed":
-        subject = f"GPUSitter: Job failed on GPUs {gpu_str}"
-        body = f"Job {job.cmd} has failed on GPUs {gpu_str}.\n {server_info}"
+    try:
+        token = load_token(args.token_file)
+        host, port = parse_address(args.listen)
+    except (OSError, ValueError) as e:
+        console.print(f"[red]{e}[/red]")
+        sys.exit(1)
+
+    backend = SimulatedBackend(num_gpus=args.simulate) if args.simulate is not None else NVMLBackend()
+    wake = threading.Event()
+    launcher = create_launcher(args, wake.set, DEFAULT_AGENT_STATE)
+    agent = AgentServer(backend, launcher, token, host, port, poll_interval=args.poll_interval, wake=wake)
+    signal.signal(signal.SIGTERM, lambda *_: signal.raise_signal(signal.SIGINT))
+    try:
+        agent.start()
+        console.log(f"[green]GPUSitter agent listening on {host}:{agent.port}[/green]")
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        console.log("[red]Interrupted by user. Exiting.[/red]")
+    finally:
+        agent.close()
+        launcher.close()
+        backend.close()
+
+
+def create_sitter(args: argparse.Namespace, config: ConfigData) -> "GPUSitter":
+    """Wire the GPU manager, the queue, the launcher and the notifier up into a sitter."""
+    from gpusitter.backends import NVMLBackend, ReplayBackend, SimulatedBackend, TraceRecorder
+    from gpusitter.claims import GPUClaims
+    from gpusitter.emails import EmailManager, EmailNotifier
+    from gpusitter.gpu import GPUManager, default_predicates
+    from gpusitter.jobs import JobQueue
+    from gpusitter.ledger import GPULedger
+    from gpusitter.scheduler import Clock, ExponentialBackoff, SchedulerLoop
+    from gpusitter.sitter import GPUSitter
+
+    cluster = None
+    if args.agents:
+        from gpusitter.cluster import ClusterBackend, ClusterLauncher, load_token
+
+        cluster = ClusterBackend(args.agents, load_token(args.token_file), max_gpus_per_host=args.max_gpus_per_host)
+        backend = cluster
+    elif args.simulate is not None:
+        backend = SimulatedBackend(num_gpus=args.simulate)
     else:
-        subject = "GPUSitter: Job status unknown"
-        body = f"Job {job.cmd} on GPUs {gpu_str} has unknown status: {status}.\n {server_info}"
-
-    email_mgr.send_email(subject=subject, body=body)
-
-
-def start_job(job: Job, assigned: list[int], email_mgr: EmailManager) -> multiprocessing.Process | None:
-    """Start a job in a separate process."""
-    now_str = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
-    safe_name = f"job_{now_str}_retry{job.retry_count}.status"
-    status_file = Path(tempfile.gettempdir()) / safe_name
-
-    p = multiprocessing.Process(target=worker, args=(assigned, job, status_file))
-    p.start()
-    p.join(timeout=5)  # Give the process a moment to start
-
-    for _ in range(60):
-        if status_file.exists():
-            break
-        time.sleep(1)
-
-    if not status_file.exists():
-        send_job_notification(email_mgr, job, assigned, "started")
-        console.log(f"[green]Job {job} started successfully on GPUs {assigned}[/green]")
-        return p
-
-    with open(status_file) as f:
-        status = f.read().strip()
-    status_file.unlink(missing_ok=True)
-
-    if status == "0":
-        send_job_notification(email_mgr, job, assigned, "started")
-        console.log(f"[green]Job {job} started successfully on GPUs {assigned}[/green]")
-        return p
-
-    console.log(f"[red]Job {job} failed to start on GPUs {assigned}[/red]")
-    return None
-
-
-def main() -> None:
-    """The main entry point."""
-    args = set_args()
-
-    config_manager = ConfigManager(config_path=args.config)
-    config_manager.load_or_create()
-    config_manager.confirm_config()
-
-    config: ConfigData = config_manager.config
+        backend = ReplayBackend(args.replay_trace, clock=Clock()) if args.replay_trace else NVMLBackend()
+    if args.record_trace:
+        backend = TraceRecorder(backend, args.record_trace)
 
+    ledger = GPULedger()
     gpu_manager = GPUManager(
         gpu_free_memory_ratio_threshold=config.gpu_free_memory_ratio_threshold,
+        backend=backend,
+        ledger=ledger,
+        stability_window=config.friendly_min * 60,
+        predicates=default_predicates(
+            config.gpu_free_memory_ratio_threshold,
+            max_utilization=args.max_utilization,
+            allow_foreign_processes=not args.avoid_foreign_processes,
+        ),
+        max_jobs_per_gpu=args.max_jobs_per_gpu,
+        max_memory_fraction=args.max_memory_fraction,
+        # Claims are local to a host, the agents of a cluster own their GPUs
+        claims=GPUClaims(args.claims_dir) if not args.no_claims and cluster is None else None,
     )
 
     email_manager = EmailManager(
@@ -154,67 +410,205 @@ def main() -> None:
         sender=config.email_sender,
         receivers=config.email_receivers,
     )
+    notifier = EmailNotifier(email_manager)
+
+    journal = None
+    if args.journal:
+        from gpusitter.journal import Journal
+
+        journal = Journal(args.journal)
+    # With a journal, the status files of the jobs outlive a restart so the launcher can attach to them again
+    status_dir = journal.path.with_suffix(".tmux") if journal is not None else None
+
+    loop = SchedulerLoop(JobQueue(), policy=ExponentialBackoff(args.poll_interval, args.max_poll_interval))
+    if cluster is not None:
+        launcher = ClusterLauncher(cluster, on_event=loop.wake)
+    else:
+        launcher = create_launcher(args, loop.wake, status_dir)
+    history = None
+    if not args.no_runtime_history:
+        from gpusitter.history import RuntimeHistory
+
+        history = RuntimeHistory(args.runtime_history)
+    events = None
+    if args.events:
+        from gpusitter.events import EventLog
+
+        events = EventLog(args.events, max_bytes=args.events_max_size * 1024**2)
+
+    holds = None
+    if args.hold:
+        from gpusitter.holder import HoldManager
+
+        holds = HoldManager(max_held=args.max_held, timeout=args.hold_timeout)
+    return GPUSitter(
+        gpu_manager,
+        ledger,
+        loop,
+        launcher,
+        notifier,
+        holds=holds,
+        journal=journal,
+        max_pending=args.max_pending,
+        history=history,
+        events=events,
+        debug=args.debug,
+    )
+
+
+def main() -> None:
+    """The main entry point."""
+    args = set_args()
+    if args.command in ("submit", "ls", "cancel"):
+        run_client(args)
+        return
+    if args.command == "agent":
+        run_agent(args)
+        return
+    if args.command == "analyze":
+        from gpusitter.analysis import run_analysis
+
+        try:
+            run_analysis(args.log, args.json)
+        except OSError as e:
+            console.print(f"[red]{e}[/red]")
+            sys.exit(1)
+        return
+    if args.command == "bench":
+        from gpusitter.bench import DEFAULT_CLUSTERS, run_benchmarks, run_startup_benchmark
+
+        if args.startup:
+            run_startup_benchmark(args.runs, args.save, args.baseline, args.tolerance)
+        else:
+            clusters = args.gpus or list(DEFAULT_CLUSTERS)
+            run_benchmarks(
+                clusters,
+                args.jobs_per_gpu,
+                args.seed,
+                args.topology,
+                args.save,
+                args.baseline,
+                args.tolerance,
+                args.history,
+            )
+        return
 
-    processes = []
+    try:
+        # Sweeps and job files are streamed into the queue, a malformed first job or a missing file fails right here.
+        # The jobs may run after the names of the jobs before them on the command line
+        names = JobNames()
+        jobs = []
+        streams = []
+        for job_str in args.jobs or []:
+            if is_sweep(job_str):
+                streams.append(JobStream.sweep(job_str, names))
+            else:
+                jobs.append(names.resolve(parse_job(job_str)))
+        streams += [JobStream.file(path) for path in args.job_files or []]
+    except (OSError, ValueError) as e:
+        console.print(f"[red]{e}[/red]")
+        sys.exit(1)
+
+    if args.agents and args.hold:
+        console.print("[red]--hold only works on the local GPUs, not with --agents.[/red]")
+        sys.exit(1)
+
+    config_manager = ConfigManager(config_path=Path(args.config) if args.config else None)
+    headless = args.headless or bool(args.overrides) or not sys.stdin.isatty()
+    if headless:
+        try:
+            config_manager.load_headless(dict(args.overrides))
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Invalid configuration: {e}[/red]")
+            sys.exit(1)
+    else:
+        config_manager.load_or_create()
+        if args.command != "daemon":
+            config_manager.confirm_config()
 
-    jobs = queue.Queue()
-    for job_str in args.jobs or []:
-        jobs.put(parse_job(job_str))
+    config: ConfigData = config_manager.config
 
-    failed_jobs = check_jobs(jobs, gpu_manager)
+    try:
+        sitter = create_sitter(args, config)
+    except (OSError, ValueError) as e:
+        console.print(f"[red]{e}[/red]")
+        sys.exit(1)
+    gpu_manager = sitter.gpu_manager
+    if sitter.journal is not None:
+        sitter.restore()
+    try:
+        sitter.check_dependencies(jobs)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        sys.exit(1)
+    for job in jobs:
+        sitter.submit(job)
+    for stream in streams:
+        sitter.submit_stream(stream)
+    sitter.feed()
+
+    from gpusitter.utils import DummyStatus, NullStatus, check_jobs, describe_unfit
+
+    # The inventory of the check is reused by the first scheduling pass rather than polling the GPUs twice
+    failed_jobs = check_jobs([*sitter.jobs, *sitter.blocked], gpu_manager)
     if failed_jobs:
         for job in failed_jobs:
-            console.log(
-                f"[red]Job {job} requires more GPUs: {job.required_gpus} "
-                f"than available {len(gpu_manager.get_all_gpus())}.[/red]"
-            )
+            console.log(f"[red]{describe_unfit(job, gpu_manager.max_job_gpus(gpu_manager.snapshot))}[/red]")
         exit(1)
 
+    # Read the topology once up front, every scheduling pass uses the cached matrix
+    if gpu_manager.topology is None and args.debug:
+        console.log("[blue]Debug:[/blue] GPU topology unknown, GPUs are assigned in index order")
+
+    server = None
+    exporters = []
     try:
-        context = nullcontext(DummyStatus()) if args.debug else console.status("[green]Waiting for jobs...[/green]")
+        if args.metrics_port is not None:
+            from gpusitter.metrics import MetricsServer
+
+            exporters.append(MetricsServer(sitter.metrics.registry, args.metrics_host, args.metrics_port))
+            console.log(f"Serving metrics at http://{args.metrics_host}:{args.metrics_port}/metrics")
+        if args.metrics_file:
+            from gpusitter.metrics import TextfileExporter
+
+            exporters.append(TextfileExporter(sitter.metrics.registry, args.metrics_file))
+        for exporter in exporters:
+            exporter.start()
+
+        if args.command == "daemon":
+            from gpusitter.daemon import DaemonServer
+
+            server = DaemonServer(sitter, args.socket)
+            server.start()
+            signal.signal(signal.SIGTERM, lambda *_: sitter.stop())
+            console.log(f"[green]GPUSitter daemon listening on {server.path}[/green]")
+
+        if args.debug:
+            context = nullcontext(DummyStatus())
+        elif headless or not console.is_terminal:
+            # Nobody watches the spinner of a service or of output redirected to a file
+            context = nullcontext(NullStatus())
+        else:
+            context = console.status("[green]Waiting for jobs...[/green]")
         with context as status:
-            while not jobs.empty():
-                free_gpus = gpu_manager.get_free_gpus()
-
-                if not free_gpus:
-                    continue
-
-                # Wait a friendly amount of time before allocating GPUs
-                for remaining in range(int(config.friendly_min * 60), 0, -1):
-                    status.update(f"[yellow]Waiting {remaining}s before allocating GPUs...[/yellow]")
-                    time.sleep(1)
-                status.update("[green]Waiting for jobs...[/green]")
-
-                free_gpu_indexes = [gpu["index"] for gpu in free_gpus]
-
-                # Check on running processes
-                job = jobs.get()
-                if len(free_gpu_indexes) < job.required_gpus:
-                    jobs.put(job)
-                    console.log(
-                        f"[yellow]Not enough free GPUs for job {job} (need {job.required_gpus}, have {len(free_gpus)})[/yellow]"  # noqa E501
-                    )
-                    continue
-                assigned = free_gpu_indexes[: job.required_gpus]
-
-                # Start the job in a separate process
-                p = start_job(job, assigned, email_manager)
-                if p:
-                    processes.append((p, job, assigned))
-                else:
-                    job.retry_count += 1
-                    if job.retry_count >= job.max_retries:
-                        send_job_notification(email_manager, job, assigned, "failed")
-                        console.log(f"[red]Job {job} reached max retries and is discarded[/red]")
-                    else:
-                        jobs.put(job)
-                        console.log(
-                            f"[yellow]Job {job} re-queued due to failed start (attempt {job.retry_count})[/yellow]"
-                        )
+            sitter.run(status, exit_when_idle=server is None)
 
     except KeyboardInterrupt:
         console.log("[red]Interrupted by user. Exiting.[/red]")
 
+    finally:
+        if server is not None:
+            server.close()
+        for exporter in exporters:
+            exporter.close()
+        sitter.close()
+        if args.debug:
+            stats = gpu_manager.poll_stats
+            console.log(
+                f"[blue]Debug:[/blue] {stats.count} GPU polls, "
+                f"mean {stats.mean * 1000:.2f}ms, max {stats.max * 1000:.2f}ms"
+            )
+
 
 if __name__ == "__main__":
     main()
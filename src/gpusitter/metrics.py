@@ -0,0 +1,397 @@
+import bisect
+import contextlib
+import http.server
+import math
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.ledger import GPULedger
+from gpusitter.logger import console
+
+# Seconds, from a fast tmux launch up to a job waiting a day for its GPUs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 14400, 86400)
+
+# A sample is a metric name suffix, its label values and its value
+Sample = tuple[str, dict[str, str], float]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = {
+        name: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for name, value in labels.items()
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+class Metric:
+    """A metric in the Prometheus text format, whose value is either recorded or computed when it is collected."""
+
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        function: Callable[[], float | dict[tuple[str, ...], float]] | None = None,
+    ) -> None:
+        """Initialize the metric.
+
+        Args:
+            name (str): The name of the metric.
+            description (str): The help text of the metric.
+            labels (tuple[str, ...]): The names of the labels of the metric.
+            function (Callable[[], float | dict[tuple[str, ...], float]] | None): Compute the value, or the values by
+                label values, whenever the metric is collected instead of recording them.
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.function = function
+
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def get(self, **labels: object) -> float:
+        """Get the recorded value of the given label values."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[Sample]:
+        """Collect the samples of the metric."""
+        if self.function is not None:
+            values = self.function()
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield "", dict(zip(self.labels, key, strict=True)), value
+
+
+class Counter(Metric):
+    """A value which only goes up, e.g. the number of failed jobs."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        """Increase the counter of the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """A value which goes up and down, e.g. the number of pending jobs."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        """Set the gauge of the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """The distribution of observed values in cumulative buckets, e.g. of the waiting times of jobs."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Initialize the histogram.
+
+        Args:
+            name (str): The name of the metric.
+            description (str): The help text of the metric.
+            buckets (tuple[float, ...]): The increasing upper bounds of the buckets, `+Inf` is added.
+        """
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    @property
+    def count(self) -> int:
+        """The number of observations."""
+        return sum(self._counts)
+
+    @property
+    def mean(self) -> float:
+        """The mean of the observations, 0 without any."""
+        with self._lock:
+            count = sum(self._counts)
+            return self._sum / count if count else 0.0
+
+    def observe(self, value: float) -> None:
+        """Record an observation."""
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[position] += 1
+            self._sum += value
+
+    def samples(self) -> Iterator[Sample]:
+        """Collect the cumulative buckets, the sum and the count."""
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+            cumulative += count
+            yield "_bucket", {"le": _format_value(bound)}, cumulative
+        yield "_sum", {}, total
+        yield "_count", {}, cumulative
+
+
+class Registry:
+    """A set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        """Initialize an empty registry."""
+        self.metrics: list[Metric] = []
+
+    def register[M: Metric](self, metric: M) -> M:
+        """Add a metric to the registry and return it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(
+                f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}"
+                for suffix, labels, value in metric.samples()
+            )
+        return "\n".join(lines) + "\n"
+
+
+class SitterMetrics:
+    """The metrics of a `GPUSitter`.
+
+    Recording is a dictionary update or a bisect behind a lock, and everything which can be derived from the state
+    of the sitter, like the queue depth, is only computed when the metrics are scraped. So the scheduling loop does
+    not slow down noticeably.
+    """
+
+    def __init__(self) -> None:
+        """Register the metrics."""
+        self.registry = Registry()
+        register = self.registry.register
+        self.queue_depth = register(Gauge("gpusitter_queue_depth", "Number of pending jobs."))
+        self.blocked_jobs = register(
+            Gauge("gpusitter_blocked_jobs", "Number of jobs waiting for the jobs they depend on to succeed.")
+        )
+        self.running_jobs = register(Gauge("gpusitter_running_jobs", "Number of launched jobs which have not exited."))
+        self.wait_time = register(
+            Histogram("gpusitter_job_wait_seconds", "Seconds from queueing a job until it is placed on GPUs.")
+        )
+        self.launch_latency = register(
+            Histogram(
+                "gpusitter_launch_latency_seconds",
+                "Seconds from placing a job until its process runs, e.g. its tmux window exists.",
+            )
+        )
+        self.poll_duration = register(
+            Histogram(
+                "gpusitter_poll_duration_seconds",
+                "Seconds a poll of the GPUs takes.",
+                buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+            )
+        )
+        self.gpu_idle = register(
+            Counter(
+                "gpusitter_gpu_idle_seconds_total",
+                "Seconds GPUs sat idle between a job releasing them and the next job being placed on them.",
+                labels=("gpu",),
+                function=self._idle_seconds,
+            )
+        )
+        self.jobs_started = register(Counter("gpusitter_jobs_started_total", "Number of jobs confirmed as started."))
+        self.jobs_finished = register(
+            Counter("gpusitter_jobs_finished_total", "Number of jobs which exited, by outcome.", labels=("outcome",))
+        )
+        self.retries = register(
+            Counter(
+                "gpusitter_job_retries_total",
+                "Number of failed jobs re-queued, after a failed start or after running out of memory or a broken "
+                "collective while running.",
+            )
+        )
+        self.failures = register(
+            Counter(
+                "gpusitter_job_failures_total",
+                "Number of failures, `start` for every failed start, `launcher` for every job the launcher failed to "
+                "start and `discarded` once a job ran out of retries.",
+                labels=("reason",),
+            )
+        )
+        self.failure_classes = register(
+            Counter(
+                "gpusitter_job_failure_classes_total",
+                "Number of failed jobs by the class of their failure: oom, nccl, command or other.",
+                labels=("kind",),
+            )
+        )
+        self.runtime_predictions = register(
+            Counter(
+                "gpusitter_runtime_predictions_total",
+                "Number of jobs which finished, by whether the history predicted their runtime: predicted or unknown.",
+                labels=("result",),
+            )
+        )
+        self.runtime_prediction_error = register(
+            Histogram(
+                "gpusitter_runtime_prediction_error_ratio",
+                "Absolute error of the predicted runtime of a finished job relative to its actual runtime.",
+                buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4),
+            )
+        )
+
+        # Per GPU, the seconds of the completed idle spells and the start of the current one
+        self._idle_total: dict[int, float] = {}
+        self._idle_since: dict[int, float] = {}
+        self._idle_lock = threading.Lock()
+        # The clock of the waits and the idle spells
+        self._now: Callable[[], float] = time.monotonic
+
+    def watch(self, jobs: JobQueue, ledger: GPULedger) -> None:
+        """Derive the queue depth and the running jobs from the queue and the ledger whenever they are scraped.
+
+        The waits and the idle spells are timed on the clock of the queue from then on.
+        """
+        self.queue_depth.function = lambda: len(jobs)
+        self.running_jobs.function = lambda: len(ledger)
+        self._now = jobs.now
+
+    def placed(self, job: Job, gpus: list[int], now: float | None = None) -> None:
+        """Record that a job was placed on GPUs, ending the idle spells of the GPUs."""
+        now = now if now is not None else self._now()
+        self.wait_time.observe(now - job.queued_at)
+        with self._idle_lock:
+            for index in gpus:
+                since = self._idle_since.pop(index, None)
+                if since is not None:
+                    self._idle_total[index] = self._idle_total.get(index, 0.0) + now - since
+
+    def released(self, gpus: list[int], now: float | None = None) -> None:
+        """Record that GPUs run no job anymore, starting their idle spells."""
+        now = now if now is not None else self._now()
+        with self._idle_lock:
+            for index in gpus:
+                self._idle_since.setdefault(index, now)
+
+    def _idle_seconds(self) -> dict[tuple[str, ...], float]:
+        now = self._now()
+        with self._idle_lock:
+            totals = dict(self._idle_total)
+            for index, since in self._idle_since.items():
+                totals[index] = totals.get(index, 0.0) + now - since
+        return {(str(index),): seconds for index, seconds in totals.items()}
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    server: "MetricsServer"
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        """Keep the scrapes out of the console."""
+
+
+class MetricsServer(http.server.ThreadingHTTPServer):
+    """Serve the metrics of a registry at `/metrics` for Prometheus to scrape."""
+
+    daemon_threads = True
+
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9464) -> None:
+        """Bind the HTTP server, port 0 picks a free port."""
+        self.registry = registry
+        super().__init__((host, port), _MetricsHandler)
+
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Serve the scrapes from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="gpusitter-metrics", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop serving."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+        self.server_close()
+
+
+class TextfileExporter:
+    """Write the metrics of a registry to a file periodically, e.g. for the textfile collector of node_exporter."""
+
+    def __init__(self, registry: Registry, path: str | Path, interval: float = 15.0) -> None:
+        """Initialize the exporter.
+
+        Args:
+            registry (Registry): The metrics to write.
+            path (str | Path): The file to write, it is replaced atomically so a reader never sees half of it.
+            interval (float): The seconds between two writes.
+        """
+        self.registry = registry
+        self.path = Path(path)
+        self.interval = interval
+
+        self._closed = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Write the metrics from a background thread."""
+        self._thread = threading.Thread(target=self._run, name="gpusitter-textfile", daemon=True)
+        self._thread.start()
+
+    def write(self) -> None:
+        """Write the metrics now."""
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_text(self.registry.render())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            console.log(f"[red]Failed to write the metrics to {self.path}: {e}[/red]")
+            with contextlib.suppress(OSError):
+                tmp_path.unlink()
+
+    def close(self) -> None:
+        """Stop writing, after writing the final metrics."""
+        if self._thread is not None:
+            self._closed.set()
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+    def _run(self) -> None:
+        while not self._closed.wait(self.interval):
+            self.write()
@@ -0,0 +1,116 @@
+import math
+import random
+import re
+
+from gpusitter.jobs import Job
+
+# The classes of failures
+OOM = "oom"
+NCCL = "nccl"
+COMMAND = "command"
+OTHER = "other"
+
+# The messages which give a class away in the last lines of a job's output, checked in this order
+_PATTERNS = {
+    OOM: re.compile(
+        r"CUDA out of memory|OutOfMemoryError|CUBLAS_STATUS_ALLOC_FAILED|cudaErrorMemoryAllocation"
+        r"|RESOURCE_EXHAUSTED|CUDA error: out of memory",
+        re.IGNORECASE,
+    ),
+    NCCL: re.compile(
+        r"NCCL error|ncclSystemError|ncclInternalError|ncclUnhandledCudaError|ncclRemoteError"
+        r"|Watchdog caught collective operation timeout",
+        re.IGNORECASE,
+    ),
+    COMMAND: re.compile(
+        r"command not found|can't open file|No such file or directory|ModuleNotFoundError|SyntaxError"
+        r"|unrecognized arguments|Permission denied",
+    ),
+}
+
+# The delay in seconds before the first retry of a class and the upper bound of the delays, a class without delays is
+# never retried since retrying a broken command cannot help
+DEFAULT_DELAYS = {
+    OOM: (30.0, 900.0),
+    NCCL: (60.0, 1800.0),
+    OTHER: (10.0, 600.0),
+}
+
+
+def classify(returncode: int | None, output: str | None) -> str:
+    """Classify a failed job by its exit status and the last lines of its output.
+
+    The shell exits with 126 and 127 for commands which cannot be run or found, otherwise the output decides.
+    """
+    if returncode in (126, 127):
+        return COMMAND
+    for kind, pattern in _PATTERNS.items():
+        if output and pattern.search(output):
+            return kind
+    return OTHER
+
+
+class RetryPolicy:
+    """Decide when a failed job is retried: per class of failure, the delays grow exponentially with some jitter.
+
+    Jobs which ran out of GPU memory are retried with a larger requirement rather than unchanged, memory-sized jobs
+    ask for more memory until they take whole GPUs, and jobs taking whole GPUs ask for twice as many.
+    """
+
+    def __init__(
+        self,
+        delays: dict[str, tuple[float, float]] | None = None,
+        factor: float = 2.0,
+        jitter: float = 0.5,
+        memory_factor: float = 1.5,
+        rng: random.Random | None = None,
+    ) -> None:
+        """Initialize the policy.
+
+        Args:
+            delays (dict[str, tuple[float, float]] | None): The first and the largest delay in seconds by class of
+                failure, `DEFAULT_DELAYS` by default. Classes without delays are not retried.
+            factor (float): The factor the delay grows by with every failure of the same class.
+            jitter (float): The fraction of the delay which is randomly cut off, so jobs which failed together do not
+                all retry at once.
+            memory_factor (float): The factor the required memory of a memory-sized job grows by after running out of
+                memory.
+            rng (random.Random | None): The source of the jitter.
+        """
+        self.delays = delays if delays is not None else DEFAULT_DELAYS
+        self.factor = factor
+        self.jitter = jitter
+        self.memory_factor = memory_factor
+        self.rng = rng if rng is not None else random.Random()  # noqa: S311
+
+    def delay(self, kind: str, failures: int) -> float | None:
+        """Get the seconds to wait before retrying a job after its `failures`-th failure of a class.
+
+        Returns:
+            float | None: The delay, or None if the class is not retried.
+        """
+        if kind not in self.delays:
+            return None
+        first, largest = self.delays[kind]
+        delay = min(first * self.factor ** (failures - 1), largest)
+        return delay * (1.0 - self.jitter * self.rng.random())
+
+    def escalate(self, job: Job, num_gpus: int, max_memory: int | None) -> bool:
+        """Raise the requirement of a job which ran out of memory.
+
+        Args:
+            job (Job): The job, its requirement is raised in place.
+            num_gpus (int): The number of GPUs, no job may ask for more.
+            max_memory (int | None): The MiB of the largest GPU, memory-sized jobs asking for more take whole GPUs.
+
+        Returns:
+            bool: Whether the requirement was raised, False if the job asks for all it can get already.
+        """
+        if job.required_memory is not None:
+            memory = math.ceil(job.required_memory * self.memory_factor)
+            job.required_memory = memory if max_memory is None or memory < max_memory else None
+            return True
+        if job.required_gpus * 2 <= num_gpus:
+            job.required_gpus *= 2
+            return True
+        return False
@@ -0,0 +1,142 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from gpusitter.jobs import Job, JobQueue
+
+
+class Clock:
+    """The clock used by the scheduler loop to read the time and to sleep."""
+
+    def now(self) -> float:
+        """Get the current monotonic time in seconds."""
+        return time.monotonic()
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        """Sleep until the event is set or the timeout expires.
+
+        Returns:
+            bool: True if the event was set, False if the timeout expired.
+        """
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    """A clock which only advances when the scheduler sleeps, for tests and simulations."""
+
+    def __init__(self, start: float = 0.0) -> None:
+        """Initialize the virtual clock at the given time."""
+        self.time = start
+
+    def now(self) -> float:
+        """Get the current virtual time in seconds."""
+        return self.time
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        """Advance the virtual time by the timeout, unless the event is already set."""
+        if event.is_set():
+            return True
+
+        self.advance(timeout)
+        return False
+
+    def advance(self, seconds: float) -> None:
+        """Advance the virtual time."""
+        self.time += seconds
+
+
+class PollPolicy(ABC):
+    """Decide how long the scheduler sleeps between two GPU polls."""
+
+    @abstractmethod
+    def next_interval(self, changed: bool) -> float:
+        """Get the sleep interval in seconds before the next poll.
+
+        Args:
+            changed (bool): Whether the last poll saw a change in the free GPUs.
+        """
+
+    def reset(self) -> None:  # noqa: B027
+        """Reset the policy, e.g. after the scheduler was woken up by an event, a hook which does nothing by default."""
+
+
+class ExponentialBackoff(PollPolicy):
+    """Poll at a base interval and back off exponentially while nothing changes."""
+
+    def __init__(self, base_interval: float = 1.0, max_interval: float = 30.0, factor: float = 2.0) -> None:
+        """Initialize the backoff policy.
+
+        Args:
+            base_interval (float): The interval in seconds used right after a change.
+            max_interval (float): The upper bound of the interval in seconds.
+            factor (float): The factor the interval grows by for every poll without a change.
+        """
+        if base_interval <= 0 or max_interval < base_interval or factor < 1:
+            raise ValueError("Require 0 < base_interval <= max_interval and factor >= 1.")
+
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.factor = factor
+
+        self._interval: float | None = None
+
+    def next_interval(self, changed: bool) -> float:
+        """Get the base interval after a change, otherwise the last interval multiplied by the factor."""
+        if changed or self._interval is None:
+            self._interval = self.base_interval
+        else:
+            self._interval = min(self._interval * self.factor, self.max_interval)
+        return self._interval
+
+    def reset(self) -> None:
+        """Start over from the base interval."""
+        self._interval = None
+
+
+class SchedulerLoop:
+    """Pace the scheduler: sleep between polls and wake up immediately on job events."""
+
+    def __init__(self, jobs: JobQueue, policy: PollPolicy | None = None, clock: Clock | None = None) -> None:
+        """Initialize the scheduler loop.
+
+        Args:
+            jobs (JobQueue): The queue of pending jobs, it takes the clock of the loop unless it has one.
+            policy (PollPolicy | None): The polling policy, exponential backoff by default.
+            clock (Clock | None): The clock to sleep on, the wall clock by default.
+        """
+        self.jobs = jobs
+        self.policy = policy if policy is not None else ExponentialBackoff()
+        self.clock = clock if clock is not None else Clock()
+        if jobs.clock is None:
+            jobs.clock = self.clock
+
+        self._wake_event = threading.Event()
+
+    def submit(self, job: Job) -> None:
+        """Submit a new job and wake the scheduler up."""
+        self.jobs.put(job)
+        self.wake()
+
+    def wake(self) -> None:
+        """Wake the scheduler up, e.g. because a job has exited. Safe to call from any thread."""
+        self._wake_event.set()
+
+    def wait(self, changed: bool, max_interval: float | None = None) -> bool:
+        """Sleep until the next poll is due or the scheduler is woken up.
+
+        Args:
+            changed (bool): Whether the last poll saw a change in the free GPUs.
+            max_interval (float | None): Sleep at most this long, e.g. until a GPU is expected to become free.
+
+        Returns:
+            bool: True if the scheduler was woken up before the interval expired.
+        """
+        interval = self.policy.next_interval(changed)
+        if max_interval is not None:
+            interval = min(interval, max_interval)
+        woken = self.clock.wait(self._wake_event, interval)
+        if woken:
+            # Only clear a wake-up we have consumed, one arriving after the timeout is kept for the next wait
+            self._wake_event.clear()
+            self.policy.reset()
+        return woken
@@ -0,0 +1,689 @@
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import Callable, Iterable, Iterator
+from typing import TYPE_CHECKING, Any, Protocol
+
+from gpusitter.emails import EmailNotifier, Notification
+from gpusitter.gpu import GPUManager
+from gpusitter.jobfiles import JobStream
+from gpusitter.jobs import Job
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.ledger import GPULedger
+from gpusitter.logger import console
+from gpusitter.metrics import SitterMetrics
+from gpusitter.retries import NCCL, OOM, RetryPolicy, classify
+from gpusitter.scheduler import SchedulerLoop
+from gpusitter.utils import describe_unfit, get_server_info, unfit_jobs
+
+if TYPE_CHECKING:
+    from gpusitter.events import EventLog
+    from gpusitter.history import RuntimeHistory
+    from gpusitter.holder import HoldManager
+    from gpusitter.journal import Journal, StreamState
+
+# The seconds a job waits before it is placed again after the launcher failed to start it, e.g. while tmux is broken
+LAUNCH_ERROR_DELAY = 30.0
+
+
+class Status(Protocol):
+    """Something showing the current state, e.g. a rich status spinner."""
+
+    def update(self, message: str) -> None:
+        """Show a new message."""
+
+
+def send_job_notification(notifier: EmailNotifier, job: Job, gpus: list[int], status: str) -> None:
+    """Send a notification email about job status."""
+    server_name, ip, user_name = get_server_info()
+    server_info = f"{user_name}@{ip} in Server: {server_name}" if ip else f"{user_name} in Server: {server_name}"
+
+    gpu_str = ", ".join(map(str, gpus))
+    if status == "started":
+        subject = f"GPUSitter: Job started on GPUs {gpu_str}"
+        body = f"Job {job.cmd} started successfully on GPUs {gpu_str}.\n {server_info}"
+    elif status == "finished":
+        subject = f"GPUSitter: Job finished on GPUs {gpu_str}"
+        body = f"Job {job.cmd} has finished execution on GPUs {gpu_str}.\n {server_info}"
+    elif status == "failed":
+        subject = f"GPUSitter: Job failed on GPUs {gpu_str}"
+        body = f"Job {job.cmd} has failed on GPUs {gpu_str}.\n {server_info}"
+    else:
+        subject = "GPUSitter: Job status unknown"
+        body = f"Job {job.cmd} on GPUs {gpu_str} has unknown status: {status}.\n {server_info}"
+
+    notifier.notify(Notification(status, list(gpus), subject, body))
+
+
+class GPUSitter:
+    """Place the pending jobs on the free GPUs, launch them and follow them until they exit.
+
+    A job which depends on other jobs is blocked outside the queue, so it holds no GPU and is not considered by the
+    scheduling passes, until all of them succeeded. If one of them fails or is cancelled, the job and everything
+    depending on it is skipped.
+
+    The scheduling loop runs in one thread. Jobs may be submitted, listed and cancelled from any other thread, e.g.
+    the connections of the daemon.
+    """
+
+    def __init__(
+        self,
+        gpu_manager: GPUManager,
+        ledger: GPULedger,
+        loop: SchedulerLoop,
+        launcher: Launcher,
+        notifier: EmailNotifier,
+        holds: "HoldManager | None" = None,
+        journal: "Journal | None" = None,
+        max_pending: int = 1000,
+        metrics: SitterMetrics | None = None,
+        retry_policy: RetryPolicy | None = None,
+        history: "RuntimeHistory | None" = None,
+        events: "EventLog | None" = None,
+        on_decision: Callable[[float], None] | None = None,
+        debug: bool = False,
+    ) -> None:
+        """Initialize the sitter.
+
+        Args:
+            gpu_manager (GPUManager): The GPU manager to poll.
+            ledger (GPULedger): The ledger of the running jobs, shared with the GPU manager.
+            loop (SchedulerLoop): The scheduler loop which owns the queue of pending jobs.
+            launcher (Launcher): The launcher of the jobs, it should wake the loop up on events.
+            notifier (EmailNotifier): The notifier of job starts and exits.
+            holds (HoldManager | None): Hold free GPUs until a job is launched on them.
+            journal (Journal | None): Persist the pending and running jobs, see `restore`.
+            max_pending (int): The queue is topped up from the job streams up to this many pending and blocked jobs.
+            metrics (SitterMetrics | None): The metrics to record, new ones by default.
+            retry_policy (RetryPolicy | None): When failed jobs are retried and how jobs which ran out of memory
+                grow, the default policy if None.
+            history (RuntimeHistory | None): Learn the runtimes of the jobs which finish, and backfill around a
+                reservation for the first waiting job by the predicted runtimes. If None, jobs are backfilled
+                whenever they fit until a job starves.
+            events (EventLog | None): Log the polls, placements, launches, exits and retries as structured events.
+            on_decision (Callable[[float], None] | None): Called with the CPU seconds of every scheduling decision,
+                e.g. by the benchmark.
+            debug (bool): Log why GPUs are rejected whenever the free GPUs change.
+        """
+        self.gpu_manager = gpu_manager
+        self.ledger = ledger
+        self.loop = loop
+        self.jobs = loop.jobs
+        self.launcher = launcher
+        self.notifier = notifier
+        self.holds = holds
+        self.journal = journal
+        self.max_pending = max_pending
+        self.metrics = metrics if metrics is not None else SitterMetrics()
+        self.metrics.watch(self.jobs, ledger)
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.history = history
+        self.events = events
+        self.on_decision = on_decision
+        self.debug = debug
+
+        # When every job launched by this sitter started on the clock of the loop, and its predicted runtime
+        self._launches: dict[int, tuple[float, float | None]] = {}
+
+        # The job streams with their key in the journal, None for streams which are not journaled
+        self._streams: deque[tuple[Iterator[Job], int | None]] = deque()
+        self._stop = threading.Event()
+
+        # The jobs waiting for the jobs they depend on by id, the ids of the jobs which are blocked, pending or running,
+        # and whether the jobs which ended succeeded
+        self._blocked: dict[int, Job] = {}
+        self._unfinished: set[int] = set()
+        self._outcomes: dict[int, bool] = {}
+        self._lock = threading.Lock()
+        self.metrics.blocked_jobs.function = lambda: len(self._blocked)
+
+    def restore(self) -> None:
+        """Rebuild the pending and running jobs from the journal, and attach the launcher to the running jobs."""
+        state = self.journal.load()
+        self._unfinished.update(job.job_id for job in state.pending)
+        self._unfinished.update(job.job_id for job, _ in state.running)
+        for job in state.pending:
+            # A job which ended before the restart succeeded, a failure would have ended the jobs depending on it too
+            job.after = [upstream for upstream in job.after if upstream in self._unfinished]
+            self._emit("submit", **describe_job(job), restored=True)
+            if job.after:
+                self._blocked[job.job_id] = job
+            else:
+                self.jobs.put(job)
+        claims = self.gpu_manager.claims
+        for job, gpus in state.running:
+            self._emit("attach", **describe_job(job), assigned=gpus)
+            self.ledger.reserve(job, gpus)
+            self.launcher.attach(job, gpus)
+            # The lease of the job from before the restart is its own
+            if claims is not None and not claims.claim(job.job_id, gpus, self.launcher.pid(job.job_id)):
+                console.log(f"[yellow]Job {job} runs on GPUs {gpus} which another instance claims[/yellow]")
+        for stream_state in state.streams:
+            self._resume(stream_state)
+        if state.pending or state.running or state.streams:
+            console.log(
+                f"[green]Restored {len(state.pending)} pending and {len(state.running)} running jobs "
+                f"and {len(state.streams)} job streams from {self.journal.path}[/green]"
+            )
+
+    def _resume(self, state: "StreamState") -> None:
+        """Reopen a journaled job stream and skip the jobs read from it before the restart.
+
+        The names of the skipped jobs stand for the ids they had before, and like in `restore` the jobs which ended
+        before the restart count as succeeded.
+        """
+        try:
+            stream = JobStream(state.source)
+            for position in range(state.position):
+                job = next(stream)
+                if position in state.jobs:
+                    stream.names.rename(job.job_id, state.jobs[position])
+        except Exception as e:
+            console.log(f"[red]Failed to reopen the job stream {state.source}, dropping it: {e}[/red]")
+            self.journal.drained(state.key)
+            return
+
+        with self._lock:
+            for job_ids in stream.names.ids().values():
+                for job_id in job_ids:
+                    if job_id not in self._unfinished:
+                        self._outcomes.setdefault(job_id, True)
+        self._streams.append((stream, state.key))
+
+    def submit(self, job: Job) -> None:
+        """Queue a job, or block it until the jobs it depends on succeeded, and wake the scheduling loop up.
+
+        Raises:
+            ValueError: If the job depends on a job this sitter does not know.
+        """
+        self._admit(job)
+        self.loop.wake()
+
+    def check_dependencies(self, jobs: Iterable[Job]) -> None:
+        """Check that the jobs only depend on known jobs or on jobs before them, without submitting anything.
+
+        Raises:
+            ValueError: If a job depends on an unknown job.
+        """
+        ids = set()
+        with self._lock:
+            for job in jobs:
+                for upstream in job.after:
+                    if upstream not in self._unfinished and upstream not in self._outcomes and upstream not in ids:
+                        raise ValueError(f"Job {job} runs after job {upstream}, which does not exist")
+                ids.add(job.job_id)
+
+    def check_fit(self, jobs: Iterable[Job]) -> None:
+        """Check that jobs submitted while running fit on the GPUs of the last poll at all, without submitting anything.
+
+        Nothing is rejected while no poll has succeeded yet. A job never spans hosts, so in a cluster it has to fit on
+        the largest host.
+
+        Raises:
+            ValueError: If a job asks for more GPUs or more memory per GPU than there is.
+        """
+        gpus = self.gpu_manager.snapshot
+        if not gpus:
+            return
+        max_gpus = self.gpu_manager.max_job_gpus(gpus)
+        unfit = unfit_jobs(jobs, gpus, self.gpu_manager.max_memory_fraction, max_gpus)
+        if unfit:
+            raise ValueError(" ".join(describe_unfit(job, max_gpus) for job in unfit))
+
+    def _admit(self, job: Job, stream: tuple[int, int] | None = None) -> None:
+        """Journal a new job and queue it, block it or skip it by the outcomes of the jobs it depends on.
+
+        Args:
+            job (Job): The job.
+            stream (tuple[int, int] | None): The key of the journaled stream the job was read from and its position in
+                it, None if it was not read from one.
+        """
+        with self._lock:
+            failed = None
+            for upstream in job.after:
+                if upstream not in self._unfinished and upstream not in self._outcomes:
+                    raise ValueError(f"Job {job} runs after job {upstream}, which does not exist")
+                if self._outcomes.get(upstream) is False:
+                    failed = upstream
+                    break
+
+            if self.journal is not None:
+                self.journal.submitted(job, stream)
+            self._emit("submit", **describe_job(job))
+            if failed is not None:
+                self._skip(job, failed)
+            elif any(upstream in self._unfinished for upstream in job.after):
+                self._unfinished.add(job.job_id)
+                self._blocked[job.job_id] = job
+            else:
+                self._unfinished.add(job.job_id)
+                self.jobs.put(job)
+
+    def submit_stream(self, jobs: Iterable[Job]) -> None:
+        """Queue the jobs of a stream, e.g. a job file or a sweep, as the queue drains.
+
+        The streams are read one after the other, each only as far as needed to keep `max_pending` jobs queued. So
+        their jobs are prioritized among the queued jobs only. The jobs which were not queued yet are not in the
+        journal, but a `JobStream` is, with its source and how far it was read, and `restore` reads on from there.
+        """
+        key = None
+        if self.journal is not None and isinstance(jobs, JobStream):
+            key = self.journal.streamed(jobs.source)
+        self._streams.append((iter(jobs), key))
+        self.loop.wake()
+
+    def feed(self) -> int:
+        """Top the queue up from the job streams, streams which fail to read are logged and dropped.
+
+        Returns:
+            int: The number of jobs which were queued.
+        """
+        fed = 0
+        while self._streams and len(self.jobs) + len(self._blocked) < self.max_pending:
+            stream, key = self._streams[0]
+            try:
+                job = next(stream)
+            except StopIteration:
+                self._drained(key)
+                continue
+            except Exception as e:
+                console.log(f"[red]Failed to read jobs, dropping the rest of their stream: {e}[/red]")
+                self._drained(key)
+                continue
+            position = (key, stream.position - 1) if key is not None else None
+            try:
+                self._admit(job, position)
+            except ValueError as e:
+                console.log(f"[red]Skipping job {job}: {e}[/red]")
+                if key is not None:
+                    self.journal.read(key, stream.position)
+                continue
+            fed += 1
+        return fed
+
+    def _drained(self, key: int | None) -> None:
+        """Drop the first job stream, it is read to the end or failed."""
+        self._streams.popleft()
+        if key is not None:
+            self.journal.drained(key)
+
+    def cancel(self, job_id: int) -> str | None:
+        """Cancel a job.
+
+        The jobs depending on a cancelled job are skipped.
+
+        Returns:
+            str | None: `blocked` if the job was waiting for other jobs, `queued` if it was removed from the queue,
+            `running` if its launch was cancelled, or None if there is no such job.
+        """
+        with self._lock:
+            job = self._blocked.pop(job_id, None)
+        state = "blocked"
+        if job is None:
+            job = self.jobs.remove(job_id)
+            state = "queued"
+        if job is not None:
+            self._emit("cancelled", id=job.job_id, state=state)
+            self._ended(job, succeeded=False)
+            return state
+        if self.launcher.cancel(job_id):
+            return "running"
+        return None
+
+    @property
+    def blocked(self) -> list[Job]:
+        """The jobs waiting for the jobs they depend on, in the order they were submitted."""
+        with self._lock:
+            return list(self._blocked.values())
+
+    def list_jobs(self) -> list[dict[str, Any]]:
+        """Describe the running jobs, then the pending jobs in scheduling order, then the blocked jobs."""
+        running = [
+            {**describe_job(record.job), "state": "running", "assigned": record.gpus} for record in self.ledger.running
+        ]
+        queued = [{**describe_job(job), "state": "queued", "assigned": []} for job in self.jobs]
+        blocked = [{**describe_job(job), "state": "blocked", "assigned": []} for job in self.blocked]
+        return running + queued + blocked
+
+    def handle_launch_event(self, event: LaunchEvent) -> None:
+        """Notify about a launch event, release the GPUs of exited jobs and re-queue jobs which failed to start.
+
+        A job which the launcher failed to start, e.g. since tmux is broken, is re-queued without using up a retry.
+        """
+        job, assigned = event.job, event.gpus
+        if event.kind == "started":
+            self._emit("started", id=job.job_id, assigned=assigned, latency=event.latency)
+            self.metrics.jobs_started.inc()
+            if event.latency is not None:
+                self.metrics.launch_latency.observe(event.latency)
+            send_job_notification(self.notifier, job, assigned, "started")
+            console.log(f"[green]Job {job} started successfully on GPUs {assigned}[/green]")
+            return
+
+        record = self.ledger.release(job.job_id, event.returncode)
+        launch = self._launches.pop(job.job_id, None)
+        if event.kind == "exited" and event.returncode == 0 and launch is not None:
+            self._learn_runtime(job, *launch)
+        if self.gpu_manager.claims is not None:
+            self.gpu_manager.claims.release(job.job_id)
+        if record is not None:
+            # GPUs shared with other memory-sized jobs keep running those
+            busy = self.ledger.reserved_gpus()
+            self.metrics.released([i for i in record.gpus if i not in busy])
+
+        if event.kind == "cancelled":
+            self._emit("cancelled", id=job.job_id, state="running", assigned=assigned)
+            self.metrics.jobs_finished.inc(outcome="cancelled")
+            self._ended(job, succeeded=False)
+            console.log(f"[yellow]Job {job} was cancelled on GPUs {assigned}[/yellow]")
+            return
+
+        if event.kind == "error":
+            self._emit("launch_error", id=job.job_id, assigned=assigned, error=event.output)
+            self.metrics.failures.inc(reason="launcher")
+            console.log(f"[red]Failed to launch job {job} on GPUs {assigned}: {event.output}[/red]")
+            self._requeue(job, LAUNCH_ERROR_DELAY, "launcher")
+            return
+
+        if event.kind == "exited":
+            runtime = record.ended_at - record.started_at if record else 0.0
+            self._emit("exited", id=job.job_id, assigned=assigned, returncode=event.returncode, runtime=runtime)
+            if event.returncode not in (0, None):
+                # Running out of memory or a broken collective may hit a job long after it started
+                kind = classify(event.returncode, event.output)
+                if kind in (OOM, NCCL):
+                    self.metrics.jobs_finished.inc(outcome="failed")
+                    self._failed(
+                        job, assigned, kind, f"failed after {runtime:.0f}s with exit status {event.returncode}"
+                    )
+                    return
+
+            self._ended(job, succeeded=event.returncode == 0)
+            self.metrics.jobs_finished.inc(outcome="succeeded" if event.returncode == 0 else "failed")
+            if event.returncode == 0:
+                send_job_notification(self.notifier, job, assigned, "finished")
+                console.log(f"[green]Job {job} finished on GPUs {assigned} after {runtime:.0f}s[/green]")
+            else:
+                send_job_notification(self.notifier, job, assigned, "failed")
+                console.log(
+                    f"[red]Job {job} failed on GPUs {assigned} after {runtime:.0f}s "
+                    f"with exit status {event.returncode}[/red]"
+                )
+            return
+
+        self._emit("start_failed", id=job.job_id, assigned=assigned, returncode=event.returncode)
+        self.metrics.failures.inc(reason="start")
+        self._failed(job, assigned, classify(event.returncode, event.output), "failed to start")
+
+    def _bind_claims(self) -> None:
+        """Bind the claims of the launched jobs to their processes once the launcher knows them."""
+        claims = self.gpu_manager.claims
+        if claims is None:
+            return
+        for job_id in claims.unbound():
+            pid = self.launcher.pid(job_id)
+            if pid is not None:
+                claims.bind(job_id, pid)
+
+    def _emit(self, event: str, **fields: Any) -> None:
+        """Log an event if there is an event log."""
+        if self.events is not None:
+            self.events.emit(event, **fields)
+
+    def _learn_runtime(self, job: Job, started_at: float, predicted: float | None) -> None:
+        """Record the runtime of a job which finished successfully and how far off its prediction was."""
+        if self.history is None:
+            return
+        runtime = self.loop.clock.now() - started_at
+        if predicted is None:
+            self.metrics.runtime_predictions.inc(result="unknown")
+        else:
+            self.metrics.runtime_predictions.inc(result="predicted")
+            self.metrics.runtime_prediction_error.observe(abs(predicted - runtime) / max(runtime, 1.0))
+        self.history.record(job, runtime)
+
+    def _releases(self) -> dict[int, float]:
+        """Predict the seconds until the GPUs of the running jobs are free, by GPU index.
+
+        A GPU is free once all its jobs have exited, GPUs running a job without a prediction, e.g. one restored from
+        the journal, are left out. Jobs which overrun their prediction are expected to exit any moment.
+        """
+        now = self.loop.clock.now()
+        releases: dict[int, float] = {}
+        unknown = set()
+        for record in self.ledger.running:
+            started_at, predicted = self._launches.get(record.job.job_id, (now, None))
+            if predicted is None:
+                unknown.update(record.gpus)
+                continue
+            remaining = max(started_at + predicted - now, 0.0)
+            for i in record.gpus:
+                releases[i] = max(releases.get(i, 0.0), remaining)
+        return {i: remaining for i, remaining in releases.items() if i not in unknown}
+
+    def _failed(self, job: Job, assigned: list[int], kind: str, what: str) -> None:
+        """Re-queue a failed job after a delay depending on the class of the failure, or discard it."""
+        console.log(f"[red]Job {job} {what} on GPUs {assigned} ({kind})[/red]")
+        self.metrics.failure_classes.inc(kind=kind)
+        job.retry_count += 1
+        job.failures[kind] = job.failures.get(kind, 0) + 1
+        delay = self.retry_policy.delay(kind, job.failures[kind])
+        if delay is None or job.retry_count >= job.max_retries:
+            self.metrics.failures.inc(reason="discarded")
+            self._emit("discarded", id=job.job_id, kind=kind, retries=job.retry_count)
+            self._ended(job, succeeded=False)
+            send_job_notification(self.notifier, job, assigned, "failed")
+            reason = "reached max retries" if delay is not None else f"is not retried after a {kind} failure"
+            console.log(f"[red]Job {job} {reason} and is discarded[/red]")
+            return
+
+        if kind == OOM:
+            snapshot = self.gpu_manager.snapshot
+            # A job never spans the hosts of a cluster
+            num_gpus = max(Counter(gpu.get("host") for gpu in snapshot).values(), default=0)
+            max_memory = max((gpu["memory.total"] for gpu in snapshot), default=None)
+            if self.retry_policy.escalate(job, num_gpus, max_memory):
+                memory = f"{job.required_memory}M each" if job.required_memory is not None else "whole"
+                console.log(
+                    f"[yellow]Job {job} ran out of memory, it now asks for {job.required_gpus} GPUs ({memory})[/yellow]"
+                )
+
+        self._requeue(job, delay, kind)
+
+    def _requeue(self, job: Job, delay: float, kind: str) -> None:
+        """Queue a job again which is placed once the delay has passed."""
+        job.not_before = self.loop.clock.now() + delay
+        if self.journal is not None:
+            self.journal.requeued(job)
+        self._emit("retry", **describe_job(job), kind=kind, delay=delay)
+        self.metrics.retries.inc()
+        self.jobs.put(job)
+        console.log(f"[yellow]Job {job} re-queued in {delay:.0f}s (attempt {job.retry_count})[/yellow]")
+
+    def _ended(self, job: Job, succeeded: bool) -> None:
+        """Forget a job for good, and release or skip the blocked jobs depending on it."""
+        if self.journal is not None:
+            self.journal.ended(job)
+
+        released = False
+        with self._lock:
+            self._unfinished.discard(job.job_id)
+            self._outcomes[job.job_id] = succeeded
+            ended = deque([job.job_id])
+            while ended:
+                upstream = ended.popleft()
+                for blocked in [blocked for blocked in self._blocked.values() if upstream in blocked.after]:
+                    if not self._outcomes[upstream]:
+                        del self._blocked[blocked.job_id]
+                        self._unfinished.discard(blocked.job_id)
+                        self._skip(blocked, upstream)
+                        # Skipping is a failure, the jobs depending on the skipped job are skipped in turn
+                        ended.append(blocked.job_id)
+                    elif all(self._outcomes.get(i) for i in blocked.after):
+                        del self._blocked[blocked.job_id]
+                        self._emit("released", id=blocked.job_id)
+                        console.log(f"[green]Job {blocked} is queued, the jobs it runs after succeeded[/green]")
+                        self.jobs.put(blocked)
+                        released = True
+        if released:
+            self.loop.wake()
+
+    def _skip(self, job: Job, upstream: int) -> None:
+        """Drop a job since a job it depends on failed, the lock is held."""
+        self._outcomes[job.job_id] = False
+        if self.journal is not None:
+            self.journal.ended(job)
+        self._emit("skipped", id=job.job_id, upstream=upstream)
+        self.metrics.jobs_finished.inc(outcome="skipped")
+        console.log(f"[red]Job {job} is skipped since job {upstream}, which it runs after, did not succeed[/red]")
+
+    def stop(self) -> None:
+        """Make the scheduling loop return. Safe to call from any thread."""
+        self._stop.set()
+        self.loop.wake()
+
+    def run(self, status: Status, exit_when_idle: bool = True) -> None:
+        """Run the scheduling loop.
+
+        Args:
+            status (Status): Shows what the loop is waiting for.
+            exit_when_idle (bool): Return once no job is pending or running, otherwise run until `stop` is called.
+        """
+        gpu_manager, ledger, jobs, loop, holds = self.gpu_manager, self.ledger, self.jobs, self.loop, self.holds
+        last_free_gpu_indexes = None
+
+        while not self._stop.is_set() and (
+            not exit_when_idle or not jobs.empty() or len(ledger) or self._streams or self._blocked
+        ):
+            self.feed()
+            for event in self.launcher.poll():
+                self.handle_launch_event(event)
+            self._bind_claims()
+
+            if jobs.empty():
+                if holds is not None:
+                    holds.close()
+                # Only running jobs are left, the launcher wakes us up when they exit and new jobs when submitted
+                if len(ledger):
+                    status.update(f"[green]Waiting for {len(ledger)} running jobs to finish...[/green]")
+                else:
+                    status.update("[green]Waiting for jobs...[/green]")
+                loop.wait(changed=False)
+                continue
+
+            free_gpus = gpu_manager.get_free_gpus()
+            self.metrics.poll_duration.observe(gpu_manager.poll_stats.last)
+            free_gpu_indexes = [gpu["index"] for gpu in free_gpus]
+            self._emit(
+                "poll",
+                free=free_gpu_indexes,
+                pending=len(jobs),
+                running=len(ledger),
+                duration=gpu_manager.poll_stats.last,
+            )
+            changed = free_gpu_indexes != last_free_gpu_indexes
+            last_free_gpu_indexes = free_gpu_indexes
+            if changed and self.debug:
+                busy = {index: reasons for index, reasons in gpu_manager.rejections.items() if reasons}
+                console.log(f"[blue]Debug:[/blue] free GPUs {free_gpu_indexes}, rejected {busy}")
+
+            # GPUs which are free but not for the friendly amount of time yet wake us up when they qualify
+            next_stable_in = gpu_manager.telemetry.next_stable_in()
+            if next_stable_in is not None:
+                status.update(f"[yellow]Waiting {next_stable_in:.0f}s before allocating GPUs...[/yellow]")
+            else:
+                status.update("[green]Waiting for jobs...[/green]")
+
+            shared_gpus = gpu_manager.get_shared_gpus(free_gpus)
+            held_gpus = holds.held_gpus() if holds is not None else []
+            schedulable = sorted({*free_gpu_indexes, *held_gpus})
+            if not schedulable and not shared_gpus and not jobs.cpu_jobs:
+                loop.wait(changed, max_interval=next_stable_in)
+                continue
+
+            decision_start = time.process_time()
+            if self.history is not None:
+                placements = jobs.schedule(
+                    schedulable,
+                    topology=gpu_manager.topology,
+                    shared=shared_gpus,
+                    releases=self._releases(),
+                    estimate=self.history.estimate,
+                )
+            else:
+                placements = jobs.schedule(schedulable, topology=gpu_manager.topology, shared=shared_gpus)
+            if self.on_decision is not None:
+                self.on_decision(time.process_time() - decision_start)
+            for job, assigned in list(placements):
+                if gpu_manager.claims is not None and not gpu_manager.claims.claim(job.job_id, assigned):
+                    # Another instance got one of the GPUs first, the next poll sees it claimed
+                    placements.remove((job, assigned))
+                    jobs.put(job)
+                    console.log(f"[yellow]GPUs {assigned} were claimed by another instance, job {job} waits[/yellow]")
+                    continue
+                if holds is not None:
+                    # Free the placeholder memory only now, so the GPU is never up for grabs in between
+                    holds.release(assigned)
+                ledger.reserve(job, assigned)
+                if self.history is not None:
+                    self._launches[job.job_id] = (loop.clock.now(), self.history.estimate(job))
+                self.metrics.placed(job, assigned)
+                self._emit("placed", id=job.job_id, assigned=assigned, wait=loop.clock.now() - job.queued_at)
+                if self.journal is not None:
+                    self.journal.started(job, assigned)
+                self.launcher.launch(job, assigned)
+                console.log(f"Job {job} dispatched to GPUs {assigned}")
+            if placements:
+                self._bind_claims()
+
+            if holds is not None and not jobs.empty():
+                assigned_gpus = {i for _, assigned in placements for i in assigned}
+                holds.update([gpu for gpu in free_gpus if gpu["index"] not in assigned_gpus])
+
+            if not placements:
+                next_ready_in = jobs.next_ready_in()
+                if changed:
+                    self._log_waiting(schedulable, next_ready_in)
+                # Failed jobs which are done backing off wake us up as well
+                waits = [wait for wait in (next_stable_in, next_ready_in) if wait is not None]
+                loop.wait(changed, max_interval=min(waits, default=None))
+
+    def _log_waiting(self, schedulable: list[int], next_ready_in: float | None) -> None:
+        """Log why no pending job was placed, either none fits or they are backing off before their retry."""
+        waiting = len(self.jobs)
+        backing_off = self.jobs.backing_off() if next_ready_in is not None else 0
+        due = f"the next one is due in {next_ready_in:.0f}s" if next_ready_in is not None else ""
+        if backing_off and backing_off == waiting:
+            console.log(f"[yellow]{backing_off} jobs are backing off before their retry, {due}[/yellow]")
+        elif backing_off:
+            console.log(
+                f"[yellow]No pending job fits on the free GPUs {schedulable} ({waiting} jobs waiting, "
+                f"{backing_off} of them backing off before their retry, {due})[/yellow]"
+            )
+        else:
+            console.log(f"[yellow]No pending job fits on the free GPUs {schedulable} ({waiting} jobs waiting)[/yellow]")
+
+    def close(self) -> None:
+        """Release the held GPUs and close the launcher, the journal, the events, the notifier and the GPU manager."""
+        if self.holds is not None:
+            self.holds.close()
+        self.launcher.close()
+        if self.journal is not None:
+            self.journal.close()
+        if self.events is not None:
+            self.events.close()
+        self.notifier.close()
+        self.gpu_manager.close()
+
+
+def describe_job(job: Job) -> dict[str, Any]:
+    """Describe a job as a JSON-serializable dictionary."""
+    return {
+        "id": job.job_id,
+        "cmd": job.cmd,
+        "gpus": job.required_gpus,
+        "memory": job.required_memory,
+        "priority": job.priority,
+        "retries": job.retry_count,
+        "after": job.after,
+    }
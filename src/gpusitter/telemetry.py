@@ -0,0 +1,47 @@
+from gpusitter.scheduler import Clock
+
+
+class GPUTelemetry:
+    """Follow the polls of every GPU and tell which GPUs have been free for long enough."""
+
+    def __init__(self, stability_window: float = 0.0, clock: Clock | None = None) -> None:
+        """Initialize the telemetry.
+
+        Args:
+            stability_window (float): The seconds a GPU has to stay free before it counts as stably free.
+            clock (Clock | None): The clock to time the polls with.
+        """
+        self.stability_window = stability_window
+        self.clock = clock if clock is not None else Clock()
+
+        # The time since which each GPU has passed the predicates of the GPU manager without interruption, by index
+        self.above_since: dict[int, float] = {}
+
+    def record(self, gpus: list[dict[str, int]], available: set[int]) -> None:
+        """Record a poll of the GPUs.
+
+        Args:
+            gpus (list[dict[str, int]]): The GPUs of the poll.
+            available (set[int]): The indices of the GPUs which count as free in this poll.
+        """
+        now = self.clock.now()
+        for gpu in gpus:
+            if gpu["index"] not in available:
+                self.above_since.pop(gpu["index"], None)
+            else:
+                self.above_since.setdefault(gpu["index"], now)
+
+    def stable_gpus(self) -> set[int]:
+        """Get the indices of the GPUs which have been free for the whole stability window."""
+        cutoff = self.clock.now() - self.stability_window
+        return {index for index, since in self.above_since.items() if since <= cutoff}
+
+    def next_stable_in(self) -> float | None:
+        """Get the seconds until the next free GPU becomes stably free, or None if no GPU is on its way."""
+        now = self.clock.now()
+        waits = [
+            since + self.stability_window - now
+            for since in self.above_since.values()
+            if since + self.stability_window > now
+        ]
+        return min(waits) if waits else None
@@ -0,0 +1,91 @@
+import itertools
+import math
+from collections.abc import Iterable, Sequence
+
+# The cost of the link between two GPUs, lower is better connected. The PCIe costs are the values of the NVML topology
+# levels (NVML_TOPOLOGY_SINGLE to NVML_TOPOLOGY_SYSTEM) of the closest common ancestor, a direct NVLink connection beats
+# all of them. They are spelled out so that the job parser and the clients do not have to load NVML.
+NVLINK = 5
+PCIE_SWITCH = 10
+PCIE_SWITCHES = 20
+HOST_BRIDGE = 30
+NUMA_NODE = 40
+CROSS_SOCKET = 50
+# GPUs of different hosts of a cluster, a job never spans hosts
+CROSS_HOST = CROSS_SOCKET + 10
+
+
+class Topology:
+    """The interconnect of the GPUs of a host or a cluster as a symmetric matrix of link costs indexed by GPU index.
+
+    GPUs linked by `CROSS_HOST` are on different hosts and never assigned to the same job.
+    """
+
+    def __init__(self, costs: list[list[int]], max_combinations: int = 5000) -> None:
+        """Initialize the topology.
+
+        Args:
+            costs (list[list[int]]): The link cost between every pair of GPUs.
+            max_combinations (int): The number of candidate subsets up to which the best subset is searched
+                exhaustively, larger searches grow a subset greedily from every free GPU instead.
+        """
+        if any(len(row) != len(costs) for row in costs):
+            raise ValueError("The topology matrix must be square.")
+
+        self.costs = costs
+        self.max_combinations = max_combinations
+        # The host of every GPU as the lowest index it shares a host with
+        self._hosts = [next(j for j, cost in enumerate(row) if cost < CROSS_HOST) for row in costs]
+
+    def __len__(self) -> int:
+        """Get the number of GPUs."""
+        return len(self.costs)
+
+    def score(self, gpus: list[int]) -> tuple[int, int]:
+        """Score a subset of GPUs, lower is better.
+
+        The slowest link comes first since it bounds collective operations like all-reduce, the total cost of all
+        links breaks ties.
+        """
+        links = [self.costs[a][b] for a, b in itertools.combinations(gpus, 2)]
+        return (max(links), sum(links)) if links else (0, 0)
+
+    def best_subset(self, free_gpus: list[int], count: int) -> list[int] | None:
+        """Choose the best-connected `count` GPUs among the free GPUs.
+
+        GPUs which are not part of the matrix are only used when the known GPUs do not suffice. Ties are broken in
+        favour of the GPUs which come first in `free_gpus`.
+
+        Returns:
+            list[int] | None: The chosen GPUs, or None if no single host has `count` free GPUs.
+        """
+        known = [i for i in free_gpus if 0 <= i < len(self)]
+        if count <= 1 or len(known) < count:
+            return list(free_gpus[:count])
+
+        # Search every host on its own, which also keeps the search small on large clusters
+        hosts: dict[int, list[int]] = {}
+        for i in known:
+            hosts.setdefault(self._hosts[i], []).append(i)
+        candidates = itertools.chain.from_iterable(
+            self._candidates(gpus, count) for gpus in hosts.values() if len(gpus) >= count
+        )
+
+        best = min(candidates, key=self.score, default=None)
+        return sorted(best, key=free_gpus.index) if best is not None else None
+
+    def _candidates(self, known: list[int], count: int) -> Iterable[Sequence[int]]:
+        if math.comb(len(known), count) <= self.max_combinations:
+            return itertools.combinations(known, count)
+        return (self._grow(seed, known, count) for seed in known)
+
+    def _grow(self, seed: int, known: list[int], count: int) -> list[int]:
+        subset = [seed]
+        while len(subset) < count:
+            subset.append(
+                min(
+                    (i for i in known if i not in subset),
+                    key=lambda i: (max(self.costs[i][j] for j in subset), sum(self.costs[i][j] for j in subset)),
+                )
+            )
+        return subset
@@ -1,14 +1,12 @@
+import functools
 import getpass
-import queue
 import socket
 import time
+from collections.abc import Iterable
 from contextlib import nullcontext
 
-import psutil
-from rich.live import Live
-from rich.spinner import Spinner
-
 from gpusitter.gpu import GPUManager
+from gpusitter.jobs import Job
 from gpusitter.logger import console
 
 
@@ -37,6 +35,9 @@ def compute_storage_size(memory: int, dtype: str = "float32", len_shape: int = 3
 
 def countdown_timer(minutes: int | float, description: str = "Waiting", debug: bool = False) -> None:
     """Display a spinner with MM:SS countdown for the given minutes."""
+    from rich.live import Live
+    from rich.spinner import Spinner
+
     total_seconds = int(minutes * 60)
 
     context = nullcontext() if debug else Live(console=console, refresh_per_second=10)
@@ -63,24 +64,65 @@ class DummyStatus:
         console.log(message)
 
 
-def check_jobs(jobs: queue.Queue, gpu_manager: GPUManager) -> list | None:
-    """Check the status of jobs in the queue and allocate GPUs as needed."""
-    all_gpus = gpu_manager.get_all_gpus()
+class NullStatus:
+    """A status which shows nothing, for runs without a terminal and for simulations.
+
+    Rendering the spinner of a rich status takes a thread and CPU time on every refresh, which nobody sees when the
+    output goes to a log file or a simulated pass is measured.
+    """
+
+    def update(self, message: str) -> None:
+        """Drop the message."""
+
 
-    failure_results = [job for job in list(jobs.queue) if job.required_gpus > len(all_gpus)]
+def unfit_jobs(
+    jobs: Iterable[Job], gpus: list[dict[str, int]], max_memory_fraction: float, max_gpus: int | None = None
+) -> list[Job]:
+    """Get the jobs which never fit on the GPUs, since they ask for more GPUs or more memory per GPU than there is.
 
+    Args:
+        jobs (Iterable[Job]): The jobs to check.
+        gpus (list[dict[str, int]]): All GPUs, e.g. of the last poll.
+        max_memory_fraction (float): The fraction of the total memory of a GPU which memory-sized jobs may reserve.
+        max_gpus (int | None): The most GPUs one job can get, e.g. those of the largest host of a cluster. If None,
+            all GPUs.
+    """
+    max_gpus = len(gpus) if max_gpus is None else max_gpus
+    max_memory = max((gpu["memory.total"] for gpu in gpus), default=0) * max_memory_fraction
+    return [
+        job
+        for job in jobs
+        if job.required_gpus > max_gpus or (job.required_memory is not None and job.required_memory > max_memory)
+    ]
+
+
+def describe_unfit(job: Job, num_gpus: int) -> str:
+    """Explain why a job of `unfit_jobs` never fits, when one job can get at most `num_gpus` GPUs."""
+    if job.required_gpus > num_gpus:
+        return f"Job {job} requires more GPUs: {job.required_gpus} than available {num_gpus}."
+    return f"Job {job} requires more memory per GPU than any GPU can offer."
+
+
+def check_jobs(jobs: Iterable[Job], gpu_manager: GPUManager) -> list | None:
+    """Check that the pending jobs fit on the GPUs at all, returning the ones which never will."""
+    gpus = gpu_manager.inventory()
+    failure_results = unfit_jobs(jobs, gpus, gpu_manager.max_memory_fraction, gpu_manager.max_job_gpus(gpus))
     return failure_results if failure_results else None
 
 
+@functools.cache
 def get_server_info() -> tuple[str, str | None, str]:
-    """Get server information including hostname and GPU details."""
+    """Get server information including hostname and GPU details, it is looked up once per process."""
+    import psutil
+
     hostname = socket.gethostname()
     username = getpass.getuser()
 
     iface = "ppp0"
     ip = None
-    if iface in psutil.net_if_addrs():
-        for snic in psutil.net_if_addrs()[iface]:
+    addrs = psutil.net_if_addrs()
+    if iface in addrs:
+        for snic in addrs[iface]:
             if snic.family == 2:  # AF_INET
                 ip = snic.address
 
@@ -1,8 +1,11 @@
 from dataclasses import asdict
 from pathlib import Path
+from types import SimpleNamespace
 
+import pynvml
 import pytest
 import tomli_w
+from pytest_mock import MockerFixture
 
 from gpusitter.configs import ConfigData
 
@@ -30,3 +33,23 @@ def config_data() -> ConfigData:
         email_sender="sender@example.com",
         email_receivers=["receiver@example.com"],
     )
+
+
+@pytest.fixture
+def fake_nvml(mocker: MockerFixture) -> SimpleNamespace:
+    """Fixture to replace the NVML calls with two fake 80 GiB devices."""
+    mem = SimpleNamespace(free=60 * 1024**3, total=80 * 1024**3)
+    return SimpleNamespace(
+        init=mocker.patch("gpusitter.gpu.pynvml.nvmlInit"),
+        shutdown=mocker.patch("gpusitter.gpu.pynvml.nvmlShutdown"),
+        count=mocker.patch("gpusitter.gpu.pynvml.nvmlDeviceGetCount", return_value=2),
+        handle=mocker.patch("gpusitter.gpu.pynvml.nvmlDeviceGetHandleByIndex", side_effect=lambda i: f"handle{i}"),
+        memory=mocker.patch("gpusitter.gpu.pynvml.nvmlDeviceGetMemoryInfo", return_value=mem),
+        utilization=mocker.patch(
+            "gpusitter.gpu.pynvml.nvmlDeviceGetUtilizationRates", return_value=SimpleNamespace(gpu=3)
+        ),
+        compute_mode=mocker.patch(
+            "gpusitter.gpu.pynvml.nvmlDeviceGetComputeMode", return_value=pynvml.NVML_COMPUTEMODE_DEFAULT
+        ),
+        processes=mocker.patch("gpusitter.gpu.pynvml.nvmlDeviceGetComputeRunningProcesses", return_value=[]),
+    )
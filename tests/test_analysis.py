@@ -0,0 +1,43 @@
+from gpusitter.analysis import analyze, format_analysis, format_duration
+
+
+def test_analyze_timelines() -> None:
+    """Test that waits, runs, retries and the idle spells of the GPUs are rebuilt from the events."""
+    events = [
+        {"t": 100, "event": "submit", "id": 1, "cmd": "python train.py", "gpus": 2},
+        {"t": 100, "event": "submit", "id": 2, "cmd": "python eval.py", "gpus": 1},
+        # GPU 1 is busy with a foreign job, job 1 waits for it while GPU 0 is idle
+        {"t": 100, "event": "poll", "free": [0], "pending": 2, "running": 0},
+        {"t": 100, "event": "placed", "id": 2, "assigned": [0], "wait": 0},
+        {"t": 110, "event": "exited", "id": 2, "assigned": [0], "returncode": 1},
+        {"t": 110, "event": "retry", "id": 2, "cmd": "python eval.py", "gpus": 1, "kind": "oom", "delay": 50},
+        # GPU 0 is idle while job 1 waits for GPU 1, job 2 backing off until 160 does not count as waiting
+        {"t": 110, "event": "poll", "free": [0], "pending": 2, "running": 0},
+        {"t": 120, "event": "poll", "free": [0, 1], "pending": 2, "running": 0},
+        {"t": 130, "event": "poll", "free": [0, 1], "pending": 1, "running": 0},
+        {"t": 130, "event": "placed", "id": 1, "assigned": [0, 1], "wait": 30},
+        {"t": 160, "event": "poll", "free": [], "pending": 1, "running": 1},
+        {"t": 190, "event": "exited", "id": 1, "assigned": [0, 1], "returncode": 0},
+        {"t": 190, "event": "placed", "id": 2, "assigned": [1], "wait": 80},
+        {"t": 200, "event": "submit", "id": 3, "cmd": "python test.py", "gpus": 1},
+        {"t": 200, "event": "cancelled", "id": 3, "state": "queued"},
+    ]
+    analysis = analyze(events)
+    assert analysis.span == 100
+
+    train, evaluate, test = analysis.jobs
+    assert (train.state, train.wait, train.run, train.assigned) == ("succeeded", 30, 60, [0, 1])
+    # Still running at the end of the log
+    assert (evaluate.state, evaluate.attempts, evaluate.wait, evaluate.run) == ("running", 2, 80, 20)
+    assert (test.state, test.wait, test.ended) == ("cancelled", 0, 100)
+
+    gpu0, gpu1 = analysis.gpus
+    assert (gpu0.busy, gpu0.idle, gpu0.spells) == (70, 20, [(10, 30)])
+    assert (gpu1.busy, gpu1.idle, gpu1.spells) == (70, 10, [(20, 30)])
+    assert analysis.idle_fraction == 0.15
+    assert "GPUs idle while jobs waited 15.0%" in format_analysis(analysis)
+
+
+def test_format_duration() -> None:
+    """Test that durations are shown in the largest fitting unit."""
+    assert [format_duration(s) for s in (45, 750, 11520)] == ["45s", "12.5m", "3.2h"]
@@ -0,0 +1,74 @@
+from pathlib import Path
+
+import pytest
+
+from gpusitter.backends import GPUBackend, ReplayBackend, SimulatedBackend, TraceRecorder
+from gpusitter.gpu import GPUManager
+from gpusitter.scheduler import VirtualClock
+
+
+def test_simulated_backend() -> None:
+    """Test that fake jobs consume memory until they are released or their duration has passed."""
+    clock = VirtualClock()
+    backend = SimulatedBackend(num_gpus=4, memory_total=1000, clock=clock)
+    backend.allocate("long", [0, 1], 900)
+    backend.allocate("short", [2], 500, duration=10)
+
+    gpu_manager = GPUManager(gpu_free_memory_ratio_threshold=0.85, backend=backend)
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [3]
+
+    clock.advance(10)
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [2, 3]
+
+    backend.release("long")
+    assert len(gpu_manager.get_free_gpus()) == 4
+
+
+def test_record_and_replay_trace(tmp_path: Path) -> None:
+    """Test that a recorded trace is played back poll by poll."""
+    trace = tmp_path / "trace.jsonl"
+    simulated = SimulatedBackend(num_gpus=2, memory_total=1000, clock=VirtualClock())
+    recorder = TraceRecorder(simulated, trace)
+    first = recorder.query()
+    simulated.allocate("job", [1], 600)
+    second = recorder.query()
+    recorder.close()
+
+    replay = ReplayBackend(trace)
+    assert replay.query() == first
+    assert replay.query() == second
+    assert replay.query() == second
+
+
+def test_replay_follows_clock(tmp_path: Path) -> None:
+    """Test that a replay on a clock keeps the recorded timing."""
+    trace = tmp_path / "trace.jsonl"
+    trace.write_text(
+        '{"time": 100.0, "gpus": [{"index": 0, "memory.free": 1000, "memory.total": 1000}]}\n'
+        '{"time": 160.0, "gpus": [{"index": 0, "memory.free": 0, "memory.total": 1000}]}\n'
+    )
+
+    clock = VirtualClock()
+    replay = ReplayBackend(trace, clock=clock)
+    assert replay.query()[0]["memory.free"] == 1000
+    clock.advance(59)
+    assert replay.query()[0]["memory.free"] == 1000
+    clock.advance(1)
+    assert replay.query()[0]["memory.free"] == 0
+
+
+def test_backends_must_implement_query() -> None:
+    """Test that a backend without `query` cannot be created, while `topology` and `close` are optional."""
+
+    class Incomplete(GPUBackend):
+        pass
+
+    class Minimal(GPUBackend):
+        def query(self) -> list[dict[str, int]] | None:
+            return None
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()
+    backend = Minimal()
+    assert backend.topology() is None
+    backend.close()
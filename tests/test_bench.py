@@ -0,0 +1,98 @@
+import subprocess
+import sys
+import threading
+from dataclasses import asdict, replace
+from pathlib import Path
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.bench import (
+    SimulatedLauncher,
+    SimulationClock,
+    StartupResult,
+    compare,
+    compare_startup,
+    make_workload,
+    run_cluster,
+    startup_commands,
+    time_startup,
+)
+from gpusitter.jobs import Job
+
+
+def test_simulation_clock_jumps_to_events() -> None:
+    """Test that the clock wakes up at the next event within the timeout, and sleeps through it otherwise."""
+    events = [5.0]
+    clock = SimulationClock(lambda: events[0] if events else None)
+    assert clock.wait(threading.Event(), 10.0)
+    assert clock.now() == 5.0
+
+    events.clear()
+    assert not clock.wait(threading.Event(), 10.0)
+    assert clock.now() == 15.0
+
+
+def test_simulated_jobs_can_be_cancelled() -> None:
+    """Test that cancelling a simulated job frees its GPU right away and counts the time it ran as busy."""
+    clock = SimulationClock(lambda: None)
+    backend = SimulatedBackend(num_gpus=1, clock=clock)
+    job = Job("python train.py")
+    launcher = SimulatedLauncher(backend, clock, {job.job_id: 100.0})
+    launcher.launch(job, [0])
+    clock.advance(10.0)
+
+    assert launcher.cancel(job.job_id)
+    assert not launcher.cancel(job.job_id)
+    assert [event.kind for event in launcher.poll()] == ["started", "cancelled"]
+    assert launcher.next_exit() is None
+    assert launcher.busy_seconds == 10.0
+    assert backend.query()[0]["memory.free"] == backend.query()[0]["memory.total"]
+
+
+def test_run_cluster() -> None:
+    """Test that a simulated cluster runs the whole workload, with reproducible scheduling quality."""
+    result = run_cluster(8, jobs_per_gpu=2, seed=1)
+    workload = make_workload(8, 16, seed=1)
+
+    assert result.jobs == 16
+    assert result.makespan >= max(item.duration for item in workload)
+    assert 0 <= result.mean_wait <= result.p99_wait < result.makespan
+    assert 0 < result.idle_fraction < 1
+    assert result.decisions > 0
+    assert result.decision_cpu_mean > 0
+
+    again = run_cluster(8, jobs_per_gpu=2, seed=1)
+    assert (again.makespan, again.mean_wait, again.idle_fraction) == (
+        result.makespan,
+        result.mean_wait,
+        result.idle_fraction,
+    )
+    assert compare([again], [asdict(result)]) == []
+    assert compare([replace(again, mean_wait=result.mean_wait * 1.1)], [asdict(result)]) == [
+        f"8 GPUs: mean_wait {result.mean_wait * 1.1:.4g} > baseline {result.mean_wait:.4g}"
+    ]
+
+
+def test_run_cluster_with_history() -> None:
+    """Test that the runtimes are learned while the workload runs, and that the predictions are scored."""
+    result = run_cluster(8, jobs_per_gpu=2, seed=1, history=True)
+    assert result.jobs == 16
+    assert result.prediction_error is not None
+    assert result.prediction_error > 0
+    assert run_cluster(8, jobs_per_gpu=2, seed=1).prediction_error is None
+
+
+def test_startup(tmp_path: Path) -> None:
+    """Test that a headless run starts without prompting and that the entry point imports no unused subsystem."""
+    result = time_startup("headless", startup_commands(tmp_path)["headless"], runs=1)
+    assert result.runs == 1
+    assert 0 < result.min == result.median == result.max
+    assert (tmp_path / "logs" / "job_1.log").exists()
+
+    unused = ["gpusitter.bench", "gpusitter.cluster", "gpusitter.sitter", "pynvml", "smtplib", "http.server"]
+    script = f"import sys, gpusitter.main; print([m for m in {unused!r} if m in sys.modules])"
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout  # noqa: S603
+    assert output == "[]\n"
+
+    baseline = [asdict(StartupResult("headless", 5, 0.1, 0.2, 0.3))]
+    assert compare_startup([replace(result, median=0.24)], baseline) == []
+    assert compare_startup([replace(result, median=0.3)], baseline) == ["headless: median 300ms > baseline 200ms"]
@@ -0,0 +1,98 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.claims import GPUClaims
+from gpusitter.gpu import GPUManager
+
+
+def test_claims_exclude_other_instances(tmp_path: Path) -> None:
+    """Test that a GPU claimed by one instance is off limits for another until all jobs on it are released."""
+    first, second = GPUClaims(tmp_path), GPUClaims(tmp_path)
+    try:
+        assert first.claim(1, [0, 1])
+        # A memory-sized job of the same instance shares the claim
+        assert first.claim(2, [1])
+        assert second.claimed_by_others([0, 1, 2]) == {0, 1}
+
+        # All or nothing: GPU 2 is not left claimed by the failed attempt
+        assert not second.claim(3, [1, 2])
+        assert first.claimed_by_others([2]) == set()
+
+        first.release(1)
+        assert second.claimed_by_others([0, 1, 2]) == {1}
+        first.release(2)
+        assert second.claim(3, [1, 2])
+        assert first.claimed_by_others([0, 1, 2]) == {1, 2}
+    finally:
+        first.close()
+        second.close()
+
+
+def test_claims_expire_with_their_process(tmp_path: Path) -> None:
+    """Test that the claims of an instance which dies are gone without any cleanup."""
+    script = (
+        "import sys; from gpusitter.claims import GPUClaims; "
+        f"claims = GPUClaims({str(tmp_path)!r}); claims.claim(1, [0]); print('claimed', flush=True); sys.stdin.read()"
+    )
+    process = subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)  # noqa: S603
+    claims = GPUClaims(tmp_path)
+    try:
+        assert process.stdout.readline() == "claimed\n"
+        assert claims.claimed_by_others([0]) == {0}
+
+        process.kill()
+        process.wait()
+        assert claims.claimed_by_others([0]) == set()
+    finally:
+        process.kill()
+        process.wait()
+        process.stdin.close()
+        process.stdout.close()
+        claims.close()
+
+
+def test_claims_outlive_their_instance_with_the_job(tmp_path: Path) -> None:
+    """Test that a claim bound to the process of a job keeps the GPU claimed after its instance is gone."""
+    job = subprocess.Popen(["sleep", "30"])  # noqa: S607
+    first, second = GPUClaims(tmp_path), GPUClaims(tmp_path)
+    try:
+        assert first.claim(1, [0, 1])
+        assert first.unbound() == [1]
+        first.bind(1, job.pid)
+        assert first.unbound() == []
+        first.close()
+
+        assert second.claimed_by_others([0, 1, 2]) == {0, 1}
+        assert not second.claim(2, [1])
+        # A restarted instance adopts the claim of its running job
+        assert second.claim(1, [0, 1], pid=job.pid)
+        second.release(1)
+        assert not list(tmp_path.glob("*.lease"))
+
+        first = GPUClaims(tmp_path)
+        assert first.claim(1, [0], pid=job.pid)
+        first.close()
+        job.kill()
+        job.wait()
+        assert second.claimed_by_others([0]) == set()
+        assert not list(tmp_path.glob("*.lease"))
+    finally:
+        job.kill()
+        job.wait()
+        first.close()
+        second.close()
+
+
+def test_claimed_gpus_are_not_free(tmp_path: Path) -> None:
+    """Test that the GPU manager rejects the GPUs claimed by another instance."""
+    other = GPUClaims(tmp_path)
+    gpu_manager = GPUManager(backend=SimulatedBackend(num_gpus=2), claims=GPUClaims(tmp_path))
+    try:
+        assert other.claim(1, [1])
+        assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [0]
+        assert gpu_manager.rejections[1] == ["claimed"]
+    finally:
+        gpu_manager.close()
+        other.close()
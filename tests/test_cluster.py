@@ -0,0 +1,214 @@
+import threading
+import time
+from collections.abc import Callable, Iterator
+
+import pytest
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.cluster import AgentServer, ClusterBackend, ClusterLauncher
+from gpusitter.emails import EmailManager, EmailNotifier
+from gpusitter.gpu import GPUManager
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.ledger import GPULedger
+from gpusitter.scheduler import SchedulerLoop
+from gpusitter.sitter import GPUSitter
+from gpusitter.topology import CROSS_HOST, CROSS_SOCKET, NVLINK, Topology
+from gpusitter.utils import DummyStatus
+
+TOKEN = "secret"  # noqa: S105
+
+
+class LocalLauncher(Launcher):
+    """Record the launches of an agent, the test decides when the jobs exit."""
+
+    def __init__(self, wake: threading.Event) -> None:
+        """Initialize the launcher."""
+        self.wake = wake
+        self.launched: dict[int, tuple[Job, list[int]]] = {}
+        self.events: list[LaunchEvent] = []
+        self.lock = threading.Lock()
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Confirm the job right away."""
+        with self.lock:
+            self.launched[job.job_id] = (job, gpus)
+            self.events.append(LaunchEvent(job, gpus, "started", latency=0.01))
+        self.wake.set()
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Follow the job."""
+        with self.lock:
+            self.launched[job.job_id] = (job, gpus)
+
+    def exit(self, job_id: int, returncode: int = 0) -> None:
+        """Let a job exit."""
+        with self.lock:
+            job, gpus = self.launched.pop(job_id)
+            self.events.append(LaunchEvent(job, gpus, "exited", returncode))
+        self.wake.set()
+
+    def poll(self) -> list[LaunchEvent]:
+        """Hand the events over."""
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a job."""
+        with self.lock:
+            launch = self.launched.pop(job_id, None)
+            if launch is not None:
+                self.events.append(LaunchEvent(*launch, "cancelled"))
+        self.wake.set()
+        return launch is not None
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    """Wait until the condition holds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def agents() -> Iterator[list[tuple[AgentServer, SimulatedBackend, LocalLauncher]]]:
+    """Run three local agents with two simulated GPUs each."""
+    started = []
+    for _ in range(3):
+        wake = threading.Event()
+        backend = SimulatedBackend(num_gpus=2)
+        launcher = LocalLauncher(wake)
+        agent = AgentServer(backend, launcher, TOKEN, port=0, poll_interval=0.02, wake=wake)
+        agent.start()
+        started.append((agent, backend, launcher))
+    yield started
+    for agent, _, _ in started:
+        agent.close()
+
+
+def test_coordinator_follows_the_gpus_of_the_agents(agents: list) -> None:
+    """Test that the GPUs of all agents are numbered globally and that changes reach the coordinator."""
+    cluster = ClusterBackend([f"127.0.0.1:{agent.port}" for agent, _, _ in agents], TOKEN, max_gpus_per_host=4)
+    try:
+        assert [gpu["index"] for gpu in cluster.query()] == [0, 1, 4, 5, 8, 9]
+        assert cluster.locate([8, 9]) == (cluster.links[2], [0, 1])
+        with pytest.raises(ValueError, match="one host"):
+            cluster.locate([1, 4])
+
+        agents[1][1].allocate("other", [1], memory=40000)
+        wait_for(lambda: {gpu["index"]: gpu["memory.free"] for gpu in cluster.query()}[5] == 81920 - 40000)
+
+        topology = Topology(cluster.topology())
+        assert topology.costs[0][1] < CROSS_HOST
+        assert topology.costs[1][4] == CROSS_HOST
+    finally:
+        cluster.close()
+
+
+def test_wrong_token_is_rejected(agents: list) -> None:
+    """Test that a coordinator without the token never sees the GPUs of an agent."""
+    agent, _, _ = agents[0]
+    cluster = ClusterBackend([f"127.0.0.1:{agent.port}"], "wrong", connect_timeout=0.3)
+    try:
+        assert cluster.query() is None
+    finally:
+        cluster.close()
+
+
+def test_topology_follows_agents_which_join_late(agents: list) -> None:
+    """Test that the topology of an agent which connects after the first placement is picked up."""
+    wake = threading.Event()
+    late = AgentServer(
+        SimulatedBackend(num_gpus=2, topology=[[0, NVLINK], [NVLINK, 0]]),
+        LocalLauncher(wake),
+        TOKEN,
+        port=0,
+        poll_interval=0.02,
+        wake=wake,
+    )
+    addresses = [f"127.0.0.1:{agents[0][0].port}", f"127.0.0.1:{late.port}"]
+    cluster = ClusterBackend(addresses, TOKEN, max_gpus_per_host=4, connect_timeout=0.3)
+    gpu_manager = GPUManager(backend=cluster)
+    try:
+        assert gpu_manager.topology.costs[4][5] == CROSS_SOCKET
+
+        late.start()
+        wait_for(cluster.links[1].ready.is_set)
+        assert gpu_manager.topology.costs[4][5] == NVLINK
+        assert gpu_manager.topology.costs[0][4] == CROSS_HOST
+    finally:
+        cluster.close()
+        late.close()
+
+
+def test_sitter_places_jobs_on_hosts(agents: list) -> None:
+    """Test that multi-GPU jobs are placed within one host, run through its agent until they exit, and must fit it."""
+    cluster = ClusterBackend([f"127.0.0.1:{agent.port}" for agent, _, _ in agents], TOKEN, max_gpus_per_host=4)
+    ledger = GPULedger()
+    gpu_manager = GPUManager(backend=cluster, ledger=ledger)
+    loop = SchedulerLoop(JobQueue())
+    notifier = EmailNotifier(EmailManager("localhost:1", "user", "pwd", "sender", "receiver", use_ssl=False))
+    sitter = GPUSitter(gpu_manager, ledger, loop, ClusterLauncher(cluster, on_event=loop.wake), notifier)
+    jobs = [Job("python train.py", required_gpus=2) for _ in range(4)]
+    for job in jobs:
+        sitter.submit(job)
+
+    thread = threading.Thread(target=sitter.run, args=(DummyStatus(),), kwargs={"exit_when_idle": True})
+    thread.start()
+    try:
+        wait_for(lambda: sum(len(launcher.launched) for _, _, launcher in agents) == 3)
+        for _, _, launcher in agents:
+            assert [gpus for _, gpus in launcher.launched.values()] == [[0, 1]]
+        # No job gets more GPUs than one host has, though there are 6 in all
+        with pytest.raises(ValueError, match="requires more GPUs: 3 than available 2"):
+            sitter.check_fit([Job("python train.py", required_gpus=3)])
+
+        # The last job gets the host which frees up first
+        first = next(iter(agents[1][2].launched))
+        agents[1][2].exit(first)
+        wait_for(lambda: jobs[3].job_id in agents[1][2].launched)
+
+        for _, _, launcher in agents:
+            for job_id in list(launcher.launched):
+                launcher.exit(job_id)
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+    finally:
+        sitter.stop()
+        thread.join()
+        sitter.close()
+        cluster.close()
+
+
+def test_jobs_never_span_hosts() -> None:
+    """Test that a job waits rather than taking GPUs of two hosts."""
+    costs = [[0 if a == b else NVLINK if a // 2 == b // 2 else CROSS_HOST for b in range(4)] for a in range(4)]
+    topology = Topology(costs)
+
+    assert topology.best_subset([1, 2, 3], 2) == [2, 3]
+    assert topology.best_subset([1, 3], 2) is None
+
+    jobs = JobQueue()
+    jobs.put(Job("python train.py", required_gpus=2))
+    jobs.put(Job("python eval.py"))
+    placements = jobs.schedule([1, 3], topology=topology)
+    assert [(job.cmd, gpus) for job, gpus in placements] == [("python eval.py", [1])]
+
+
+def test_launches_to_missing_agents_are_launcher_errors() -> None:
+    """Test that launches to an agent which is not connected, or across hosts, are launcher errors, not failures."""
+    cluster = ClusterBackend(["127.0.0.1:1"], TOKEN, max_gpus_per_host=4)
+    launcher = ClusterLauncher(cluster)
+    try:
+        launcher.launch(Job("python train.py"), [0])
+        launcher.launch(Job("python train.py", required_gpus=2), [3, 4])
+        events = launcher.poll()
+    finally:
+        launcher.close()
+        cluster.close()
+
+    assert [event.kind for event in events] == ["error", "error"]
+    assert "not connected" in events[0].output
+    assert "not on one host" in events[1].output
@@ -106,3 +106,29 @@ def test_confirm_config_update_then_keep(config_manager_with_path: ConfigManager
     assert config_manager_with_path.config is not None
     assert config_manager_with_path.config.gpu_free_memory_ratio_threshold == 0.9
     assert config_manager_with_path.config.friendly_min == 5
+
+
+def test_load_headless(config_manager_with_path: ConfigManager, mocker: MockerFixture) -> None:
+    """Test that the environment overrides the file and the overrides the environment, without any prompt."""
+    ask = mocker.patch("gpusitter.configs.prompt.ask")
+    environ = {"GPUSITTER_FRIENDLY_MIN": "0", "GPUSITTER_EMAIL_RECEIVERS": "a@x.com, b@y.com", "HOME": "/root"}
+
+    config_manager_with_path.load_headless({"friendly_min": "2.5"}, environ=environ)
+    config = config_manager_with_path.config
+    assert config.gpu_free_memory_ratio_threshold == 0.85
+    assert config.friendly_min == 2.5
+    assert config.email_host == "smtp.example.com"
+    assert config.email_receivers == ["a@x.com", "b@y.com"]
+    ask.assert_not_called()
+
+    with pytest.raises(ValueError, match="Unknown config key"):
+        config_manager_with_path.load_headless({"friendly": "1"}, environ={})
+
+
+def test_load_headless_without_file(tmp_path: Path) -> None:
+    """Test that a missing config file falls back to the defaults and no mails."""
+    config_manager = ConfigManager(config_path=tmp_path / "missing.toml")
+    config_manager.load_headless(environ={})
+
+    assert config_manager.config == ConfigData(gpu_free_memory_ratio_threshold=0.85, friendly_min=0.0)
+    assert not (tmp_path / "missing.toml").exists()
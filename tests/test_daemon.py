@@ -0,0 +1,191 @@
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.daemon import DaemonServer, request
+from gpusitter.emails import EmailManager, EmailNotifier
+from gpusitter.gpu import GPUManager
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.ledger import GPULedger
+from gpusitter.scheduler import SchedulerLoop
+from gpusitter.sitter import GPUSitter
+from gpusitter.utils import DummyStatus
+
+
+class RecordingLauncher(Launcher):
+    """Record the launches instead of running the jobs."""
+
+    def __init__(self, on_event: threading.Event) -> None:
+        """Initialize the launcher."""
+        self.on_event = on_event
+        self.launched: dict[int, tuple[Job, list[int]]] = {}
+        self.events: list[LaunchEvent] = []
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Record the launch."""
+        self.launched[job.job_id] = (job, gpus)
+        self.on_event.set()
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Record a job from before a restart like a launch."""
+        self.launch(job, gpus)
+
+    def poll(self) -> list[LaunchEvent]:
+        """Hand the recorded events over."""
+        events, self.events = self.events, []
+        return events
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a recorded launch."""
+        launch = self.launched.pop(job_id, None)
+        if launch is None:
+            return False
+        self.events.append(LaunchEvent(*launch, "cancelled"))
+        return True
+
+
+@pytest.fixture
+def sitter() -> Iterator[GPUSitter]:
+    """Fixture to provide a sitter on two simulated GPUs."""
+    ledger = GPULedger()
+    gpu_manager = GPUManager(backend=SimulatedBackend(num_gpus=2), ledger=ledger)
+    loop = SchedulerLoop(JobQueue())
+    notifier = EmailNotifier(EmailManager("localhost:1", "user", "pwd", "sender", "receiver", use_ssl=False))
+    sitter = GPUSitter(gpu_manager, ledger, loop, RecordingLauncher(threading.Event()), notifier)
+    yield sitter
+    sitter.close()
+
+
+@pytest.fixture
+def server(sitter: GPUSitter, tmp_path: Path) -> Iterator[DaemonServer]:
+    """Fixture to provide a daemon serving the sitter."""
+    server = DaemonServer(sitter, tmp_path / "gpusitter.sock")
+    server.start()
+    yield server
+    server.close()
+
+
+def test_submit_ls_cancel(server: DaemonServer) -> None:
+    """Test submitting, listing and cancelling pending jobs over the socket."""
+    job_ids = request({"op": "submit", "jobs": ["python a.py:2", "python b.py:1:mem=6G:priority=5"]}, server.path)[
+        "job_ids"
+    ]
+
+    jobs = request({"op": "ls"}, server.path)["jobs"]
+    assert [job["id"] for job in jobs] == [job_ids[1], job_ids[0]]
+    assert jobs[0] == {
+        "id": job_ids[1],
+        "cmd": "python b.py",
+        "gpus": 1,
+        "memory": 6144,
+        "priority": 5,
+        "retries": 0,
+        "after": [],
+        "state": "queued",
+        "assigned": [],
+    }
+
+    assert request({"op": "cancel", "job_ids": [job_ids[0], 12345]}, server.path)["cancelled"] == {
+        str(job_ids[0]): "queued"
+    }
+    assert [job["id"] for job in request({"op": "ls"}, server.path)["jobs"]] == [job_ids[1]]
+
+    with pytest.raises(RuntimeError, match="Invalid memory size"):
+        request({"op": "submit", "jobs": ["python c.py:mem=lots"]}, server.path)
+
+
+def test_submit_pipeline(server: DaemonServer) -> None:
+    """Test that the jobs of a request run after the names of earlier jobs, and unknown dependencies queue nothing."""
+    prep_id, train_id = request(
+        {"op": "submit", "jobs": ["python prep.py:0:name=prep", "python train.py:2:after=prep"]}, server.path
+    )["job_ids"]
+    jobs = request({"op": "ls"}, server.path)["jobs"]
+    assert [(job["id"], job["state"], job["after"]) for job in jobs] == [
+        (prep_id, "queued", []),
+        (train_id, "blocked", [prep_id]),
+    ]
+
+    with pytest.raises(RuntimeError, match="does not exist"):
+        request({"op": "submit", "jobs": ["python a.py", "python b.py:1:after=12345"]}, server.path)
+    with pytest.raises(RuntimeError, match="no earlier job has this name"):
+        request({"op": "submit", "jobs": ["python eval.py:1:after=prep"]}, server.path)
+    assert len(request({"op": "ls"}, server.path)["jobs"]) == 2
+
+
+def test_submit_rejects_jobs_which_never_fit(sitter: GPUSitter, server: DaemonServer) -> None:
+    """Test that a request with a job which asks for more GPUs or memory than there is queues nothing."""
+    sitter.gpu_manager.get_free_gpus()
+    with pytest.raises(RuntimeError, match="requires more GPUs: 3 than available 2"):
+        request({"op": "submit", "jobs": ["python a.py:1", "python b.py:3"]}, server.path)
+    with pytest.raises(RuntimeError, match="more memory per GPU"):
+        request({"op": "submit", "jobs": ["python c.py:1:mem=1T"]}, server.path)
+    assert request({"op": "ls"}, server.path)["jobs"] == []
+
+
+def test_daemon_schedules_submitted_jobs(sitter: GPUSitter, server: DaemonServer) -> None:
+    """Test that the daemon loop places submitted jobs right away and cancels running ones."""
+    thread = threading.Thread(target=sitter.run, args=(DummyStatus(),), kwargs={"exit_when_idle": False})
+    thread.start()
+    try:
+        (job_id,) = request({"op": "submit", "jobs": ["python train.py:2"]}, server.path)["job_ids"]
+        assert sitter.launcher.on_event.wait(5.0)
+
+        (job,) = request({"op": "ls"}, server.path)["jobs"]
+        assert (job["id"], job["state"], job["assigned"]) == (job_id, "running", [0, 1])
+
+        assert request({"op": "cancel", "job_ids": [job_id]}, server.path)["cancelled"] == {str(job_id): "running"}
+    finally:
+        sitter.stop()
+        thread.join(5.0)
+    assert not thread.is_alive()
+
+
+def test_submission_latency(server: DaemonServer) -> None:
+    """Test that a submission round trip takes about a millisecond, and listing thousands of jobs stays fast."""
+    start = time.perf_counter()
+    for i in range(200):
+        request({"op": "submit", "jobs": [f"python sweep.py --seed={i}"]}, server.path)
+    assert (time.perf_counter() - start) / 200 < 0.005
+
+    request({"op": "submit", "jobs": [f"python sweep.py --lr={i}" for i in range(5000)]}, server.path)
+    start = time.perf_counter()
+    assert len(request({"op": "ls"}, server.path)["jobs"]) == 5200
+    assert time.perf_counter() - start < 1.0
+
+
+def test_one_daemon_per_socket(sitter: GPUSitter, server: DaemonServer, tmp_path: Path) -> None:
+    """Test that a live daemon keeps its socket and a stale socket is replaced."""
+    with pytest.raises(RuntimeError, match="already listening"):
+        DaemonServer(sitter, server.path)
+
+    stale = tmp_path / "stale.sock"
+    stale.touch()
+    replacement = DaemonServer(sitter, stale)
+    replacement.close()
+    assert not stale.exists()
+
+
+def test_streamed_jobs_keep_the_queue_bounded(sitter: GPUSitter, server: DaemonServer, tmp_path: Path) -> None:
+    """Test that sweeps and job files are queued as the queue drains, a few jobs at a time."""
+    sitter.max_pending = 50
+    job_file = tmp_path / "jobs.txt"
+    job_file.write_text("python eval.py --split={train,val}\n")
+    response = request(
+        {"op": "submit", "jobs": ["python a.py", "python sweep.py --seed={0..999999}"], "files": [str(job_file)]},
+        server.path,
+    )
+    assert len(response["job_ids"]) == 1
+    assert response["streamed"] == ["python sweep.py --seed={0..999999}", str(job_file)]
+
+    assert sitter.feed() == 49
+    assert len(sitter.jobs) == 50
+    assert sitter.feed() == 0
+    for job in list(sitter.jobs)[:10]:
+        sitter.jobs.remove(job.job_id)
+    assert sitter.feed() == 10
+    assert [job.cmd for job in sitter.jobs][-1] == "python sweep.py --seed=58"
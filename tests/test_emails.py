@@ -0,0 +1,135 @@
+import socketserver
+import threading
+from collections.abc import Iterator
+from email import message_from_bytes
+from email.message import Message
+
+import pytest
+
+from gpusitter.emails import EmailManager, EmailNotifier, Notification, format_gpus
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    """A local stand-in SMTP server which accepts any login and keeps the received messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self) -> None:
+        """Listen on a free local port."""
+        super().__init__(("127.0.0.1", 0), StandInSMTPHandler)
+        self.connections = 0
+        self.messages: list[Message] = []
+        self.drop_after_message = False
+
+    @property
+    def address(self) -> str:
+        """The address as `host:port`."""
+        host, port = self.server_address
+        return f"{host}:{port}"
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Speak just enough SMTP for smtplib."""
+
+    server: StandInSMTPServer
+
+    def reply(self, line: str) -> None:
+        """Send a reply line."""
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        """Handle one connection."""
+        self.server.connections += 1
+        self.reply("220 localhost stand-in")
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith("EHLO"):
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command.startswith("AUTH"):
+                self.reply("235 authenticated")
+            elif command == "DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                self.server.messages.append(message_from_bytes(data))
+                self.reply("250 queued")
+                if self.server.drop_after_message:
+                    return
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp_server() -> Iterator[StandInSMTPServer]:
+    """Fixture to provide a running stand-in SMTP server."""
+    server = StandInSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def email_manager(smtp_server: StandInSMTPServer) -> EmailManager:
+    """Fixture to provide an email manager connected to the stand-in server."""
+    return EmailManager(
+        host_server=smtp_server.address,
+        user="user@example.com",
+        pwd="password",  # noqa: S106
+        sender="sender@example.com",
+        receivers="receiver@example.com",
+        use_ssl=False,
+    )
+
+
+def test_connection_is_reused(smtp_server: StandInSMTPServer, email_manager: EmailManager) -> None:
+    """Test that several mails are sent over one authenticated connection."""
+    for i in range(3):
+        email_manager.send_email(f"subject {i}", "body")
+    email_manager.close()
+
+    assert smtp_server.connections == 1
+    assert [message["Subject"] for message in smtp_server.messages] == ["subject 0", "subject 1", "subject 2"]
+
+
+def test_reconnects_after_drop(smtp_server: StandInSMTPServer, email_manager: EmailManager) -> None:
+    """Test that a connection dropped by the server is re-opened."""
+    smtp_server.drop_after_message = True
+    email_manager.send_email("first", "body")
+    email_manager.send_email("second", "body")
+    email_manager.close()
+
+    assert smtp_server.connections == 2
+    assert len(smtp_server.messages) == 2
+
+
+def test_notifier_coalesces_bursts(smtp_server: StandInSMTPServer, email_manager: EmailManager) -> None:
+    """Test that a burst of notifications becomes one digest mail which is flushed on close."""
+    notifier = EmailNotifier(email_manager, batch_window=60.0)
+    for i in range(12):
+        notifier.notify(Notification("started", [i % 8], f"Job {i} started", f"Job {i} started on GPU {i % 8}"))
+    notifier.close()
+
+    assert len(smtp_server.messages) == 1
+    assert smtp_server.messages[0]["Subject"] == "GPUSitter: 12 jobs started on GPUs 0-7"
+
+
+def test_notifier_without_mail_manager_drops_everything() -> None:
+    """Test that a notifier without an email manager starts no worker and drops the notifications."""
+    notifier = EmailNotifier()
+    notifier.notify(Notification("started", [0], "Job 1 started", "Job 1 started on GPU 0"))
+    notifier.close()
+
+    assert notifier._worker is None
+    assert notifier._queue.empty()
+
+
+def test_format_gpus() -> None:
+    """Test formatting GPU indices as ranges."""
+    assert format_gpus([3, 0, 1, 2, 6]) == "0-3, 6"
+    assert format_gpus([5]) == "5"
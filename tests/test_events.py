@@ -0,0 +1,92 @@
+from pathlib import Path
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.emails import EmailManager, EmailNotifier
+from gpusitter.events import EventLog, read_events
+from gpusitter.gpu import GPUManager
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.ledger import GPULedger
+from gpusitter.scheduler import SchedulerLoop
+from gpusitter.sitter import GPUSitter
+from gpusitter.utils import NullStatus
+
+
+class ExitingLauncher(Launcher):
+    """Start every job and let it exit right away, `true` successfully and anything else out of memory."""
+
+    def __init__(self) -> None:
+        """Initialize the launcher."""
+        self.events: list[LaunchEvent] = []
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Report the start and the exit of the job."""
+        self.events.append(LaunchEvent(job, gpus, "started"))
+        output = None if job.cmd == "true" else "CUDA out of memory"
+        self.events.append(LaunchEvent(job, gpus, "exited", 0 if output is None else 1, output=output))
+
+    def poll(self) -> list[LaunchEvent]:
+        """Hand the events over."""
+        events, self.events = self.events, []
+        return events
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Let a job from before a restart exit right away."""
+        self.events.append(LaunchEvent(job, gpus, "exited", 0))
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel nothing, the jobs exit right away."""
+        return False
+
+
+def test_event_log_rotates_and_reads_back(tmp_path: Path) -> None:
+    """Test that the events survive rotation and are read back in order across the backups."""
+    path = tmp_path / "events.jsonl"
+    for i in range(3):
+        # Every batch is larger than one byte, so the log is rotated after every one
+        log = EventLog(path, max_bytes=1, backups=3, clock=lambda i=i: i)
+        log.emit("poll", pending=i)
+        log.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [f"events.jsonl{suffix}" for suffix in ("", ".1", ".2", ".3")]
+
+    # A line cut off by a crash is skipped
+    path.write_text('{"t":3,"event":"poll","pending":3}\n{"t":4,"event":"po')
+    assert [(event["t"], event["pending"]) for event in read_events(path)] == [(0, 0), (1, 1), (2, 2), (3, 3)]
+
+
+def test_event_log_drops_instead_of_blocking(tmp_path: Path) -> None:
+    """Test that emitting never blocks when the writer falls behind, and the dropped events are counted."""
+    log = EventLog(tmp_path / "events.jsonl", flush_interval=60.0, max_pending=2)
+    for i in range(10):
+        log.emit("poll", pending=i)
+    log.close()
+    assert 0 < log.dropped <= 8
+    assert len(list(read_events(tmp_path / "events.jsonl"))) == 10 - log.dropped
+
+
+def test_sitter_emits_events(tmp_path: Path) -> None:
+    """Test that the sitter logs the submissions, polls, placements and exits of its jobs and discarded failures."""
+    ledger = GPULedger()
+    notifier = EmailNotifier(EmailManager(None, None, None, None, None))
+    events = EventLog(tmp_path / "events.jsonl", flush_interval=0.01)
+    sitter = GPUSitter(
+        GPUManager(backend=SimulatedBackend(num_gpus=2), ledger=ledger),
+        ledger,
+        SchedulerLoop(JobQueue()),
+        ExitingLauncher(),
+        notifier,
+        events=events,
+    )
+    try:
+        sitter.submit(Job("true", required_gpus=2))
+        sitter.submit(Job("false", required_gpus=2, max_retries=0))
+        sitter.run(NullStatus())
+    finally:
+        sitter.close()
+
+    logged = list(read_events(tmp_path / "events.jsonl"))
+    kinds = [event["event"] for event in logged]
+    assert kinds[:3] == ["submit", "submit", "poll"]
+    assert kinds.count("placed") == 2
+    assert [event["returncode"] for event in logged if event["event"] == "exited"] == [0, 1]
+    assert [event["kind"] for event in logged if event["event"] == "discarded"] == ["oom"]
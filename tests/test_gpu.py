@@ -1,4 +1,12 @@
-from gpusitter.gpu import query_gpu
+from types import SimpleNamespace
+
+import pynvml
+import pytest
+from pytest_mock import MockerFixture
+
+from gpusitter.backends import NVMLBackend, SimulatedBackend
+from gpusitter.gpu import GPUManager, default_predicates, query_gpu
+from gpusitter.topology import NVLINK
 
 
 def test_query_gpu() -> None:
@@ -11,3 +19,129 @@ def test_query_gpu() -> None:
     assert "index" in gpus[0]
     assert "memory.total" in gpus[0]
     assert "memory.free" in gpus[0]
+
+
+def test_session_caches_handles(fake_nvml: SimpleNamespace) -> None:
+    """Test that the session initializes NVML and looks up the handles only once."""
+    session = NVMLBackend()
+    for _ in range(3):
+        gpus = session.query()
+
+    assert [(gpu["index"], gpu["memory.free"], gpu["memory.total"]) for gpu in gpus] == [
+        (0, 61440, 81920),
+        (1, 61440, 81920),
+    ]
+    assert fake_nvml.init.call_count == 1
+    assert fake_nvml.handle.call_count == 2
+    fake_nvml.shutdown.assert_not_called()
+
+    session.close()
+    fake_nvml.shutdown.assert_called_once()
+    assert not session.active
+
+
+def test_session_reinitializes_on_nvml_error(fake_nvml: SimpleNamespace) -> None:
+    """Test that stale handles are dropped and NVML is re-initialized after an NVML error."""
+    session = NVMLBackend()
+    session.query()
+
+    mem = fake_nvml.memory.return_value
+    fake_nvml.memory.side_effect = [pynvml.NVMLError(pynvml.NVML_ERROR_GPU_IS_LOST), mem, mem]
+    assert len(session.query()) == 2
+    assert fake_nvml.init.call_count == 2
+    assert fake_nvml.shutdown.call_count == 1
+
+
+def test_session_raises_when_nvml_stays_broken(fake_nvml: SimpleNamespace) -> None:
+    """Test that a persistent NVML failure is reported as a RuntimeError."""
+    fake_nvml.init.side_effect = pynvml.NVMLError(pynvml.NVML_ERROR_DRIVER_NOT_LOADED)
+
+    with pytest.raises(RuntimeError):
+        NVMLBackend().query()
+
+
+def test_gpu_manager_records_poll_stats(fake_nvml: SimpleNamespace) -> None:
+    """Test that the GPU manager times every poll and closes the session on exit."""
+    with GPUManager(gpu_free_memory_ratio_threshold=0.5) as gpu_manager:
+        assert len(gpu_manager.get_free_gpus()) == 2
+        gpu_manager.get_all_gpus()
+        assert gpu_manager.poll_stats.count == 2
+        assert gpu_manager.poll_stats.max >= gpu_manager.poll_stats.mean > 0
+
+    fake_nvml.shutdown.assert_called_once()
+
+
+def test_startup_inventory_is_reused_once() -> None:
+    """Test that the first poll after the startup inventory reuses it, and that the next one queries again."""
+    backend = SimulatedBackend(num_gpus=2)
+    gpu_manager = GPUManager(backend=backend)
+
+    assert len(gpu_manager.inventory()) == 2
+    backend.allocate("other", [0], memory=80000)
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [0, 1]
+    assert gpu_manager.poll_stats.count == 1
+
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [1]
+    assert gpu_manager.poll_stats.count == 2
+
+
+def test_read_device_tolerates_missing_fields(fake_nvml: SimpleNamespace) -> None:
+    """Test that devices which cannot report utilization, compute mode or processes still report their memory."""
+    fake_nvml.utilization.side_effect = pynvml.NVMLError(pynvml.NVML_ERROR_NOT_SUPPORTED)
+    fake_nvml.processes.return_value = [SimpleNamespace(pid=4242, usedGpuMemory=2 * 1024**3)]
+
+    gpu = NVMLBackend().query()[0]
+    assert "utilization.gpu" not in gpu
+    assert gpu["compute_mode"] == pynvml.NVML_COMPUTEMODE_DEFAULT
+    assert gpu["processes"][0]["pid"] == 4242
+    assert gpu["processes"][0]["used_memory"] == 2048
+
+
+def test_contended_gpus_are_rejected_with_reasons() -> None:
+    """Test that a compute-bound job with little memory keeps its GPU busy, and that the reasons are exposed."""
+    backend = SimulatedBackend(num_gpus=4, memory_total=1000)
+    backend.allocate("small", [0], 50, utilization=95, user="alice")
+    backend.allocate("idle", [1], 50, utilization=0, user="bob")
+    backend.allocate("large", [2], 900, utilization=0, user="carol")
+    predicates = default_predicates(0.85, max_utilization=20, allow_foreign_processes=False)
+    gpu_manager = GPUManager(gpu_free_memory_ratio_threshold=0.85, backend=backend, predicates=predicates)
+
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [3]
+    assert gpu_manager.rejections[0] == ["utilization 95% > 20%", "processes of alice"]
+    assert gpu_manager.rejections[1] == ["processes of bob"]
+    assert gpu_manager.rejections[2] == ["free memory 10% <= 85%", "processes of carol"]
+    assert gpu_manager.rejections[3] == []
+
+
+def test_compute_mode_and_old_traces() -> None:
+    """Test the compute mode predicate, and that polls without the new keys are judged by memory only."""
+    gpus = [
+        {"index": 0, "memory.free": 900, "memory.total": 1000, "compute_mode": pynvml.NVML_COMPUTEMODE_PROHIBITED},
+        {
+            "index": 1,
+            "memory.free": 900,
+            "memory.total": 1000,
+            "compute_mode": pynvml.NVML_COMPUTEMODE_EXCLUSIVE_PROCESS,
+            "processes": [{"pid": 1, "used_memory": 100, "user": "alice"}],
+        },
+        {"index": 2, "memory.free": 900, "memory.total": 1000},
+    ]
+    gpu_manager = GPUManager(
+        backend=SimulatedBackend(num_gpus=0), predicates=default_predicates(0.85, max_utilization=20)
+    )
+
+    assert gpu_manager.evaluate(gpus) == {
+        0: ["compute mode prohibited"],
+        1: ["exclusive compute mode taken"],
+        2: [],
+    }
+
+
+def test_nvml_topology(fake_nvml: SimpleNamespace, mocker: MockerFixture) -> None:
+    """Test that NVLink connections are preferred over the PCIe level when reading the topology."""
+    mocker.patch("gpusitter.gpu.pynvml.nvmlDeviceGetP2PStatus", return_value=pynvml.NVML_P2P_STATUS_NOT_SUPPORTED)
+    mocker.patch("gpusitter.gpu.pynvml.nvmlDeviceGetTopologyCommonAncestor", return_value=pynvml.NVML_TOPOLOGY_SYSTEM)
+    assert NVMLBackend().topology() == [[0, pynvml.NVML_TOPOLOGY_SYSTEM], [pynvml.NVML_TOPOLOGY_SYSTEM, 0]]
+
+    mocker.patch("gpusitter.gpu.pynvml.nvmlDeviceGetP2PStatus", return_value=pynvml.NVML_P2P_STATUS_OK)
+    assert NVMLBackend().topology() == [[0, NVLINK], [NVLINK, 0]]
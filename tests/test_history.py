@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from gpusitter.history import RuntimeHistory, normalize_command
+from gpusitter.jobs import Job
+
+
+def test_normalize_command() -> None:
+    """Test that the jobs of a sweep share a key while different scripts and run lengths do not."""
+    assert normalize_command("python  train2.py --lr=1e-4 --seed 3") == "python train2.py --lr=# --seed #"
+    assert normalize_command("python train2.py --lr=3e-4 --seed 0") == "python train2.py --lr=# --seed #"
+    assert normalize_command("python train.py seed=7 --learning-rate .01") == "python train.py seed=# --learning-rate #"
+    assert normalize_command("python train.py --epochs 1 --seed=1") == "python train.py --epochs 1 --seed=#"
+    assert normalize_command("python train.py --steps=100000 --seeds=4") == "python train.py --steps=100000 --seeds=4"
+
+
+def test_history_predicts_and_persists(tmp_path: Path) -> None:
+    """Test that the last runtimes of a command predict its next run, also after a restart."""
+    path = tmp_path / "runtimes.json"
+    history = RuntimeHistory(path, keep=2, max_commands=2)
+    assert history.estimate(Job("python train.py --seed=0")) is None
+
+    for runtime in (100.0, 200.0, 400.0):
+        history.record(Job("python train.py --seed=1"), runtime)
+    assert history.estimate(Job("python train.py --seed=2")) == 300.0
+
+    history.record(Job("python eval.py"), 10.0)
+    history.record(Job("python other.py"), 10.0)
+    # The command which finished least recently is dropped first
+    restored = RuntimeHistory(path, keep=2, max_commands=2)
+    assert len(restored) == 2
+    assert restored.estimate(Job("python train.py --seed=2")) is None
+    assert restored.estimate(Job("python eval.py")) == 10.0
+
+    path.write_text("{not json")
+    assert len(RuntimeHistory(path)) == 0
@@ -0,0 +1,147 @@
+import ctypes.util
+import math
+import time
+
+import pytest
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.gpu import GPUManager
+from gpusitter.holder import Allocator, HoldManager, ProcessAllocator
+from gpusitter.scheduler import VirtualClock
+
+
+class FakeAllocator(Allocator):
+    """Allocate the placeholder buffers as fake jobs of a simulated backend."""
+
+    def __init__(self, backend: SimulatedBackend, broken: set[int] | None = None, slow: set[int] | None = None) -> None:
+        """Initialize the fake allocator, allocations on the `broken` GPUs fail and on the `slow` ones take a while."""
+        self.backend = backend
+        self.broken = broken or set()
+        self.slow = slow or set()
+
+    def allocate(self, index: int, shape: list[int], dtype: str) -> str:
+        """Allocate the buffer as a fake job."""
+        if index in self.broken:
+            raise RuntimeError("out of memory")
+        owner = f"hold_{index}"
+        self.backend.allocate(owner, [index], math.prod(shape) * 4 // 1024**2)
+        return owner
+
+    def ready(self, token: str) -> bool:
+        """Report the buffers on the slow GPUs as allocated from the second check on."""
+        index = int(token.removeprefix("hold_"))
+        if index in self.slow:
+            self.slow.remove(index)
+            return False
+        return True
+
+    def free(self, token: str) -> None:
+        """Release the fake job."""
+        self.backend.release(token)
+
+
+def test_holds_free_gpus_until_released() -> None:
+    """Test that free GPUs are held up to the limit and that releasing frees the memory right away."""
+    clock = VirtualClock()
+    backend = SimulatedBackend(num_gpus=3, memory_total=10000, clock=clock)
+    gpu_manager = GPUManager(backend=backend, clock=clock)
+    holds = HoldManager(FakeAllocator(backend), max_held=2, clock=clock)
+
+    holds.update(gpu_manager.get_free_gpus())
+    assert holds.held_gpus() == []
+    holds.update(gpu_manager.get_free_gpus())
+    assert holds.held_gpus() == [0, 1]
+    assert 8900 <= holds.holds[0].memory <= 9000
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [2]
+
+    holds.release([0])
+    assert holds.held_gpus() == [1]
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [0, 2]
+
+    holds.close()
+    assert len(holds) == 0
+    assert len(gpu_manager.get_free_gpus()) == 3
+
+
+def test_hold_timeout_and_failures() -> None:
+    """Test that holds time out without being renewed right away, and that failed holds are skipped."""
+    clock = VirtualClock()
+    backend = SimulatedBackend(num_gpus=2, memory_total=10000, clock=clock)
+    gpu_manager = GPUManager(backend=backend, clock=clock)
+    holds = HoldManager(FakeAllocator(backend, broken={0}), max_held=2, timeout=60, clock=clock)
+
+    holds.update(gpu_manager.get_free_gpus())
+    holds.update(gpu_manager.get_free_gpus())
+    assert holds.held_gpus() == [1]
+
+    clock.advance(60)
+    holds.update(gpu_manager.get_free_gpus())
+    assert holds.held_gpus() == []
+
+    clock.advance(59)
+    holds.update(gpu_manager.get_free_gpus())
+    assert holds.held_gpus() == []
+
+    clock.advance(1)
+    holds.update(gpu_manager.get_free_gpus())
+    holds.update(gpu_manager.get_free_gpus())
+    assert holds.held_gpus() == [1]
+
+
+def test_holds_only_count_once_allocated() -> None:
+    """Test that a hold whose allocation takes a while is neither held nor started twice, and may be released."""
+    clock = VirtualClock()
+    backend = SimulatedBackend(num_gpus=2, memory_total=10000, clock=clock)
+    gpu_manager = GPUManager(backend=backend, clock=clock)
+    holds = HoldManager(FakeAllocator(backend, slow={0}), max_held=1, clock=clock)
+
+    holds.update(gpu_manager.get_free_gpus())
+    assert list(holds.starting) == [0]
+    holds.update(gpu_manager.get_free_gpus())
+    assert holds.held_gpus() == []
+    assert list(holds.starting) == [0]
+    holds.update(gpu_manager.get_free_gpus())
+    assert holds.held_gpus() == [0]
+
+    holds.release([0])
+    holds.update(gpu_manager.get_free_gpus())
+    assert list(holds.starting) == [0]
+    holds.close()
+    assert not holds.starting
+    assert len(gpu_manager.get_free_gpus()) == 2
+
+
+def test_allocators_must_implement_allocate_and_free() -> None:
+    """Test that an allocator without `allocate` or `free` cannot be created, while `ready` is optional."""
+
+    class Incomplete(Allocator):
+        def allocate(self, index: int, shape: list[int], dtype: str) -> int:
+            return index
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()
+
+    class Instant(Incomplete):
+        def free(self, token: int) -> None:
+            pass
+
+    assert Instant().ready(Instant().allocate(0, [1], "float32"))
+
+
+def test_process_allocator_fails_without_driver() -> None:
+    """Test that a holder process which cannot allocate is reported as a failure."""
+    if ctypes.util.find_library("cuda") is not None:
+        pytest.skip("A CUDA driver is available")
+
+    allocator = ProcessAllocator(startup_timeout=30)
+    token = allocator.allocate(0, [256], "float32")
+
+    def wait_ready() -> None:
+        while not allocator.ready(token):
+            time.sleep(0.05)
+
+    try:
+        with pytest.raises(RuntimeError, match="Failed to hold"):
+            wait_ready()
+    finally:
+        allocator.free(token)
@@ -0,0 +1,90 @@
+import itertools
+from pathlib import Path
+
+import pytest
+
+from gpusitter.jobfiles import expand_sweep, is_sweep, read_job_file, sweep_jobs
+
+
+def test_expand_sweep() -> None:
+    """Test that sweeps expand into their grid, with the last sweep varying fastest."""
+    assert list(expand_sweep("python train.py --lr={1e-3,1e-4} --seed={0..2}:1")) == [
+        "python train.py --lr=1e-3 --seed=0:1",
+        "python train.py --lr=1e-3 --seed=1:1",
+        "python train.py --lr=1e-3 --seed=2:1",
+        "python train.py --lr=1e-4 --seed=0:1",
+        "python train.py --lr=1e-4 --seed=1:1",
+        "python train.py --lr=1e-4 --seed=2:1",
+    ]
+    assert list(expand_sweep("echo {0..10..5} {2..0}")) == [
+        f"echo {a} {b}" for a, b in itertools.product([0, 5, 10], [2, 1, 0])
+    ]
+    assert list(expand_sweep("python -c 'print({})' {x}")) == ["python -c 'print({})' {x}"]
+    assert not is_sweep("python -c 'print({})'")
+
+    with pytest.raises(ValueError, match="Invalid sweep step"):
+        list(expand_sweep("echo {0..4..0}"))
+
+
+def test_sweeps_expand_lazily() -> None:
+    """Test that a sweep of a billion jobs is parsed one job at a time."""
+    jobs = sweep_jobs("python train.py --a={0..999} --b={0..999} --c={0..999}:2:priority=3")
+    first, second = next(jobs), next(jobs)
+    assert (first.cmd, first.required_gpus, first.priority) == ("python train.py --a=0 --b=0 --c=0", 2, 3)
+    assert second.cmd == "python train.py --a=0 --b=0 --c=1"
+
+    with pytest.raises(ValueError, match="Invalid memory size"):
+        sweep_jobs("python train.py --seed={0..9}:mem=lots")
+
+
+def test_read_job_files(tmp_path: Path) -> None:
+    """Test that the jobs of line, TOML and JSONL job files are read with their options and sweeps."""
+    lines = tmp_path / "jobs.txt"
+    lines.write_text("# warmup\npython a.py:2\n\npython b.py --seed={0..1}:1:mem=6G\n")
+    toml = tmp_path / "jobs.toml"
+    toml.write_text(
+        '[[jobs]]\ncmd = "python a.py"\ngpus = 2\n\n'
+        '[[jobs]]\ncmd = "python b.py --seed={0..1}"\nmem = "6G"\npriority = 1\n'
+    )
+    jsonl = tmp_path / "jobs.jsonl"
+    jsonl.write_text(
+        '{"cmd": "python a.py", "gpus": 2}\n{"cmd": "python b.py --seed={0..1}", "mem": 6144, "priority": 1}\n'
+    )
+
+    expected = [("python a.py", 2, None), ("python b.py --seed=0", 1, 6144), ("python b.py --seed=1", 1, 6144)]
+    for path in (lines, toml, jsonl):
+        assert [(job.cmd, job.required_gpus, job.required_memory) for job in read_job_file(path)] == expected
+
+
+def test_damaged_job_records_are_skipped(tmp_path: Path) -> None:
+    """Test that records which cannot be parsed are skipped while the rest of the file is read."""
+    jsonl = tmp_path / "jobs.jsonl"
+    jsonl.write_text('{"cmd": "python a.py", "gpu": 2}\n{"cmd": "python b.py"\n[1, 2]\n{"cmd": "python c.py"}\n')
+    assert [job.cmd for job in read_job_file(jsonl)] == ["python c.py"]
+
+    with pytest.raises(FileNotFoundError):
+        read_job_file(tmp_path / "missing.txt")
+    broken = tmp_path / "jobs.toml"
+    broken.write_text("jobs = 1")
+    with pytest.raises(ValueError, match="array of tables"):
+        read_job_file(broken)
+
+
+def test_job_files_form_pipelines(tmp_path: Path) -> None:
+    """Test that names become the ids of all earlier jobs with the name, and unknown names skip the record."""
+    toml = tmp_path / "pipeline.toml"
+    toml.write_text(
+        '[[jobs]]\nname = "prep"\ncmd = "python prep.py"\ngpus = 0\n\n'
+        '[[jobs]]\nname = "train"\ncmd = "python train.py --seed={0..1}"\ngpus = 4\nafter = "prep"\n\n'
+        '[[jobs]]\ncmd = "python eval.py"\nafter = ["train", "typo"]\n\n'
+        '[[jobs]]\ncmd = "python report.py"\nafter = ["prep", "train"]\n'
+    )
+    prep, train0, train1, report = read_job_file(toml)
+    assert (prep.required_gpus, prep.after) == (0, [])
+    assert train0.after == train1.after == [prep.job_id]
+    assert report.after == [prep.job_id, train0.job_id, train1.job_id]
+
+    lines = tmp_path / "pipeline.txt"
+    lines.write_text("python prep.py:0:name=prep\npython train.py:4:after=prep\n")
+    prep, train = read_job_file(lines)
+    assert train.after == [prep.job_id]
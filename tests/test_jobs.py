@@ -0,0 +1,234 @@
+from collections.abc import Callable
+
+import pytest
+
+from gpusitter.jobs import GPUShare, Job, JobQueue, parse_after, parse_job, parse_memory
+from gpusitter.topology import CROSS_HOST, NVLINK, Topology
+
+Schedule = Callable[[list[int]], list[tuple[Job, list[int]]]]
+
+
+@pytest.mark.parametrize(
+    ("job_str", "cmd", "gpus", "priority"),
+    [
+        ("python train.py", "python train.py", 1, 0),
+        ("python train.py:4", "python train.py", 4, 0),
+        ("python train.py --epoch=12 --lr=-.001:4", "python train.py --epoch=12 --lr=-.001", 4, 0),
+        ("python train.py:2:priority=5", "python train.py", 2, 5),
+        ("python train.py:priority=-1", "python train.py", 1, -1),
+        ("python serve.py --url=http://host/api", "python serve.py --url=http://host/api", 1, 0),
+    ],
+)
+def test_parse_job(job_str: str, cmd: str, gpus: int, priority: int) -> None:
+    """Test parsing job strings with GPU counts and options."""
+    job = parse_job(job_str)
+    assert (job.cmd, job.required_gpus, job.priority) == (cmd, gpus, priority)
+
+
+@pytest.mark.parametrize(
+    ("job_str", "message"),
+    [
+        ("python a.py:mem=6G:1", "after the number of GPUs"),
+        ("python a.py:priority=1:2:name=a", "after the number of GPUs"),
+        ("cmd:1:name=a:name=b", "given twice"),
+        ("cmd:priority=1:priority=2", "given twice"),
+    ],
+)
+def test_parse_job_rejects_misplaced_options(job_str: str, message: str) -> None:
+    """Test that options which are repeated or come before the number of GPUs are rejected."""
+    with pytest.raises(ValueError, match=message):
+        parse_job(job_str)
+
+
+@pytest.mark.parametrize(
+    ("value", "mib"), [("6G", 6144), ("6GiB", 6144), ("512M", 512), ("1.5g", 1536), ("2048", 2048), ("1T", 1048576)]
+)
+def test_parse_memory(value: str, mib: int) -> None:
+    """Test parsing memory sizes into MiB."""
+    assert parse_memory(value) == mib
+
+
+def test_parse_job_with_memory() -> None:
+    """Test that the memory option makes a job memory-sized and invalid sizes are rejected."""
+    job = parse_job("python eval.py --ckpt=last:2:mem=6G:priority=3")
+    assert (job.cmd, job.required_gpus, job.required_memory, job.priority) == ("python eval.py --ckpt=last", 2, 6144, 3)
+    assert parse_job("python eval.py").required_memory is None
+
+    with pytest.raises(ValueError, match="Invalid memory size"):
+        parse_job("python eval.py:mem=lots")
+
+
+def test_parse_job_with_dependencies() -> None:
+    """Test that jobs can be named and run after job ids and names."""
+    job = parse_job("python eval.py:1:name=eval:after=3,train")
+    assert (job.cmd, job.required_gpus, job.name, job.after) == ("python eval.py", 1, "eval", [3, "train"])
+    assert parse_job("python eval.py").after == []
+
+    with pytest.raises(ValueError, match="Invalid dependencies"):
+        parse_after("3,,train")
+
+
+def test_schedule_starts_jobs_without_gpus_while_gpus_are_busy() -> None:
+    """Test that jobs which need no GPU are started even when no GPU is free."""
+    jobs = JobQueue()
+    train, prep = Job("train", 2), Job("prep", 0)
+    for job in (train, prep):
+        jobs.put(job)
+
+    assert jobs.schedule([]) == [(prep, [])]
+    assert (list(jobs), jobs.cpu_jobs) == ([train], 0)
+
+
+def test_schedule_packs_memory_sized_jobs() -> None:
+    """Test that memory-sized jobs share GPUs best-fit while whole-GPU jobs keep taking free GPUs."""
+    jobs = JobQueue()
+    evals = [Job(f"eval_{i}", required_memory=6144) for i in range(5)]
+    train = Job("train", 1)
+    for job in (*evals, train):
+        jobs.put(job)
+
+    shared = {0: GPUShare(memory=20000, slots=4), 1: GPUShare(memory=77824, slots=4), 2: GPUShare(77824, 4)}
+    placements = jobs.schedule([1, 2], shared=shared)
+
+    assert [assigned for _, assigned in placements] == [[0], [0], [0], [1], [1], [2]]
+    assert jobs.empty()
+    assert shared[0].memory == 20000
+
+
+def test_memory_sized_jobs_on_several_gpus_stay_on_one_host() -> None:
+    """Test that a memory-sized job on several GPUs shares the best-connected GPUs of one host, or waits."""
+    costs = [[0 if a == b else NVLINK if a // 2 == b // 2 else CROSS_HOST for b in range(4)] for a in range(4)]
+    topology = Topology(costs)
+    jobs = JobQueue()
+    train = Job("train", 2, required_memory=6144)
+    jobs.put(train)
+
+    # The tightest fits are GPUs 1 and 2, which are on two hosts
+    shared = {1: GPUShare(8192, 4), 2: GPUShare(10240, 4), 3: GPUShare(20480, 4)}
+    assert jobs.schedule([], topology=topology, shared=shared) == [(train, [2, 3])]
+
+    jobs.put(train)
+    assert jobs.schedule([], topology=topology, shared={1: GPUShare(8192, 4), 2: GPUShare(10240, 4)}) == []
+
+
+def test_schedule_without_shares_gives_whole_gpus() -> None:
+    """Test that memory-sized jobs take whole free GPUs when the caller does not share GPUs."""
+    jobs = JobQueue()
+    jobs.put(Job("eval", required_memory=6144))
+    assert jobs.schedule([3])[0][1] == [3]
+
+
+def test_schedule_backfills_around_large_job() -> None:
+    """Test that small jobs are started while a large job at the head does not fit."""
+    jobs = JobQueue()
+    large, small_a, small_b = Job("large", 4), Job("small_a", 1), Job("small_b", 1)
+    for job in (large, small_a, small_b):
+        jobs.put(job)
+
+    placements = jobs.schedule([0, 1, 2])
+    assert placements == [(small_a, [0]), (small_b, [1])]
+    assert list(jobs) == [large]
+    assert large.overtaken == 1
+
+
+def test_schedule_respects_priority_and_requeue_order() -> None:
+    """Test that higher priorities go first and a re-queued job keeps its place."""
+    jobs = JobQueue()
+    first, second, urgent = Job("first"), Job("second"), Job("urgent", priority=10)
+    for job in (first, second, urgent):
+        jobs.put(job)
+
+    assert jobs.schedule([0]) == [(urgent, [0])]
+    assert jobs.schedule([0]) == [(first, [0])]
+    jobs.put(first)
+    assert list(jobs) == [first, second]
+
+
+def test_schedule_reserves_gpus_for_starving_job() -> None:
+    """Test that a job overtaken too often blocks the jobs behind it until it fits."""
+    jobs = JobQueue(starvation_limit=2)
+    large = Job("large", 2)
+    jobs.put(large)
+    for i in range(4):
+        jobs.put(Job(f"small_{i}", 1))
+
+    assert len(jobs.schedule([0])) == 1
+    assert len(jobs.schedule([0])) == 1
+    assert jobs.schedule([0]) == []
+    assert jobs.schedule([0, 1]) == [(large, [0, 1])]
+
+
+def test_schedule_backfills_around_reservation() -> None:
+    """Test that with predicted runtimes only the jobs which finish before the reservation starts overtake it."""
+    jobs = JobQueue(starvation_limit=0)
+    large = Job("large", 3)
+    short = Job("short", 1)
+    for job in (large, Job("long", 1), Job("unknown", 1), short):
+        jobs.put(job)
+    runtimes = {"short": 50.0, "long": 1000.0}
+
+    # Without predictions the starving job blocks everything behind it
+    assert jobs.schedule([0, 1]) == []
+
+    # The third GPU is free in 100s, so the job reserves GPUs 0-2 from then on
+    releases = {2: 100.0, 3: 500.0}
+    assert jobs.schedule([0, 1], releases=releases, estimate=lambda job: runtimes.get(job.cmd)) == [(short, [0])]
+    assert [job.cmd for job in jobs] == ["large", "long", "unknown"]
+
+
+def simulate(schedule: Schedule, jobs: list[Job], durations: dict[int, int], num_gpus: int) -> tuple[int, int]:
+    """Run the jobs on a cluster in steps of one second.
+
+    Returns:
+        tuple[int, int]: The GPU seconds spent idle while jobs were pending, and the makespan.
+    """
+    pending = {job.job_id for job in jobs}
+    running: list[tuple[int, list[int]]] = []
+    idle = now = 0
+    while pending or running:
+        running = [(end, gpus) for end, gpus in running if end > now]
+        busy = {i for _, gpus in running for i in gpus}
+        for job, gpus in schedule([i for i in range(num_gpus) if i not in busy]):
+            pending.discard(job.job_id)
+            running.append((now + durations[job.job_id], gpus))
+            busy.update(gpus)
+        if pending:
+            idle += num_gpus - len(busy)
+        now += 1
+    return idle, now - 1
+
+
+def fifo_schedule(jobs: list[Job]) -> Schedule:
+    """Get the head-of-line FIFO behavior of the former queue.Queue."""
+    pending = list(jobs)
+
+    def schedule(free: list[int]) -> list[tuple[Job, list[int]]]:
+        placements = []
+        while pending and pending[0].required_gpus <= len(free):
+            job = pending.pop(0)
+            placements.append((job, free[: job.required_gpus]))
+            free = free[job.required_gpus :]
+        return placements
+
+    return schedule
+
+
+def test_backfill_reduces_gpu_idle_time() -> None:
+    """Test that backfilling leaves the GPUs idle for less time than FIFO."""
+    spec = [(1, 30), (4, 20), (1, 10), (1, 10), (2, 10), (1, 10), (1, 10), (3, 20), (1, 5)]
+
+    def workload() -> tuple[list[Job], dict[int, int]]:
+        jobs = [Job(f"job_{i}", gpus) for i, (gpus, _) in enumerate(spec)]
+        return jobs, {job.job_id: duration for job, (_, duration) in zip(jobs, spec, strict=True)}
+
+    jobs, durations = workload()
+    fifo_idle, fifo_makespan = simulate(fifo_schedule(jobs), jobs, durations, num_gpus=4)
+
+    jobs, durations = workload()
+    queue = JobQueue()
+    for job in jobs:
+        queue.put(job)
+    backfill_idle, backfill_makespan = simulate(queue.schedule, jobs, durations, num_gpus=4)
+
+    assert backfill_idle < fifo_idle
+    assert backfill_makespan <= fifo_makespan
@@ -0,0 +1,125 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from gpusitter import jobs
+from gpusitter.jobs import Job
+from gpusitter.journal import Journal
+
+
+def test_restore_pending_and_running_jobs(tmp_path: Path) -> None:
+    """Test that a restarted journal recovers the queue, the retry counts, raised requirements and GPU assignments."""
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.load()
+    pending, running, retried, finished = Job("pending", 2, priority=3), Job("running"), Job("retried"), Job("done")
+    pending.after = [running.job_id]
+    for job in (pending, running, retried, finished):
+        journal.submitted(job)
+    journal.started(running, [1])
+    journal.started(retried, [2])
+    retried.retry_count = 1
+    retried.required_gpus = 2
+    journal.requeued(retried)
+    journal.started(finished, [3])
+    journal.ended(finished)
+    journal.close()
+
+    state = Journal(tmp_path / "journal.jsonl").load()
+    assert [(job.job_id, job.cmd, job.required_gpus, job.priority) for job in state.pending] == [
+        (pending.job_id, "pending", 2, 3),
+        (retried.job_id, "retried", 2, 0),
+    ]
+    assert state.pending[0].after == [running.job_id]
+    assert state.pending[1].retry_count == 1
+    assert [(job.job_id, gpus) for job, gpus in state.running] == [(running.job_id, [1])]
+    assert Job("new").job_id > finished.job_id
+
+
+def test_compaction_keeps_restarts_fast(tmp_path: Path) -> None:
+    """Test that 100k finished jobs are compacted away, so the journal only holds the live jobs."""
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(path, flush_interval=0.01, compact_threshold=1000)
+    journal.load()
+    for i in range(100_000):
+        job = Job(f"python sweep.py --seed={i}")
+        journal.submitted(job)
+        journal.started(job, [i % 8])
+        journal.ended(job)
+    live = Job("live")
+    journal.submitted(live)
+    journal.close()
+    assert len(path.read_text().splitlines()) < 4000
+
+    start = time.perf_counter()
+    state = Journal(path).load()
+    assert time.perf_counter() - start < 1.0
+    assert [job.job_id for job in state.pending] == [live.job_id]
+    # The highest id issued and the live job
+    assert len(path.read_text().splitlines()) == 2
+
+
+def test_ids_of_ended_jobs_are_not_issued_again(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that jobs submitted after a restart get ids above every id issued before, even when nothing is live."""
+    monkeypatch.setattr(jobs, "_job_ids", jobs._JobIds())
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(path)
+    journal.load()
+    for job in (Job("prep"), Job("train")):
+        journal.submitted(job)
+        journal.ended(job)
+    journal.close()
+
+    # Twice, so the highest id also survives the compaction of a journal which holds no jobs
+    for _ in range(2):
+        monkeypatch.setattr(jobs, "_job_ids", jobs._JobIds())
+        journal = Journal(path)
+        journal.load()
+        journal.close()
+        assert Job("eval").job_id == 3
+
+
+def test_torn_record_is_skipped(tmp_path: Path) -> None:
+    """Test that a record torn by a crash does not prevent the restart."""
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(path)
+    journal.load()
+    job = Job("python train.py")
+    journal.submitted(job)
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"op": "submit", "job": {"id"\n')
+        f.write('{"op": "end", "id": []}\n')
+        f.write('{"op": "requeue", "id": 1, "retries": 1, "job": []}\n')
+
+    assert [job.job_id for job in Journal(path).load().pending] == [job.job_id]
+
+
+def test_streams_are_restored_with_their_position(tmp_path: Path) -> None:
+    """Test that the journal keeps the source and the position of the job streams until they are drained."""
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(path)
+    journal.load()
+    sweep = journal.streamed({"sweep": "python train.py --seed={0..9}", "names": {}})
+    drained = journal.streamed({"file": "/jobs.txt"})
+    first, second = Job("python train.py --seed=0"), Job("python train.py --seed=1")
+    journal.submitted(first, (sweep, 0))
+    journal.submitted(second, (sweep, 1))
+    journal.read(sweep, 3)
+    journal.ended(first)
+    journal.drained(drained)
+    journal.close()
+
+    for _ in range(2):
+        # Once as written, once compacted
+        journal = Journal(path)
+        state = journal.load()
+        journal.close()
+        (stream,) = state.streams
+        assert (stream.key, stream.position, stream.jobs) == (sweep, 3, {1: second.job_id})
+        assert stream.source["sweep"] == "python train.py --seed={0..9}"
+
+    journal = Journal(path)
+    journal.load()
+    assert journal.streamed({"file": "/more.txt"}) != sweep
+    journal.close()
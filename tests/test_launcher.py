@@ -0,0 +1,266 @@
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from gpusitter.jobs import Job
+from gpusitter.launcher import Launcher, LaunchEvent, ProcessLauncher, TmuxLauncher, process_start_time, rotate_log
+
+
+def fake_worker(
+    gpu_indices: list[int], job: Job, status_file: Path, notify_fifo: Path | None = None, pid_file: Path | None = None
+) -> str | None:
+    """Run the job in the background like the tmux window does, without tmux."""
+    script = f"echo $$ > {pid_file}; {job.cmd}; rc=$?; [ -p {notify_fifo} ] && echo {job.job_id} $rc > {notify_fifo}"
+    subprocess.Popen(["sh", "-c", script])  # noqa: S603 S607
+    return None
+
+
+@pytest.fixture
+def launcher(mocker: MockerFixture) -> TmuxLauncher:
+    """Fixture to provide a launcher which runs jobs without tmux."""
+    mocker.patch("gpusitter.launcher.worker", side_effect=fake_worker)
+    woken = threading.Event()
+    launcher = TmuxLauncher(on_event=woken.set, grace_period=0.3)
+    launcher.woken = woken
+    yield launcher
+    launcher.close()
+
+
+def wait_for_events(launcher: TmuxLauncher | ProcessLauncher, count: int, timeout: float = 5.0) -> list[LaunchEvent]:
+    """Collect launch events until there are enough of them."""
+    events = []
+    deadline = time.monotonic() + timeout
+    while len(events) < count and time.monotonic() < deadline:
+        launcher.woken.wait(0.05)
+        launcher.woken.clear()
+        events.extend(launcher.poll())
+    return events
+
+
+def test_launch_does_not_block(launcher: TmuxLauncher) -> None:
+    """Test that dispatching a batch of jobs takes milliseconds and reserves their GPUs."""
+    start = time.monotonic()
+    for i in range(16):
+        launcher.launch(Job("sleep 1"), [i])
+    assert time.monotonic() - start < 0.5
+    assert launcher.pending == 16
+
+
+def test_early_failure_is_reported(launcher: TmuxLauncher) -> None:
+    """Test that a job exiting with an error within the grace period is reported as failed."""
+    job = Job("sh -c 'exit 3'")
+    launcher.launch(job, [0])
+
+    assert wait_for_events(launcher, 1) == [LaunchEvent(job, [0], "failed", 3)]
+    assert launcher.pending == 0
+
+
+def test_running_job_is_confirmed_then_exits(launcher: TmuxLauncher) -> None:
+    """Test that a job outliving the grace period is confirmed, and its exit is reported later."""
+    job = Job("sleep 0.6")
+    launcher.launch(job, [1, 2])
+
+    assert wait_for_events(launcher, 1) == [LaunchEvent(job, [1, 2], "started")]
+    assert launcher.pending == 0
+    assert process_start_time(launcher.pid(job.job_id)) is not None
+    assert wait_for_events(launcher, 1) == [LaunchEvent(job, [1, 2], "exited", 0)]
+    assert launcher.pid(job.job_id) is None
+
+
+def test_killed_window_is_reported(mocker: MockerFixture) -> None:
+    """Test that a job whose tmux pane vanished is reported as exited without a return code."""
+    mocker.patch("gpusitter.launcher.worker", return_value="%7")
+    mocker.patch("gpusitter.launcher.alive_panes", return_value=set())
+    woken = threading.Event()
+    launcher = TmuxLauncher(on_event=woken.set, grace_period=0.1, liveness_interval=0.2)
+    launcher.woken = woken
+
+    job = Job("python train.py")
+    launcher.launch(job, [0])
+    try:
+        assert wait_for_events(launcher, 2) == [LaunchEvent(job, [0], "started"), LaunchEvent(job, [0], "exited")]
+    finally:
+        launcher.close()
+
+
+def test_tmux_failure_is_a_launcher_error(mocker: MockerFixture, tmp_path: Path) -> None:
+    """Test that tmux failing to create the window is reported as an error of the launcher, not of the job."""
+    run = mocker.patch("gpusitter.launcher.subprocess.run")
+    run.return_value = subprocess.CompletedProcess([], 1, "", "no server running")
+    woken = threading.Event()
+    launcher = TmuxLauncher(on_event=woken.set, status_dir=tmp_path / "status dir")
+    launcher.woken = woken
+    job = Job("python train.py")
+    try:
+        launcher.launch(job, [0])
+        events = wait_for_events(launcher, 1)
+    finally:
+        launcher.close()
+
+    assert events == [LaunchEvent(job, [0], "error")]
+    assert "no server running" in events[0].output
+    # The paths with spaces are quoted in the shell command of the window, which runs the job in a process of its own
+    window_cmd = run.call_args_list[-1].args[0][-1]
+    assert f"echo $rc > '{tmp_path}/status dir/job_{job.job_id}_retry0.status'" in window_cmd
+    assert window_cmd.startswith("sh -c ")
+    assert f"'{tmp_path}/status dir/job_{job.job_id}.pid' 'python train.py'; rc=$?" in window_cmd
+
+
+def test_cancel_reports_cancelled(launcher: TmuxLauncher) -> None:
+    """Test that a cancelled job is reported as cancelled instead of failed, and only once."""
+    job = Job("sleep 5")
+    launcher.launch(job, [0])
+
+    assert launcher.cancel(job.job_id)
+    assert not launcher.cancel(job.job_id)
+    assert [event.kind for event in wait_for_events(launcher, 1)] == ["cancelled"]
+    assert launcher.pending == 0
+
+
+def test_attach_after_restart(tmp_path: Path, mocker: MockerFixture) -> None:
+    """Test that jobs launched before a restart are followed through their status files and tmux windows."""
+    mocker.patch("gpusitter.launcher.find_pane", side_effect=lambda name: "%7" if name.endswith("_3") else None)
+    mocker.patch("gpusitter.launcher.alive_panes", return_value={"%7"})
+    woken = threading.Event()
+    launcher = TmuxLauncher(on_event=woken.set, status_dir=tmp_path)
+    launcher.woken = woken
+    try:
+        exited, vanished, running = Job("exited", job_id=1), Job("vanished", job_id=2), Job("running", job_id=3)
+        (tmp_path / "job_1_retry0.status").write_text("4\n")
+        for job in (exited, vanished, running):
+            launcher.attach(job, [job.job_id])
+
+        events = wait_for_events(launcher, 2)
+        assert [(event.job.cmd, event.kind, event.returncode) for event in events] == [
+            ("exited", "exited", 4),
+            ("vanished", "exited", None),
+        ]
+        assert not (tmp_path / "job_1_retry0.status").exists()
+        assert launcher.pending == 0
+    finally:
+        launcher.close()
+    assert (tmp_path / "exit.fifo").is_fifo()
+
+
+def process_group(stat: Path) -> int | None:
+    """Get the process group from a /proc/<pid>/stat file, None if the process is gone."""
+    try:
+        return int(stat.read_text().rpartition(")")[2].split()[2])
+    except OSError:
+        return None
+
+
+@pytest.fixture
+def process_launcher(tmp_path: Path) -> ProcessLauncher:
+    """Fixture to provide a launcher which runs jobs as plain processes."""
+    woken = threading.Event()
+    launcher = ProcessLauncher(on_event=woken.set, grace_period=0.3, log_dir=tmp_path, kill_timeout=0.3)
+    launcher.woken = woken
+    yield launcher
+    launcher.close()
+
+
+def test_process_exits_are_reported(process_launcher: ProcessLauncher) -> None:
+    """Test that processes see their GPUs, log their output and are reported as soon as they exit."""
+    failing = Job("echo 'CUDA out of memory' >&2; exit 3")
+    quick, running = Job("""echo "it's on $CUDA_VISIBLE_DEVICES" """), Job("sleep 0.6")
+    process_launcher.launch(failing, [0])
+    process_launcher.launch(running, [2, 3])
+    start = time.monotonic()
+    process_launcher.launch(quick, [1])
+
+    events = wait_for_events(process_launcher, 3)
+    assert time.monotonic() - start < 0.25
+    assert sorted(events, key=lambda event: event.job.job_id) == [
+        LaunchEvent(failing, [0], "failed", 3),
+        LaunchEvent(quick, [1], "started"),
+        LaunchEvent(quick, [1], "exited", 0),
+    ]
+    assert process_launcher.log_file(quick).read_text().endswith("it's on 1\n")
+    # The output of a failure tells its class
+    assert next(event for event in events if event.kind == "failed").output.endswith("\nCUDA out of memory")
+
+    assert wait_for_events(process_launcher, 2) == [
+        LaunchEvent(running, [2, 3], "started"),
+        LaunchEvent(running, [2, 3], "exited", 0),
+    ]
+    assert process_launcher.pending == 0
+
+
+def test_cancel_kills_the_process_group(process_launcher: ProcessLauncher) -> None:
+    """Test that a cancelled job which ignores SIGTERM is killed with its whole process group."""
+    job = Job("trap '' TERM; sleep 30 & wait")
+    process_launcher.launch(job, [0])
+    time.sleep(0.1)
+    (process,) = process_launcher._processes.values()
+
+    assert process_launcher.cancel(job.job_id)
+    assert not process_launcher.cancel(job.job_id)
+    assert wait_for_events(process_launcher, 1) == [LaunchEvent(job, [0], "cancelled")]
+    assert process.popen.wait(5.0) == -9
+    # The orphaned sleep is killed too, whether or not its new parent has collected it yet
+    time.sleep(0.1)
+    group = [stat for stat in Path("/proc").glob("[0-9]*/stat") if process_group(stat) == process.pid]
+    assert all(process_start_time(int(stat.parent.name)) is None for stat in group)
+
+
+def test_process_attach_after_restart(process_launcher: ProcessLauncher, tmp_path: Path) -> None:
+    """Test that jobs outlive their launcher and are followed by the next one with their exit status."""
+    job, done, lost = Job("sleep 0.5"), Job("sleep 0.1; exit 4"), Job("python train.py")
+    process_launcher.launch(job, [0])
+    process_launcher.launch(done, [2])
+    process_launcher.close()
+    # One job exits while no launcher follows it
+    time.sleep(0.3)
+
+    woken = threading.Event()
+    launcher = ProcessLauncher(on_event=woken.set, log_dir=tmp_path)
+    launcher.woken = woken
+    try:
+        launcher.attach(job, [0])
+        launcher.attach(done, [2])
+        launcher.attach(lost, [1])
+        events = wait_for_events(launcher, 3)
+        assert [(event.job, event.kind, event.returncode) for event in events] == [
+            (done, "exited", 4),
+            (lost, "exited", None),
+            (job, "exited", 0),
+        ]
+    finally:
+        launcher.close()
+    assert not list(tmp_path.glob("*.status"))
+
+
+def test_launchers_must_implement_the_interface() -> None:
+    """Test that a launcher missing part of the interface cannot be created, while `pid` and `close` are optional."""
+
+    class Incomplete(Launcher):
+        def launch(self, job: Job, gpus: list[int]) -> None:
+            pass
+
+        def poll(self) -> list[LaunchEvent]:
+            return []
+
+    with pytest.raises(TypeError, match=r"attach.*cancel"):
+        Incomplete()
+
+
+def test_rotate_log(tmp_path: Path) -> None:
+    """Test that a log is copied to its backups and truncated, so the job keeps appending to it."""
+    path = tmp_path / "job_1.log"
+    with open(path, "ab") as log:
+        for chunk in (b"first", b"second", b"third"):
+            log.write(chunk)
+            log.flush()
+            rotate_log(path, backups=2)
+        log.write(b"fourth")
+
+    assert [(tmp_path / name).read_bytes() for name in ("job_1.log", "job_1.log.1", "job_1.log.2")] == [
+        b"fourth",
+        b"third",
+        b"second",
+    ]
@@ -0,0 +1,83 @@
+import getpass
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.gpu import GPUManager, default_predicates
+from gpusitter.jobs import Job
+from gpusitter.ledger import GPULedger
+from gpusitter.scheduler import VirtualClock
+
+
+def test_reservations_are_not_free() -> None:
+    """Test that reserved GPUs are left out of the free GPUs until the job is released."""
+    ledger = GPULedger()
+    gpu_manager = GPUManager(backend=SimulatedBackend(num_gpus=4, clock=VirtualClock()), ledger=ledger)
+
+    job = Job("python train.py", 2)
+    ledger.reserve(job, [0, 1])
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [2, 3]
+
+    record = ledger.release(job.job_id, 0)
+    assert len(gpu_manager.get_free_gpus()) == 4
+    assert record.returncode == 0
+    assert record.ended_at >= record.started_at
+    assert list(ledger.history) == [record]
+    assert len(ledger) == 0
+
+
+def test_release_unknown_job() -> None:
+    """Test that releasing a job without reservation is a no-op."""
+    assert GPULedger().release(42, 1) is None
+
+
+def test_shared_gpus_count_reservations_and_caps() -> None:
+    """Test the room for memory-sized jobs from the actual free memory, the pending reservations and the caps."""
+    ledger = GPULedger()
+    backend = SimulatedBackend(num_gpus=3, memory_total=10000, clock=VirtualClock())
+    gpu_manager = GPUManager(backend=backend, ledger=ledger, max_jobs_per_gpu=2, max_memory_fraction=0.9)
+
+    allocated, pending = Job("allocated", required_memory=2000), Job("pending", required_memory=3000)
+    ledger.reserve(allocated, [0])
+    ledger.reserve(pending, [0])
+    backend.allocate("allocated", [0], 2000, user=getpass.getuser())
+    ledger.reserve(Job("train"), [1])
+    shares = gpu_manager.get_shared_gpus(gpu_manager.get_free_gpus())
+    assert list(shares) == [2]
+    assert shares[2].memory == 9000
+    assert shares[2].slots == 2
+
+    ledger.release(pending.job_id, 0)
+    shares = gpu_manager.get_shared_gpus(gpu_manager.get_free_gpus())
+    assert (shares[0].memory, shares[0].slots) == (7000, 1)
+    assert ledger.shared_reservations() == {0: [2000]}
+
+
+def test_shared_gpus_pass_the_other_predicates() -> None:
+    """Test that a GPU running our memory-sized jobs is only shared while it passes the predicates not on the memory."""
+    clock = VirtualClock()
+    ledger = GPULedger()
+    backend = SimulatedBackend(num_gpus=2, memory_total=10000, clock=clock)
+    gpu_manager = GPUManager(
+        backend=backend,
+        ledger=ledger,
+        stability_window=60,
+        clock=clock,
+        predicates=default_predicates(0.85, max_utilization=50, allow_foreign_processes=False),
+    )
+    gpu_manager.get_free_gpus()
+    clock.advance(60)
+
+    job = Job("small", required_memory=2000)
+    ledger.reserve(job, [0, 1])
+    backend.allocate("small", [0, 1], 2000, utilization=10, user=getpass.getuser())
+    assert list(gpu_manager.get_shared_gpus(gpu_manager.get_free_gpus())) == [0, 1]
+
+    backend.allocate("other", [0], 1000, utilization=10, user="alice")
+    backend.allocate("busy", [1], 0, utilization=90, user=getpass.getuser())
+    assert gpu_manager.get_shared_gpus(gpu_manager.get_free_gpus()) == {}
+
+    # Once the other jobs are gone, the GPUs have to pass the predicates for the stability window again
+    backend.release("other")
+    backend.release("busy")
+    assert gpu_manager.get_shared_gpus(gpu_manager.get_free_gpus()) == {}
+    clock.advance(60)
+    assert list(gpu_manager.get_shared_gpus(gpu_manager.get_free_gpus())) == [0, 1]
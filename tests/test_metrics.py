@@ -0,0 +1,145 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.emails import EmailManager, EmailNotifier
+from gpusitter.gpu import GPUManager
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.ledger import GPULedger
+from gpusitter.metrics import Counter, Gauge, Histogram, MetricsServer, Registry, SitterMetrics, TextfileExporter
+from gpusitter.retries import OTHER, RetryPolicy
+from gpusitter.scheduler import SchedulerLoop
+from gpusitter.sitter import GPUSitter
+from gpusitter.utils import DummyStatus
+
+
+class InstantLauncher(Launcher):
+    """Run every job instantly, failing the first start of commands containing `flaky`."""
+
+    def __init__(self) -> None:
+        """Initialize the launcher."""
+        self.events: list[LaunchEvent] = []
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Report the start and the exit of the job right away."""
+        if "flaky" in job.cmd and job.retry_count == 0:
+            self.events.append(LaunchEvent(job, gpus, "failed", 1))
+            return
+        self.events.append(LaunchEvent(job, gpus, "started", latency=0.02))
+        self.events.append(LaunchEvent(job, gpus, "exited", 0))
+
+    def poll(self) -> list[LaunchEvent]:
+        """Hand the events over."""
+        events, self.events = self.events, []
+        return events
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Let a job from before a restart exit right away."""
+        self.events.append(LaunchEvent(job, gpus, "exited", 0))
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel nothing, the jobs exit right away."""
+        return False
+
+
+def test_render() -> None:
+    """Test that the metrics are rendered in the Prometheus text format."""
+    registry = Registry()
+    counter = registry.register(Counter("jobs_total", "Jobs.", labels=("outcome",)))
+    registry.register(Gauge("queue_depth", "Pending jobs.", function=lambda: 3))
+    histogram = registry.register(Histogram("wait_seconds", "Waits.", buckets=(1, 10)))
+    counter.inc(outcome='say "hi"')
+    counter.inc(2, outcome="failed")
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+
+    assert registry.render() == (
+        "# HELP jobs_total Jobs.\n"
+        "# TYPE jobs_total counter\n"
+        'jobs_total{outcome="failed"} 2\n'
+        'jobs_total{outcome="say \\"hi\\""} 1\n'
+        "# HELP queue_depth Pending jobs.\n"
+        "# TYPE queue_depth gauge\n"
+        "queue_depth 3\n"
+        "# HELP wait_seconds Waits.\n"
+        "# TYPE wait_seconds histogram\n"
+        'wait_seconds_bucket{le="1"} 2\n'
+        'wait_seconds_bucket{le="10"} 3\n'
+        'wait_seconds_bucket{le="+Inf"} 4\n'
+        "wait_seconds_sum 56.5\n"
+        "wait_seconds_count 4\n"
+    )
+
+
+def test_sitter_metrics() -> None:
+    """Test that the sitter records waits, launches, polls, retries and idle GPUs."""
+    ledger = GPULedger()
+    gpu_manager = GPUManager(backend=SimulatedBackend(num_gpus=2), ledger=ledger)
+    loop = SchedulerLoop(JobQueue())
+    notifier = EmailNotifier(EmailManager("localhost:1", "user", "pwd", "sender", "receiver", use_ssl=False))
+    sitter = GPUSitter(
+        gpu_manager, ledger, loop, InstantLauncher(), notifier, retry_policy=RetryPolicy(delays={OTHER: (0.0, 0.0)})
+    )
+    try:
+        for cmd in ("python a.py", "python flaky.py", "python c.py"):
+            sitter.submit(Job(cmd))
+        assert sitter.metrics.queue_depth.function() == 3
+        sitter.run(DummyStatus())
+    finally:
+        sitter.close()
+
+    metrics = sitter.metrics
+    assert metrics.wait_time.count == 4
+    assert metrics.launch_latency.count == 3
+    assert metrics.poll_duration.count >= 2
+    assert metrics.jobs_started.get() == 3
+    assert metrics.jobs_finished.get(outcome="succeeded") == 3
+    assert metrics.retries.get() == 1
+    assert metrics.failures.get(reason="start") == 1
+    assert metrics.failures.get(reason="discarded") == 0
+    assert {key for key, _ in metrics.gpu_idle.function().items()} == {("0",), ("1",)}
+    assert 'gpusitter_launch_latency_seconds_bucket{le="0.025"} 3' in metrics.registry.render()
+
+
+def test_recording_is_cheap() -> None:
+    """Test that recording a placement takes microseconds, so metrics never slow the scheduling loop down."""
+    metrics = SitterMetrics()
+    job = Job("python train.py")
+    start = time.perf_counter()
+    for i in range(10000):
+        metrics.released([i % 8])
+        metrics.placed(job, [i % 8])
+        metrics.poll_duration.observe(0.001)
+    assert (time.perf_counter() - start) / 10000 < 50e-6
+
+
+def test_metrics_endpoint_and_textfile(tmp_path: Path) -> None:
+    """Test that the metrics are served over HTTP and written to a textfile."""
+    metrics = SitterMetrics()
+    metrics.retries.inc()
+
+    server = MetricsServer(metrics.registry, port=0)
+    server.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:  # noqa: S310
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "gpusitter_job_retries_total 1\n" in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/", timeout=5)  # noqa: S310
+    finally:
+        server.close()
+
+    exporter = TextfileExporter(metrics.registry, tmp_path / "gpusitter.prom", interval=0.05)
+    exporter.start()
+    threading.Event().wait(0.2)
+    metrics.retries.inc()
+    exporter.close()
+    assert "gpusitter_job_retries_total 2\n" in (tmp_path / "gpusitter.prom").read_text()
+    assert [path.name for path in tmp_path.iterdir()] == ["gpusitter.prom"]
@@ -0,0 +1,108 @@
+import random
+import time
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.emails import EmailManager, EmailNotifier
+from gpusitter.gpu import GPUManager
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.ledger import GPULedger
+from gpusitter.retries import COMMAND, NCCL, OOM, OTHER, RetryPolicy, classify
+from gpusitter.scheduler import SchedulerLoop
+from gpusitter.sitter import GPUSitter
+from gpusitter.utils import DummyStatus
+
+
+class ScriptedLauncher(Launcher):
+    """Fail every launch with the scripted output of its command until the script runs out, then succeed."""
+
+    def __init__(self, script: dict[str, list[tuple[int, str]]]) -> None:
+        """Initialize the launcher."""
+        self.script = script
+        self.events: list[LaunchEvent] = []
+        self.launches: list[tuple[str, list[int], float]] = []
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Report the next scripted failure of the command, or a success."""
+        self.launches.append((job.cmd, gpus, time.monotonic()))
+        failures = self.script.get(job.cmd)
+        if failures:
+            returncode, output = failures.pop(0)
+            self.events.append(LaunchEvent(job, gpus, "failed", returncode, output=output))
+            return
+        self.events.append(LaunchEvent(job, gpus, "started"))
+        self.events.append(LaunchEvent(job, gpus, "exited", 0))
+
+    def poll(self) -> list[LaunchEvent]:
+        """Hand the events over."""
+        events, self.events = self.events, []
+        return events
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Let a job from before a restart exit right away."""
+        self.events.append(LaunchEvent(job, gpus, "exited", 0))
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel nothing, the jobs exit right away."""
+        return False
+
+
+def test_classify() -> None:
+    """Test that failures are told apart by their exit status and their output."""
+    assert classify(127, "sh: 1: pyhton: not found") == COMMAND
+    assert classify(1, "python: can't open file 'tarin.py'") == COMMAND
+    assert classify(1, "torch.OutOfMemoryError: CUDA out of memory. Tried to allocate 2.00 GiB") == OOM
+    assert classify(1, "torch.distributed.DistBackendError: NCCL error in: ProcessGroupNCCL.cpp:1970") == NCCL
+    assert classify(1, "ValueError: nan loss") == OTHER
+    assert classify(137, None) == OTHER
+
+
+def test_backoff_grows_per_class_with_jitter() -> None:
+    """Test that the delays double up to their bound, are cut by at most the jitter and never retry commands."""
+    policy = RetryPolicy(delays={OOM: (10.0, 30.0)}, jitter=0.5, rng=random.Random(0))  # noqa: S311
+
+    for failures, full in ((1, 10.0), (2, 20.0), (3, 30.0), (4, 30.0)):
+        assert full / 2 <= policy.delay(OOM, failures) <= full
+    assert policy.delay(COMMAND, 1) is None
+
+
+def test_escalate() -> None:
+    """Test that jobs which ran out of memory ask for more memory, then whole GPUs, then more GPUs."""
+    policy = RetryPolicy(memory_factor=1.5)
+    job = Job("python train.py", required_memory=40000)
+
+    assert policy.escalate(job, num_gpus=4, max_memory=81920)
+    assert job.required_memory == 60000
+    assert policy.escalate(job, num_gpus=4, max_memory=81920)
+    assert (job.required_memory, job.required_gpus) == (None, 1)
+    assert policy.escalate(job, num_gpus=4, max_memory=81920)
+    assert policy.escalate(job, num_gpus=4, max_memory=81920)
+    assert job.required_gpus == 4
+    assert not policy.escalate(job, num_gpus=4, max_memory=81920)
+
+
+def test_sitter_backs_off_and_escalates() -> None:
+    """Test that a job which ran out of memory waits, then retries on twice the GPUs, and a typo is not retried."""
+    launcher = ScriptedLauncher(
+        {"python train.py": [(1, "CUDA out of memory")], "pyhton eval.py": [(127, "pyhton: command not found")]}
+    )
+    ledger = GPULedger()
+    gpu_manager = GPUManager(backend=SimulatedBackend(num_gpus=4), ledger=ledger)
+    loop = SchedulerLoop(JobQueue())
+    notifier = EmailNotifier(EmailManager("localhost:1", "user", "pwd", "sender", "receiver", use_ssl=False))
+    sitter = GPUSitter(
+        gpu_manager, ledger, loop, launcher, notifier, retry_policy=RetryPolicy(delays={OOM: (0.2, 0.2)}, jitter=0)
+    )
+    try:
+        sitter.submit(Job("python train.py"))
+        sitter.submit(Job("pyhton eval.py"))
+        sitter.run(DummyStatus())
+    finally:
+        sitter.close()
+
+    (_, first_gpus, first_at), (_, _, _), (_, retry_gpus, retry_at) = launcher.launches
+    assert (len(first_gpus), len(retry_gpus)) == (1, 2)
+    assert retry_at - first_at >= 0.2
+    assert sitter.metrics.failure_classes.get(kind=OOM) == 1
+    assert sitter.metrics.failure_classes.get(kind=COMMAND) == 1
+    assert sitter.metrics.failures.get(reason="discarded") == 1
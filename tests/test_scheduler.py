@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.scheduler import ExponentialBackoff, PollPolicy, SchedulerLoop, VirtualClock
+
+
+def test_exponential_backoff() -> None:
+    """Test that the interval grows while nothing changes and resets on a change."""
+    policy = ExponentialBackoff(base_interval=1.0, max_interval=8.0, factor=2.0)
+
+    intervals = [policy.next_interval(changed=False) for _ in range(6)]
+    assert intervals == [1.0, 2.0, 4.0, 8.0, 8.0, 8.0]
+    assert policy.next_interval(changed=True) == 1.0
+
+
+def test_exponential_backoff_rejects_bad_intervals() -> None:
+    """Test that an inconsistent backoff configuration is rejected."""
+    with pytest.raises(ValueError, match="base_interval"):
+        ExponentialBackoff(base_interval=10.0, max_interval=1.0)
+
+
+def test_poll_policies_must_implement_next_interval() -> None:
+    """Test that a poll policy without `next_interval` cannot be created, while `reset` is optional."""
+
+    class Incomplete(PollPolicy):
+        pass
+
+    class Fixed(PollPolicy):
+        def next_interval(self, changed: bool) -> float:
+            return 1.0
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()
+    policy = Fixed()
+    policy.reset()
+    assert policy.next_interval(changed=False) == 1.0
+
+
+def test_loop_sleeps_on_virtual_clock() -> None:
+    """Test that an idle loop backs off on the virtual clock."""
+    clock = VirtualClock()
+    loop = SchedulerLoop(JobQueue(), policy=ExponentialBackoff(1.0, 30.0), clock=clock)
+
+    for _ in range(10):
+        assert not loop.wait(changed=False)
+
+    # 1 + 2 + 4 + 8 + 16 + 30 * 5 seconds for ten idle polls instead of ten busy spins
+    assert clock.now() == 181.0
+
+
+def test_loop_wakes_on_submit() -> None:
+    """Test that submitting a job wakes the loop and restarts from the base interval."""
+    clock = VirtualClock()
+    jobs = JobQueue()
+    loop = SchedulerLoop(jobs, policy=ExponentialBackoff(1.0, 30.0), clock=clock)
+    loop.wait(changed=False)
+    loop.wait(changed=False)
+
+    job = Job("python train.py")
+    loop.submit(job)
+    assert loop.wait(changed=False)
+    assert clock.now() == 3.0
+    assert list(jobs) == [job]
+
+    assert not loop.wait(changed=False)
+    assert clock.now() == 4.0
+
+
+def test_loop_wakes_from_another_thread() -> None:
+    """Test that a wake-up from another thread interrupts a long sleep on the wall clock."""
+    loop = SchedulerLoop(JobQueue(), policy=ExponentialBackoff(60.0, 60.0))
+    threading.Timer(0.05, loop.wake).start()
+
+    start = time.monotonic()
+    assert loop.wait(changed=True)
+    assert time.monotonic() - start < 5.0
+
+
+def test_queue_backs_off_on_the_loop_clock() -> None:
+    """Test that the queue times the waits and the backoff of failed jobs on the clock of its loop."""
+    clock = VirtualClock(start=1000.0)
+    jobs = JobQueue()
+    SchedulerLoop(jobs, clock=clock)
+    job = Job("python train.py")
+    job.not_before = clock.now() + 30
+    jobs.put(job)
+
+    assert job.queued_at == 1000.0
+    assert jobs.next_ready_in() == 30
+    assert jobs.backing_off() == 1
+    assert jobs.schedule([0]) == []
+    clock.advance(30)
+    assert jobs.next_ready_in() is None
+    assert jobs.backing_off() == 0
+    assert jobs.schedule([0]) == [(job, [0])]
@@ -0,0 +1,253 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import pynvml
+import pytest
+from pytest_mock import MockerFixture
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.emails import EmailManager, EmailNotifier
+from gpusitter.gpu import GPUManager
+from gpusitter.jobfiles import JobStream
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.journal import Journal
+from gpusitter.launcher import Launcher, LaunchEvent
+from gpusitter.ledger import GPULedger
+from gpusitter.scheduler import SchedulerLoop, VirtualClock
+from gpusitter.sitter import GPUSitter
+from gpusitter.utils import NullStatus
+
+
+class OrderedLauncher(Launcher):
+    """Let every job exit right away, `false` with a failure, and remember the order of the launches."""
+
+    def __init__(self) -> None:
+        """Initialize the launcher."""
+        self.events: list[LaunchEvent] = []
+        self.launches: list[tuple[str, list[int]]] = []
+
+    def launch(self, job: Job, gpus: list[int]) -> None:
+        """Report the start and the exit of the job."""
+        self.launches.append((job.cmd, gpus))
+        self.events.append(LaunchEvent(job, gpus, "started"))
+        self.events.append(LaunchEvent(job, gpus, "exited", 1 if job.cmd == "false" else 0))
+
+    def poll(self) -> list[LaunchEvent]:
+        """Hand the events over."""
+        events, self.events = self.events, []
+        return events
+
+    def attach(self, job: Job, gpus: list[int]) -> None:
+        """Let a job from before a restart exit right away."""
+        self.events.append(LaunchEvent(job, gpus, "exited", 0))
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel nothing, the jobs exit right away."""
+        return False
+
+
+def make_sitter(launcher: Launcher, journal: Journal | None = None) -> GPUSitter:
+    """Make a sitter with 2 simulated GPUs."""
+    ledger = GPULedger()
+    return GPUSitter(
+        GPUManager(backend=SimulatedBackend(num_gpus=2), ledger=ledger),
+        ledger,
+        SchedulerLoop(JobQueue()),
+        launcher,
+        EmailNotifier(EmailManager(None, None, None, None, None)),
+        journal=journal,
+    )
+
+
+def test_pipeline_releases_stages_and_skips_after_failures() -> None:
+    """Test that each stage is queued once its upstream jobs succeeded, and failures skip everything downstream."""
+    launcher = OrderedLauncher()
+    sitter = make_sitter(launcher)
+    prep = Job("prep", 0)
+    train = Job("train", 2, after=[prep.job_id])
+    evaluate = Job("eval", 1, after=[train.job_id])
+    broken = Job("false", 0, max_retries=0)
+    report = Job("report", 1, after=[broken.job_id, prep.job_id])
+    summary = Job("summary", 0, after=[report.job_id])
+    try:
+        for job in (prep, train, evaluate, broken, report, summary):
+            sitter.submit(job)
+        assert [job.cmd for job in sitter.blocked] == ["train", "eval", "report", "summary"]
+        sitter.run(NullStatus())
+    finally:
+        sitter.close()
+
+    assert launcher.launches == [("prep", []), ("false", []), ("train", [0, 1]), ("eval", [0])]
+    assert sitter.metrics.jobs_finished.get(outcome="skipped") == 2
+    assert not sitter.blocked
+
+    # A job running after a job which failed already is skipped right away
+    late = Job("late", 1, after=[broken.job_id])
+    sitter.submit(late)
+    assert not sitter.blocked
+    assert sitter.jobs.empty()
+
+
+def test_dependencies_must_exist_and_cancelling_skips_downstream() -> None:
+    """Test that unknown dependencies are rejected, and cancelling a blocked job skips the jobs after it."""
+    sitter = make_sitter(OrderedLauncher())
+    train = Job("train", 2)
+    evaluate = Job("eval", 1, after=[train.job_id])
+    report = Job("report", 0, after=[evaluate.job_id])
+    try:
+        with pytest.raises(ValueError, match="does not exist"):
+            sitter.submit(Job("orphan", after=[train.job_id]))
+        # Jobs of one request may depend on the jobs before them
+        sitter.check_dependencies([train, evaluate, report])
+        for job in (train, evaluate, report):
+            sitter.submit(job)
+
+        assert [job["state"] for job in sitter.list_jobs()] == ["queued", "blocked", "blocked"]
+        assert sitter.cancel(evaluate.job_id) == "blocked"
+        assert [job["id"] for job in sitter.list_jobs()] == [train.job_id]
+        assert sitter.metrics.jobs_finished.get(outcome="skipped") == 1
+    finally:
+        sitter.close()
+
+
+def test_restore_keeps_jobs_blocked(tmp_path: Path) -> None:
+    """Test that a restart blocks jobs on their live upstream jobs only, the ended ones succeeded."""
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.load()
+    prep, train = Job("prep", 0), Job("train", 2)
+    evaluate = Job("eval", 1, after=[prep.job_id, train.job_id])
+    report = Job("report", 0, after=[prep.job_id])
+    for job in (prep, train, evaluate, report):
+        journal.submitted(job)
+    journal.ended(prep)
+    journal.close()
+
+    launcher = OrderedLauncher()
+    sitter = make_sitter(launcher, Journal(tmp_path / "journal.jsonl"))
+    try:
+        sitter.restore()
+        assert [(job.cmd, job.after) for job in sitter.blocked] == [("eval", [train.job_id])]
+        sitter.run(NullStatus())
+    finally:
+        sitter.close()
+    assert [cmd for cmd, _ in launcher.launches] == ["train", "report", "eval"]
+
+
+@pytest.mark.parametrize("prep_ended", [False, True])
+def test_restore_reads_job_streams_on(tmp_path: Path, prep_ended: bool) -> None:
+    """Test that a restart reads a job file on after the jobs journaled from it, which still run after their names."""
+    path = tmp_path / "jobs.txt"
+    path.write_text("python prep.py:0:name=prep\npython train.py --seed={0..3}:1:after=prep\n")
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.load()
+    sitter = make_sitter(OrderedLauncher(), journal)
+    sitter.max_pending = 3
+    sitter.submit_stream(JobStream.file(path))
+    assert sitter.feed() == 3
+    if prep_ended:
+        # The preparation succeeded before the restart
+        journal.ended(next(job for job in sitter.jobs if job.cmd == "python prep.py"))
+    sitter.close()
+
+    launcher = OrderedLauncher()
+    sitter = make_sitter(launcher, Journal(tmp_path / "journal.jsonl"))
+    try:
+        sitter.restore()
+        sitter.run(NullStatus())
+    finally:
+        sitter.close()
+    trains = [f"python train.py --seed={seed}" for seed in range(4)]
+    assert [cmd for cmd, _ in launcher.launches] == (trains if prep_ended else ["python prep.py", *trains])
+    assert not sitter.blocked
+
+
+def test_driver_reload_keeps_the_loop_running(fake_nvml: SimpleNamespace) -> None:
+    """Test that failed polls report no free GPUs, and NVML is re-initialized on every poll until it works again."""
+    failures = 6
+
+    def init() -> None:
+        nonlocal failures
+        if failures:
+            failures -= 1
+            raise pynvml.NVMLError(pynvml.NVML_ERROR_DRIVER_NOT_LOADED)
+
+    fake_nvml.init.side_effect = init
+    launcher = OrderedLauncher()
+    ledger = GPULedger()
+    gpu_manager = GPUManager(gpu_free_memory_ratio_threshold=0.5, ledger=ledger)
+    loop = SchedulerLoop(JobQueue(), clock=VirtualClock())
+    sitter = GPUSitter(gpu_manager, ledger, loop, launcher, EmailNotifier(EmailManager(None, None, None, None, None)))
+    try:
+        sitter.submit(Job("train", 2))
+        sitter.run(NullStatus())
+    finally:
+        sitter.close()
+
+    # Every failed poll initializes NVML twice, the second time for the stale handles
+    assert gpu_manager.poll_stats.failures == 3
+    assert loop.clock.now() > 0
+    assert launcher.launches == [("train", [0, 1])]
+
+
+def test_launcher_errors_do_not_use_up_retries() -> None:
+    """Test that a job the launcher failed to start is placed again without counting as a retry."""
+
+    class BrokenOnceLauncher(OrderedLauncher):
+        def launch(self, job: Job, gpus: list[int]) -> None:
+            if not self.launches:
+                self.launches.append(("error", gpus))
+                self.events.append(LaunchEvent(job, gpus, "error", output="no server running"))
+                return
+            super().launch(job, gpus)
+
+    launcher = BrokenOnceLauncher()
+    sitter = make_sitter(launcher)
+    sitter.loop.clock = VirtualClock()
+    job = Job("train", 1, max_retries=1)
+    try:
+        sitter.submit(job)
+        sitter.run(NullStatus())
+    finally:
+        sitter.close()
+
+    assert launcher.launches == [("error", [0]), ("train", [0])]
+    assert job.retry_count == 0
+    assert sitter.metrics.failures.get(reason="launcher") == 1
+
+
+def test_backoff_is_not_reported_as_no_fit(mocker: MockerFixture) -> None:
+    """Test that jobs waiting for their retry are logged as backing off rather than as not fitting."""
+    log = mocker.patch("gpusitter.sitter.console.log")
+    launcher = OrderedLauncher()
+    sitter = make_sitter(launcher)
+    sitter.loop.clock = sitter.jobs.clock = VirtualClock()
+    job = Job("train", 1)
+    job.not_before = 30.0
+    try:
+        sitter.submit(job)
+        sitter.run(NullStatus())
+    finally:
+        sitter.close()
+
+    messages = [call.args[0] for call in log.call_args_list]
+    assert any("1 jobs are backing off before their retry, the next one is due in 30s" in m for m in messages)
+    assert not any("No pending job fits" in m for m in messages)
+    assert launcher.launches == [("train", [0])]
+
+
+def test_decisions_are_timed_through_the_hook() -> None:
+    """Test that the sitter reports the CPU time of every scheduling decision to its hook."""
+    launcher = OrderedLauncher()
+    sitter = make_sitter(launcher)
+    decisions: list[float] = []
+    sitter.on_decision = decisions.append
+    try:
+        for cmd in ("prep", "train"):
+            sitter.submit(Job(cmd, 2))
+        sitter.run(NullStatus())
+    finally:
+        sitter.close()
+
+    assert len(decisions) >= 2
+    assert all(seconds >= 0 for seconds in decisions)
+    assert [cmd for cmd, _ in launcher.launches] == ["prep", "train"]
@@ -0,0 +1,41 @@
+from gpusitter.backends import SimulatedBackend
+from gpusitter.gpu import GPUManager
+from gpusitter.scheduler import VirtualClock
+
+
+def test_gpus_become_free_after_stability_window() -> None:
+    """Test that every GPU qualifies on its own once it has stayed free for the stability window."""
+    clock = VirtualClock()
+    backend = SimulatedBackend(num_gpus=3, memory_total=1000, clock=clock)
+    backend.allocate("other", [1], 900, duration=30)
+    gpu_manager = GPUManager(gpu_free_memory_ratio_threshold=0.85, backend=backend, stability_window=60, clock=clock)
+
+    assert gpu_manager.get_free_gpus() == []
+    assert gpu_manager.telemetry.next_stable_in() == 60
+
+    clock.advance(30)
+    assert gpu_manager.get_free_gpus() == []
+    assert gpu_manager.telemetry.next_stable_in() == 30
+
+    clock.advance(30)
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [0, 2]
+    assert gpu_manager.telemetry.next_stable_in() == 30
+
+    clock.advance(30)
+    assert [gpu["index"] for gpu in gpu_manager.get_free_gpus()] == [0, 1, 2]
+
+
+def test_busy_sample_restarts_stability_window() -> None:
+    """Test that a GPU which gets busy again has to wait for the whole window once more."""
+    clock = VirtualClock()
+    backend = SimulatedBackend(num_gpus=1, memory_total=1000, clock=clock)
+    gpu_manager = GPUManager(gpu_free_memory_ratio_threshold=0.85, backend=backend, stability_window=10, clock=clock)
+
+    gpu_manager.get_all_gpus()
+    clock.advance(5)
+    backend.allocate("other", [0], 500, duration=1)
+    gpu_manager.get_all_gpus()
+    clock.advance(5)
+    assert gpu_manager.get_free_gpus() == []
+    clock.advance(10)
+    assert len(gpu_manager.get_free_gpus()) == 1
@@ -0,0 +1,74 @@
+import pytest
+
+from gpusitter.backends import SimulatedBackend
+from gpusitter.gpu import GPUManager
+from gpusitter.jobs import Job, JobQueue
+from gpusitter.topology import CROSS_SOCKET, NUMA_NODE, NVLINK, PCIE_SWITCH, Topology
+
+
+def dual_socket(num_gpus: int = 8) -> list[list[int]]:
+    """Build a synthetic dual-socket topology with NVLink pairs and one PCIe switch per four GPUs."""
+    half = num_gpus // 2
+
+    def cost(a: int, b: int) -> int:
+        if a == b:
+            return 0
+        if a // 2 == b // 2:
+            return NVLINK
+        if a // half != b // half:
+            return CROSS_SOCKET
+        return PCIE_SWITCH if a // 4 == b // 4 else NUMA_NODE
+
+    return [[cost(a, b) for b in range(num_gpus)] for a in range(num_gpus)]
+
+
+def test_best_subset_stays_on_one_socket() -> None:
+    """Test that a 4-GPU job is not split across sockets when one socket has enough free GPUs."""
+    topology = Topology(dual_socket())
+
+    assert topology.best_subset([0, 1, 2, 4, 5, 6, 7], 4) == [4, 5, 6, 7]
+    assert topology.best_subset([0, 2, 3, 5], 2) == [2, 3]
+    assert topology.best_subset([3, 1, 2], 1) == [3]
+
+
+def test_greedy_search_on_large_hosts() -> None:
+    """Test that the greedy search finds the NVLink-connected group when the exhaustive search is too large."""
+    topology = Topology(dual_socket(16), max_combinations=1)
+
+    assert topology.best_subset([0, 2, 4, 6, 8, 9, 10, 11, 12], 4) == [8, 9, 10, 11]
+
+
+def test_topology_must_be_square() -> None:
+    """Test that a malformed matrix is rejected."""
+    with pytest.raises(ValueError, match="square"):
+        Topology([[0, 1], [1]])
+
+
+def test_schedule_uses_topology() -> None:
+    """Test that the queue assigns the best-connected GPUs and keeps the rest for the following jobs."""
+    gpu_manager = GPUManager(backend=SimulatedBackend(num_gpus=8, topology=dual_socket()))
+    jobs = JobQueue()
+    jobs.put(Job("python train.py", required_gpus=2))
+    jobs.put(Job("python eval.py", required_gpus=1))
+
+    placements = jobs.schedule([1, 3, 4, 5], topology=gpu_manager.topology)
+    assert [assigned for _, assigned in placements] == [[4, 5], [1]]
+
+
+def test_topology_falls_back_when_unreadable() -> None:
+    """Test that an unreadable topology is cached as None, and that scheduling then assigns GPUs in order."""
+
+    class BrokenBackend(SimulatedBackend):
+        def topology(self) -> list[list[int]] | None:
+            self.reads = getattr(self, "reads", 0) + 1
+            raise RuntimeError("no topology")
+
+    backend = BrokenBackend(num_gpus=4)
+    gpu_manager = GPUManager(backend=backend)
+    assert gpu_manager.topology is None
+    assert gpu_manager.topology is None
+    assert backend.reads == 1
+
+    jobs = JobQueue()
+    jobs.put(Job("python train.py", required_gpus=2))
+    assert jobs.schedule([3, 1, 2], topology=gpu_manager.topology)[0][1] == [3, 1]